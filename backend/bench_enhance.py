@@ -0,0 +1,112 @@
+# bench_enhance.py
+"""
+Benchmark: fused NumPy enhancement (enhance.py) vs the ImageEnhance chain.
+
+    python bench_enhance.py [megapixels] [repeat]
+
+Runs the two enhancement steps of the OCR pipeline (clean_for_ocr and
+make_high_contrast at the same size) on a synthetic photo, checks the
+engines agree, and reports CPU time and peak memory. Each engine is measured
+in its own child process so the peak RSS numbers don't mix.
+"""
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from PIL import Image
+
+import imaging
+
+
+def make_photo(megapixels: float) -> Image.Image:
+    w = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    h = int(w * 3 / 4)
+    # smooth gradients plus sensor-like noise
+    small = Image.effect_noise((w // 40, h // 40), 80).convert("RGB")
+    img = small.resize((w, h), Image.BICUBIC)
+    noise = Image.effect_noise((w, h), 12).convert("RGB")
+    return Image.blend(img, noise, 0.15)
+
+
+def run_steps(img: Image.Image):
+    clean = imaging.clean_for_ocr(img)
+    hc = imaging.make_high_contrast(clean, size=clean.size)
+    return clean, hc
+
+
+def _rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def reset_peak_rss() -> int:
+    """Reset the peak RSS counter (Linux); returns the baseline to subtract."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _rss_kb("VmRSS")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss_kb() -> int:
+    return _rss_kb("VmHWM") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(engine: str, megapixels: float, repeat: int) -> None:
+    imaging.ENHANCE_ENGINE = engine
+    img = make_photo(megapixels)
+    base_rss = reset_peak_rss()
+    best_cpu = best_wall = float("inf")
+    for _ in range(repeat):
+        c0, t0 = time.process_time(), time.perf_counter()
+        run_steps(img)
+        best_cpu = min(best_cpu, time.process_time() - c0)
+        best_wall = min(best_wall, time.perf_counter() - t0)
+    peak = peak_rss_kb() - base_rss
+    print(json.dumps({"cpu": best_cpu, "wall": best_wall, "peak_kb": peak, "size": img.size}))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], float(sys.argv[3]), int(sys.argv[4]))
+        return
+
+    megapixels = float(sys.argv[1]) if len(sys.argv) > 1 else 12
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    if not imaging.enhance.available:
+        raise SystemExit("numpy is not installed; nothing to compare")
+
+    # agreement on a smaller image
+    import numpy as np
+
+    img = make_photo(1)
+    imaging.ENHANCE_ENGINE = "pillow"
+    ref = run_steps(img)
+    imaging.ENHANCE_ENGINE = "numpy"
+    got = run_steps(img)
+    for name, a, b in zip(("clean", "high-contrast"), ref, got):
+        d = np.abs(np.asarray(a, dtype=np.int16) - np.asarray(b, dtype=np.int16))
+        print(f"{name:14s} max diff {d.max()}  differing pixels {(d > 0).mean():.4%}")
+
+    results = {}
+    for engine in ("pillow", "numpy"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", engine, str(megapixels), str(repeat)],
+            check=True, capture_output=True, text=True,
+        )
+        results[engine] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    w, h = results["pillow"]["size"]
+    print(f"{w}x{h} ({w * h / 1e6:.1f} MP), best of {repeat}")
+    for engine, r in results.items():
+        print(f"  {engine:6s}: cpu {r['cpu'] * 1000:7.1f} ms  wall {r['wall'] * 1000:7.1f} ms  peak +{r['peak_kb'] / 1024:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# bench_parser.py
+"""
+Micro-benchmark: rule-table nameplate parser vs the old if-chain.
+
+    python bench_parser.py [--images 20000] [--repeat 5] [--seed 7]
+
+Builds a synthetic OCR dump (plate lines, casting marks and noise, with the
+repeats that several OCR passes per image produce), checks that both parsers
+agree on every image, then times the full per-image work of the pipeline:
+split plate / casting lines and extract the fields.
+"""
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+from nameplate_parser import NameplateParser, normalize_lines
+
+
+# ---------- the old implementation (main.py before the rule table) ----------
+def legacy_looks_like_casting(line: str) -> bool:
+    s = line.strip()
+    if not s:
+        return False
+    up = s.upper()
+    plate_starters = ("SN", "S/N", "MODEL", "DN", "PN", "PT", "BODY", "DISC", "SEAT", "DATE", "WWW.")
+    if up.startswith(plate_starters):
+        return False
+    if " " not in up and 2 <= len(up) <= 8:
+        return True
+    return False
+
+
+def legacy_extract_fields(lines: List[str]) -> dict:
+    data = dict.fromkeys(("serial_number", "model", "dn", "pn", "pt", "body", "disc", "seat", "temp", "date"))
+    for ln in lines:
+        up = ln.upper().strip()
+        if data["serial_number"] is None and ("SN " in up or up.startswith("SN") or "S/N" in up):
+            data["serial_number"] = ln
+            continue
+        if data["model"] is None and up.startswith("MODEL"):
+            parts = ln.split(None, 1)
+            data["model"] = parts[1] if len(parts) > 1 else ln
+            continue
+        if data["dn"] is None and (up.startswith("DN")):
+            data["dn"] = ln
+            continue
+        if data["pn"] is None and (up.startswith("PN")):
+            data["pn"] = ln
+            continue
+        if data["pt"] is None and (up.startswith("PT")):
+            data["pt"] = ln
+            continue
+        if data["body"] is None and "BODY" in up:
+            data["body"] = ln
+            continue
+        if data["disc"] is None and "DISC" in up:
+            data["disc"] = ln
+            continue
+        if data["seat"] is None and "SEAT" in up:
+            data["seat"] = ln
+            continue
+        if data["temp"] is None and ("T(" in up or "°C" in up or up.startswith("T°")):
+            if any(c.isdigit() for c in ln):
+                data["temp"] = ln
+            continue
+        if data["date"] is None and up.startswith("DATE"):
+            data["date"] = ln.replace("DATE", "", 1).replace("Date", "", 1).replace("date", "", 1).strip()
+            continue
+    return data
+
+
+def legacy_parse(lines: List[str]) -> Tuple[dict, List[str], List[str]]:
+    casting = [ln for ln in lines if legacy_looks_like_casting(ln)]
+    plate = [ln for ln in lines if not legacy_looks_like_casting(ln)]
+    return legacy_extract_fields(plate), plate, casting
+
+
+def new_parse(parser: NameplateParser, lines: List[str]) -> Tuple[dict, List[str], List[str]]:
+    plate, casting = parser.split_lines(lines)
+    return parser.extract_fields(plate), plate, casting
+
+
+# ---------- synthetic OCR text ----------
+PLATE = [
+    "SN 2231-{n}", "S/N: A{n}", "MODEL TTV-{n}", "Model BV{n}", "DN 50", "DN{n}", "PN 16", "PN40",
+    "PT 24 BAR", "BODY: CF8M", "Body WCB", "DISC CF8M", "SEAT PTFE", "Seat: RPTFE", "T(°C) -29/{n}",
+    "T°C 120", "T(C) max", "DATE 2023-0{d}", "Date: 0{d}/2022", "www.valves.example", "MADE IN ITALY",
+    "Pressure test {n} bar", "SEAT(RPTFE) 180", "FLOW ->",
+]
+CASTING = ["CF8M", "WCB", "DN{n}", "TTV", "A216", "HEAT{d}", "PN16", "SN{d}", "150#"]
+NOISE = ["@@##$$%%", "x" * 45, "|||///", "~~ ~~ ~~"]
+
+
+def make_image(rng: random.Random) -> List[str]:
+    lines = []
+    for _ in range(rng.randint(8, 30)):
+        pool = rng.choices((PLATE, CASTING, NOISE), weights=(6, 3, 1))[0]
+        lines.append(rng.choice(pool).format(n=rng.randint(1, 999), d=rng.randint(1, 9)))
+    passes = rng.randint(1, 4)
+    # later passes re-read mostly the same lines
+    text = "\n".join("\n".join(ln for ln in lines if rng.random() < 0.9) for _ in range(passes))
+    return normalize_lines(text)
+
+
+def timed(fn, images, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for lines in images:
+            fn(lines)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--images", type=int, default=20000, help="synthetic OCR dumps to parse")
+    ap.add_argument("--repeat", type=int, default=5, help="timed rounds (the best one is reported)")
+    ap.add_argument("--seed", type=int, default=7)
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    n_images, repeat = args.images, args.repeat
+    rng = random.Random(args.seed)
+    images = [make_image(rng) for _ in range(n_images)]
+    total_lines = sum(len(x) for x in images)
+
+    parser = NameplateParser()
+    for lines in images:
+        if legacy_parse(lines) != new_parse(parser, lines):
+            raise SystemExit(f"parsers disagree on: {lines}")
+
+    old = timed(legacy_parse, images, repeat)
+    warm = timed(lambda lines: new_parse(parser, lines), images, repeat)
+
+    # same work starting from an empty line cache each round
+    cold = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fresh = NameplateParser()
+        for lines in images:
+            new_parse(fresh, lines)
+        cold = min(cold, time.perf_counter() - t0)
+
+    print(f"{n_images} images, {total_lines} lines, best of {repeat}")
+    print(f"  if-chain              : {old * 1000:8.1f} ms  ({old / total_lines * 1e6:.2f} us/line)")
+    print(f"  rule table, cold cache: {cold * 1000:8.1f} ms  ({cold / total_lines * 1e6:.2f} us/line)  x{old / cold:.2f}")
+    print(f"  rule table, warm cache: {warm * 1000:8.1f} ms  ({warm / total_lines * 1e6:.2f} us/line)  x{old / warm:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# bench_pipeline.py
+"""
+End-to-end benchmark of /ocr-bulk with no network: Google Vision is replaced
+by fake_vision (in-process fake, or the stub server over the real client's
+REST transport) and Supabase by an httpx.MockTransport.
+
+    python bench_pipeline.py [--batches 20] [--images 9] [--concurrency 2]
+                             [--megapixels 2] [--vision-latency 0.15]
+                             [--vision-max-inflight 0] [--vision-error-rate 0]
+                             [--stub-server] [--stream] [--json]
+
+Every batch gets freshly generated nameplate photos (so the OCR cache
+doesn't hide the work) and is timed from the upload request until the job
+is finished. Reports throughput, p50/p99 batch latency, peak RSS of this
+process and the per-stage time from metrics.py. With OCR_CPU_WORKERS > 0 the
+image work runs in child processes, whose memory is not included.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from bench_enhance import peak_rss_kb, reset_peak_rss
+from fake_vision import CANNED_TEXTS, FakeVisionClient, StubVisionServer
+
+
+def make_nameplate(text: str, megapixels: float, rng: random.Random) -> bytes:
+    """A JPEG 'photo' of a nameplate: noisy metal background, engraved-looking text."""
+    w = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    h = int(w * 3 / 4)
+    shade = rng.randint(120, 190)
+    img = Image.blend(
+        Image.new("RGB", (w, h), (shade, shade, shade + 8)),
+        Image.effect_noise((w, h), 40).convert("RGB"),
+        0.25,
+    )
+    draw = ImageDraw.Draw(img)
+    lines = text.splitlines()
+    size = max(12, h // (len(lines) + 4))
+    font = ImageFont.load_default(size=size)
+    x, y = w // 10, size
+    for line in lines:
+        draw.text((x + rng.randint(-3, 3), y), line, fill=(30, 30, 35), font=font)
+        y += int(size * 1.1)
+    img = img.rotate(rng.uniform(-4, 4), resample=Image.BICUBIC, fillcolor=(shade, shade, shade))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=88)
+    return buf.getvalue()
+
+
+def make_batch(n: int, megapixels: float, rng: random.Random) -> List[Tuple[str, bytes]]:
+    batch = []
+    for i in range(n):
+        text = rng.choice(CANNED_TEXTS).replace("SN ", f"SN {rng.randint(0, 9999):04d}-", 1)
+        batch.append((f"plate_{i}.jpg", make_nameplate(text, megapixels, rng)))
+    return batch
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--batches", type=int, default=20)
+    ap.add_argument("--images", type=int, default=9, help="images per batch (3 per product)")
+    ap.add_argument("--concurrency", type=int, default=2, help="batches uploaded at the same time")
+    ap.add_argument("--megapixels", type=float, default=2.0)
+    ap.add_argument("--vision-latency", type=float, default=0.15, help="seconds per Vision call")
+    ap.add_argument("--vision-per-image", type=float, default=0.01, help="extra seconds per image in a call")
+    ap.add_argument("--vision-max-inflight", type=int, default=0, help="fake quota: concurrent calls before RESOURCE_EXHAUSTED (0: none)")
+    ap.add_argument("--vision-error-rate", type=float, default=0.0, help="share of Vision calls failing with UNAVAILABLE")
+    ap.add_argument("--supabase-latency", type=float, default=0.03, help="seconds per PostgREST request")
+    ap.add_argument("--stub-server", action="store_true", help="use the HTTP stub server instead of the in-process fake")
+    ap.add_argument("--stream", action="store_true", help="upload through /ocr-bulk/stream")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    return ap.parse_args()
+
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+
+    server = None
+    if args.stub_server:
+        server = StubVisionServer(
+            latency=args.vision_latency, per_image=args.vision_per_image,
+            error_rate=args.vision_error_rate, seed=args.seed, max_inflight=args.vision_max_inflight,
+        ).start()
+        os.environ["VISION_API_ENDPOINT"] = server.url
+        fake = server.fake
+    os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+    os.environ.setdefault("ROLE_KEY", "bench-key")
+
+    # main prints its config on import; keep stdout clean for --json
+    with contextlib.redirect_stdout(sys.stderr):
+        import main as app
+    import metrics
+    from job_store import FINISHED
+
+    if not args.stub_server:
+        fake = FakeVisionClient(
+            latency=args.vision_latency, per_image=args.vision_per_image,
+            error_rate=args.vision_error_rate, seed=args.seed, max_inflight=args.vision_max_inflight,
+        )
+        app.vision_clients.set_factory(lambda: fake)
+
+    async def postgrest(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(args.supabase_latency)
+        rows = json.loads(request.content)
+        return httpx.Response(201, json=[dict(row, id=i) for i, row in enumerate(rows)])
+
+    app.supabase_writer.transport = httpx.MockTransport(postgrest)
+
+    rng = random.Random(args.seed)
+    t0 = time.perf_counter()
+    batches = [make_batch(args.images, args.megapixels, rng) for _ in range(args.batches)]
+    gen_seconds = time.perf_counter() - t0
+
+    async def wait_done(batch_id: str) -> Dict[str, Any]:
+        wake = app.job_events.subscribe(batch_id)
+        try:
+            while True:
+                wake.clear()
+                job = app.job_store.get(batch_id, include_results=False)
+                if job["status"] in FINISHED:
+                    return job
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            app.job_events.unsubscribe(batch_id, wake)
+
+    latencies: List[float] = []
+    failed_groups = 0
+    slots = asyncio.Semaphore(args.concurrency)
+    url = "/ocr-bulk/stream" if args.stream else "/ocr-bulk"
+
+    async def one(client: httpx.AsyncClient, batch: List[Tuple[str, bytes]]) -> None:
+        nonlocal failed_groups
+        async with slots:
+            start = time.perf_counter()
+            r = await client.post(url, files=[("files", (name, data, "image/jpeg")) for name, data in batch])
+            r.raise_for_status()
+            job = await wait_done(r.json()["batch_id"])
+            latencies.append(time.perf_counter() - start)
+            failed_groups += job["progress"]["failed"]
+
+    # warm up imports, pools and the client outside the measurement
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://bench", timeout=None) as client:
+        await one(client, make_batch(3, args.megapixels, rng))
+        latencies.clear()
+
+        before = metrics.stage_seconds.totals()
+        calls_before, images_before, throttled_before = fake.calls, fake.images, fake.throttled
+        control_before = app.vision_controller.stats()
+        base_rss = reset_peak_rss()
+        cpu0, t0 = time.process_time(), time.perf_counter()
+        await asyncio.gather(*(one(client, batch) for batch in batches))
+        wall = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+        peak_kb = peak_rss_kb() - base_rss
+
+    await app.supabase_writer.aclose()
+    app.pipeline_executor.shutdown()
+    if server is not None:
+        server.stop()
+
+    control = app.vision_controller.stats()
+    stages = {}
+    for key, (count, total) in sorted(metrics.stage_seconds.totals().items()):
+        c0, s0 = before.get(key, (0, 0.0))
+        if count > c0:
+            stages[key[0]] = {"count": count - c0, "seconds": total - s0, "mean_ms": (total - s0) / (count - c0) * 1000}
+
+    images = args.batches * args.images
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "generate_seconds": gen_seconds,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "images_per_second": images / wall,
+        "batch_latency": {"p50": percentile(latencies, 50), "p99": percentile(latencies, 99), "max": max(latencies)},
+        "failed_groups": failed_groups,
+        "peak_rss_mb": peak_kb / 1024,
+        "vision": {"calls": fake.calls - calls_before, "images": fake.images - images_before, "throttled": fake.throttled - throttled_before},
+        "vision_control": {
+            "limit": control["limit"],
+            **{k: control[k] - control_before[k] for k in ("retries", "failures", "decreases", "budget_waits")},
+        },
+        "stages": stages,
+    }
+
+
+def report(r: Dict[str, Any]) -> None:
+    c = r["config"]
+    backend = "stub server" if c["stub_server"] else "in-process fake"
+    print(
+        f"{c['batches']} batches x {c['images']} images ({c['megapixels']} MP), concurrency {c['concurrency']}, "
+        f"{'stream' if c['stream'] else 'bulk'} upload, Vision {backend} {c['vision_latency'] * 1000:.0f} ms/call"
+    )
+    lat = r["batch_latency"]
+    print(f"  throughput  {r['images_per_second']:7.2f} images/s   wall {r['wall_seconds']:.2f} s   cpu {r['cpu_seconds']:.2f} s")
+    print(f"  batch p50   {lat['p50'] * 1000:7.0f} ms   p99 {lat['p99'] * 1000:.0f} ms   max {lat['max'] * 1000:.0f} ms")
+    print(f"  peak RSS   +{r['peak_rss_mb']:6.1f} MB   Vision calls {r['vision']['calls']} ({r['vision']['images']} images)   failed groups {r['failed_groups']}")
+    vc = r["vision_control"]
+    print(
+        f"  Vision limit {vc['limit']:.1f}   throttled calls {r['vision']['throttled']}   retries {vc['retries']}"
+        f"   limit decreases {vc['decreases']}   budget waits {vc['budget_waits']}"
+    )
+    print("  stage                        count    total s    mean ms")
+    for stage, s in sorted(r["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"    {stage:26s} {s['count']:7d} {s['seconds']:10.3f} {s['mean_ms']:10.2f}")
+
+
+def main():
+    args = parse_args()
+    result = asyncio.run(run(args))
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# backend/enhance.py
+"""
+Fused NumPy version of the ImageEnhance chains in imaging.py.
+
+Grayscale, contrast stretch, unsharp mask and invert run in one pass over
+the image, a strip of rows at a time, through small float32 work buffers
+that are reused from strip to strip; the only full-size allocation is the
+result. Each step reproduces its Pillow counterpart's integer rounding
+(convert("L") luma, Image.blend truncation, SMOOTH kernel with untouched
+borders, ImageOps.invert), so the output matches the Pillow chain.
+
+NumPy is optional: without it `available` is False and imaging.py keeps the
+Pillow chain.
+"""
+from typing import Optional
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+available = np is not None
+
+# target size of one float32 work buffer; small enough to stay in cache
+STRIP_BYTES = 512 * 1024
+
+# ITU-R 601-2 luma in Pillow's fixed point: L = (R*19595 + G*38470 + B*7471 + 0x8000) >> 16
+# (exact in float32: the largest sum is below 2**24)
+_LUMA = (19595.0, 38470.0, 7471.0)
+
+
+def _gray_mean(img: Image.Image) -> int:
+    """Mean grey level, as ImageEnhance.Contrast computes it (from the L histogram)."""
+    hist = (img if img.mode == "L" else img.convert("L")).histogram()
+    total = sum(hist) or 1
+    return int(sum(i * n for i, n in enumerate(hist)) / total + 0.5)
+
+
+def enhance(
+    img: Image.Image,
+    contrast: float = 1.0,
+    sharpness: float = 1.0,
+    grayscale: bool = False,
+    invert: bool = False,
+    strip_rows: Optional[int] = None,
+) -> Image.Image:
+    """
+    Equivalent of
+        img.convert("L")            (grayscale=True)
+        ImageEnhance.Contrast(...).enhance(contrast)
+        ImageEnhance.Sharpness(...).enhance(sharpness)
+        ImageOps.invert(...)        (invert=True)
+    for "RGB" / "L" images, without full-size intermediates.
+    """
+    if np is None:
+        raise RuntimeError("numpy is not installed")
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    w, h = img.size
+    mean = _gray_mean(img)
+    to_gray = grayscale and img.mode == "RGB"
+    sharpen = sharpness != 1.0 and h >= 3 and w >= 3
+
+    out_mode = "L" if (to_gray or img.mode == "L") else "RGB"
+    out = Image.new(out_mode, (w, h))
+
+    bands = 1 if out_mode == "L" else 3
+    rows = max(1, strip_rows or STRIP_BYTES // (w * bands * 4))
+    buf_shape = (min(h, rows + 2), w) + ((bands,) if bands > 1 else ())
+    a_buf = np.empty(buf_shape, np.float32)  # the strip, with one halo row above and below
+    t_buf = np.empty(buf_shape, np.float32)  # scratch: vertical sums, then the blend
+    s_buf = np.empty(buf_shape, np.float32)  # the smoothed strip
+    o_buf = np.empty(buf_shape, np.uint8)    # finished rows, pasted into `out`
+
+    for r0 in range(0, h, rows):
+        r1 = min(h, r0 + rows)
+        a0, a1 = max(0, r0 - 1), min(h, r1 + 1)
+        n = a1 - a0
+        a = a_buf[:n]
+        # only this strip is ever copied out of the source image
+        src = np.asarray(img.crop((0, a0, w, a1)))
+
+        # 1) grayscale (same integer maths as convert("L")) or a plain copy
+        if to_gray:
+            t = t_buf[:n]
+            np.multiply(src[:, :, 0], _LUMA[0], out=a, dtype=np.float32)
+            np.multiply(src[:, :, 1], _LUMA[1], out=t, dtype=np.float32)
+            a += t
+            np.multiply(src[:, :, 2], _LUMA[2], out=t, dtype=np.float32)
+            a += t
+            a += 32768.0
+            a /= 65536.0
+            np.floor(a, out=a)
+        else:
+            a[...] = src
+
+        # 2) contrast: blend towards the mean grey, truncated to uint8 like Image.blend
+        if contrast != 1.0:
+            a -= mean
+            a *= contrast
+            a += mean
+            np.clip(a, 0, 255, out=a)
+            np.floor(a, out=a)
+
+        # rows r0..r1 as they are now; the sharpened interior is written over them below
+        o = o_buf[:r1 - r0]
+        np.copyto(o, a[r0 - a0:r1 - a0], casting="unsafe")
+
+        # 3) sharpness: blend away from the 3x3 SMOOTH filter (1 1 1 / 1 5 1 / 1 1 1),
+        #    image borders are left as they are, like ImageFilter does
+        if sharpen and n >= 3:
+            v = t_buf[:n - 2]
+            np.add(a[:-2], a[1:-1], out=v)
+            v += a[2:]
+            s = s_buf[:n - 2, :w - 2]
+            np.add(v[:, :-2], v[:, 1:-1], out=s)
+            s += v[:, 2:]
+            centre = a[1:-1, 1:-1]
+            blend = v[:, 1:-1]  # the vertical sums are no longer needed
+            np.multiply(centre, 4.0, out=blend)
+            s += blend
+            s /= 13.0
+            s += 0.5
+            np.floor(s, out=s)
+
+            np.subtract(centre, s, out=blend)
+            blend *= sharpness
+            blend += s
+            np.clip(blend, 0, 255, out=blend)
+            np.floor(blend, out=blend)
+            # buffer rows 1..n-2 are image rows a0+1..a1-2, i.e. exactly this strip's interior
+            np.copyto(o[a0 + 1 - r0:a1 - 1 - r0, 1:w - 1], blend, casting="unsafe")
+
+        # 4) invert
+        if invert:
+            np.subtract(255, o, out=o)
+
+        out.paste(Image.fromarray(o, out_mode), (0, r0))
+
+    return out
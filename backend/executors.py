@@ -0,0 +1,133 @@
+# backend/executors.py
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("ndt-image")
+
+
+class PipelineExecutor:
+    """
+    Execution layer for the blocking parts of the OCR pipeline.
+
+    - run_io:  network-bound calls (Vision RPCs) on a thread pool
+    - run_cpu: CPU-bound Pillow work on a process pool
+
+    Each kind has its own in-flight cap so a large batch cannot queue
+    unbounded work behind the pools. With cpu_workers=0 the CPU work runs on
+    the thread pool instead (small hosts where extra processes don't pay off).
+    """
+
+    def __init__(
+        self,
+        io_workers: int = 8,
+        cpu_workers: int = 2,
+        max_inflight_io: Optional[int] = None,
+        max_inflight_cpu: Optional[int] = None,
+        mp_start_method: str = "spawn",
+    ):
+        self.io_workers = max(1, io_workers)
+        self.cpu_workers = max(0, cpu_workers)
+        self.max_inflight_io = max_inflight_io or self.io_workers
+        self.max_inflight_cpu = max_inflight_cpu or max(1, self.cpu_workers)
+        self.mp_start_method = mp_start_method
+
+        self._io_pool: Optional[ThreadPoolExecutor] = None
+        self._cpu_pool: Optional[ProcessPoolExecutor] = None
+        self._io_sem: Optional[asyncio.Semaphore] = None
+        self._cpu_sem: Optional[asyncio.Semaphore] = None
+        self.inflight_io = 0
+        self.inflight_cpu = 0
+
+    # pools and semaphores are created lazily (first use happens on the event loop)
+    def _io(self) -> ThreadPoolExecutor:
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="ocr-io")
+        return self._io_pool
+
+    def _cpu(self):
+        if self.cpu_workers == 0:
+            return self._io()
+        if self._cpu_pool is None:
+            # spawn, not fork: the parent holds gRPC channels and threads
+            ctx = multiprocessing.get_context(self.mp_start_method)
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=ctx)
+        return self._cpu_pool
+
+    async def run_io(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self._io_sem is None:
+            self._io_sem = asyncio.Semaphore(self.max_inflight_io)
+        async with self._io_sem:
+            self.inflight_io += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._io(), partial(fn, *args, **kwargs))
+            finally:
+                self.inflight_io -= 1
+
+    async def run_cpu(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self._cpu_sem is None:
+            self._cpu_sem = asyncio.Semaphore(self.max_inflight_cpu)
+        async with self._cpu_sem:
+            self.inflight_cpu += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._cpu(), partial(fn, *args, **kwargs))
+            except BrokenProcessPool:
+                # a worker died (e.g. OOM on a huge image); start a fresh pool next time
+                logger.error("CPU process pool broke; it will be recreated")
+                self._cpu_pool = None
+                raise
+            finally:
+                self.inflight_cpu -= 1
+
+    async def warmup(self, *modules: str) -> dict:
+        """Start the CPU workers and import `modules` in each (spawned workers start empty)."""
+        n = max(1, self.cpu_workers)
+        await asyncio.gather(*(self.run_cpu(_import_modules, modules) for _ in range(n)))
+        return {"cpu_workers": self.cpu_workers, "modules": list(modules)}
+
+    def stats(self) -> dict:
+        return {
+            "io_workers": self.io_workers,
+            "cpu_workers": self.cpu_workers,
+            "max_inflight_io": self.max_inflight_io,
+            "max_inflight_cpu": self.max_inflight_cpu,
+            "inflight_io": self.inflight_io,
+            "inflight_cpu": self.inflight_cpu,
+        }
+
+    def shutdown(self) -> None:
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=False, cancel_futures=True)
+            self._io_pool = None
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+            self._cpu_pool = None
+
+
+def _import_modules(modules) -> None:
+    for name in modules:
+        importlib.import_module(name)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+pipeline_executor = PipelineExecutor(
+    io_workers=_env_int("OCR_IO_WORKERS", 8),
+    cpu_workers=_env_int("OCR_CPU_WORKERS", min(2, os.cpu_count() or 1)),
+    max_inflight_io=_env_int("OCR_MAX_INFLIGHT_IO", 0) or None,
+    max_inflight_cpu=_env_int("OCR_MAX_INFLIGHT_CPU", 0) or None,
+    mp_start_method=os.getenv("OCR_MP_START_METHOD", "spawn"),
+)
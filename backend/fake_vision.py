@@ -0,0 +1,227 @@
+# backend/fake_vision.py
+"""
+Offline stand-ins for Google Vision, for benchmarks and local runs.
+
+In-process (no network at all):
+
+    vision_clients.set_factory(lambda: FakeVisionClient(latency=0.15))
+
+Stub server (the real client library, REST transport, local socket):
+
+    python fake_vision.py --port 9100 --latency 0.15
+    VISION_API_ENDPOINT=http://127.0.0.1:9100 uvicorn main:app
+
+Both answer with canned nameplate texts after a configurable delay
+(latency per call + per_image per image in the call). Which text an image
+gets depends only on its bytes, so repeated runs give the same results.
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence
+
+from google.api_core import exceptions as gexc
+from google.cloud import vision_v1
+
+# a few complete plates and a few with fields the first pass "missed",
+# so the adaptive pass strategy sometimes asks for a second pass
+CANNED_TEXTS = (
+    "SN 2231-0457\nMODEL BV-300\nDN 50\nPN 16\nPT 24 BAR\nBODY WCB\nDISC CF8M\nSEAT PTFE\nTEMP -29~180C\nDATE 2023-04\nWCB\nAB12",
+    "S/N 7781-9920\nMODEL GV-150\nDN 80\nPN 40\nPT 60 BAR\nBODY CF8\nDISC CF8\nSEAT RPTFE\nTEMP 200C\nDATE 2022-11",
+    "SN 1020-3344\nMODEL CV-25\nDN 25\nPN 25\nBODY LCC\nDISC 410\nSEAT STELLITE\nTEMP 425C\nHEAT 5521",
+    "MODEL BV-200\nDN 100\nPN 16\nBODY WCB\nCF8M\nX1Y2",
+    "SN 5566-0012\nDN 150\nPT 30 BAR\nSEAT NBR",
+)
+
+
+def canned_text(content: bytes, texts: Sequence[str] = CANNED_TEXTS) -> str:
+    return texts[zlib.crc32(content) % len(texts)]
+
+
+def annotation(text: str, confidence: float = 0.95) -> Dict[str, Any]:
+    """
+    A fullTextAnnotation for `text` as Vision's REST API spells it: one
+    page / block / paragraph per line, words laid out left to right on a
+    20 px per character grid.
+    """
+    paragraphs = []
+    for row, line in enumerate(text.splitlines()):
+        words, x = [], 10
+        y0, y1 = 10 + row * 40, 40 + row * 40
+        for word in line.split():
+            x1 = x + 20 * len(word)
+            box = {"vertices": [{"x": x, "y": y0}, {"x": x1, "y": y0}, {"x": x1, "y": y1}, {"x": x, "y": y1}]}
+            words.append({"boundingBox": box, "confidence": confidence, "symbols": [{"text": c} for c in word]})
+            x = x1 + 20
+        paragraphs.append({"words": words, "confidence": confidence})
+    return {"text": text, "pages": [{"confidence": confidence, "blocks": [{"paragraphs": paragraphs}]}]}
+
+
+class FakeVisionClient:
+    """
+    Implements the ImageAnnotatorClient methods the pipeline calls. Thread
+    safe; `calls` / `images` count what it was asked to do. A call fails
+    with ServiceUnavailable with probability `error_rate`, and with
+    ResourceExhausted when more than `max_inflight` calls (0: no limit) are
+    running at once, like a project quota.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.1,
+        per_image: float = 0.005,
+        texts: Sequence[str] = CANNED_TEXTS,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+        max_inflight: int = 0,
+    ):
+        self.latency = latency
+        self.per_image = per_image
+        self.texts = texts
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.max_inflight = max_inflight
+        self.calls = 0
+        self.images = 0
+        self.inflight = 0
+        self.throttled = 0
+
+    def _response(self, content: bytes) -> vision_v1.AnnotateImageResponse:
+        text = canned_text(content, self.texts)
+        return vision_v1.AnnotateImageResponse.from_json(
+            json.dumps({"fullTextAnnotation": annotation(text), "textAnnotations": [{"description": text}]}),
+            ignore_unknown_fields=True,
+        )
+
+    def simulate(self, n: int) -> None:
+        """Count and sleep for one call with n images (raises if it is chosen to fail)."""
+        with self._lock:
+            self.calls += 1
+            self.images += n
+            if self.max_inflight and self.inflight >= self.max_inflight:
+                self.throttled += 1
+                raise gexc.ResourceExhausted("fake Vision: too many concurrent requests")
+            self.inflight += 1
+            fail = self.error_rate and self._random.random() < self.error_rate
+        try:
+            time.sleep(self.latency + self.per_image * n)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+        if fail:
+            raise gexc.ServiceUnavailable("fake Vision: injected failure")
+
+    def batch_annotate_images(self, requests: Sequence[Any], **kwargs) -> vision_v1.BatchAnnotateImagesResponse:
+        self.simulate(len(requests))
+        return vision_v1.BatchAnnotateImagesResponse(
+            responses=[self._response(_content(r.image)) for r in requests]
+        )
+
+    def document_text_detection(self, image: Any, **kwargs) -> vision_v1.AnnotateImageResponse:
+        self.simulate(1)
+        return self._response(_content(image))
+
+    text_detection = document_text_detection
+
+
+def _content(image: Any) -> bytes:
+    if isinstance(image, dict):
+        return image.get("content", b"")
+    return image.content
+
+
+# ─────────────────────────────
+# STUB SERVER (images:annotate over HTTP/JSON)
+# ─────────────────────────────
+class StubVisionServer:
+    """
+    Serves POST /v1/images:annotate like the Vision REST API, on a local
+    port, in a background thread. Point the app at it with
+    VISION_API_ENDPOINT=<url>.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **client_kwargs):
+        self.fake = FakeVisionClient(**client_kwargs)
+        fake = self.fake
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.startswith("/v1/images:annotate"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                contents = [base64.b64decode(r.get("image", {}).get("content", "")) for r in body.get("requests", [])]
+                try:
+                    fake.simulate(len(contents))
+                except gexc.ResourceExhausted as e:
+                    self._reply(429, {"error": {"code": 429, "message": str(e), "status": "RESOURCE_EXHAUSTED"}})
+                    return
+                except Exception as e:
+                    self._reply(503, {"error": {"code": 503, "message": str(e), "status": "UNAVAILABLE"}})
+                    return
+                responses: List[Dict[str, Any]] = []
+                for content in contents:
+                    text = canned_text(content, fake.texts)
+                    responses.append({"fullTextAnnotation": annotation(text), "textAnnotations": [{"description": text}]})
+                self._reply(200, {"responses": responses})
+
+            def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+                out = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubVisionServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local stub for the Google Vision images:annotate API.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency", type=float, default=0.1, help="seconds per call")
+    ap.add_argument("--per-image", type=float, default=0.005, help="extra seconds per image in a call")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+
+    server = StubVisionServer(args.host, args.port, latency=args.latency, per_image=args.per_image, error_rate=args.error_rate)
+    print(f"fake Vision listening on {server.url} (VISION_API_ENDPOINT={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
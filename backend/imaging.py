@@ -0,0 +1,292 @@
+# backend/imaging.py
+"""
+CPU-bound image helpers for the OCR pipeline.
+
+Kept free of FastAPI / Vision / Supabase imports so the module is cheap to
+import inside process-pool workers.
+"""
+import io
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageEnhance, ImageOps
+
+import enhance
+import roi
+
+# Vision rejects images over 20 MB; stay well below so batches fit too
+VISION_MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+
+class ResolutionPolicy:
+    """
+    Decides the pixel size of each OCR variant before it is encoded.
+
+    Plate text is assumed to be about `text_height_ratio` of the image's short
+    side. Each variant is scaled so that text lands near `target_text_px`
+    (upscaling at most `max_upscale`, never below `min_short_side`), then
+    capped at `max_megapixels`. The "document" variant is never upscaled.
+    """
+
+    def __init__(
+        self,
+        max_megapixels: float = 8.0,
+        target_text_px: float = 32.0,
+        text_height_ratio: float = 0.02,
+        min_short_side: int = 1024,
+        max_upscale: float = 2.0,
+        max_bytes: int = 10 * 1024 * 1024,
+    ):
+        self.max_megapixels = max_megapixels
+        self.target_text_px = target_text_px
+        self.text_height_ratio = text_height_ratio
+        self.min_short_side = min_short_side
+        self.max_upscale = max_upscale
+        self.max_bytes = min(max_bytes, VISION_MAX_IMAGE_BYTES)
+
+    def scale_for(self, w: int, h: int, allow_upscale: bool) -> float:
+        short = min(w, h)
+        scale = self.target_text_px / max(1.0, short * self.text_height_ratio)
+        scale = max(scale, self.min_short_side / short)
+        scale = min(scale, self.max_upscale if allow_upscale else 1.0)
+        mp_cap = math.sqrt(self.max_megapixels * 1_000_000 / (w * h))
+        return min(scale, mp_cap)
+
+    @classmethod
+    def from_env(cls) -> "ResolutionPolicy":
+        return cls(
+            max_megapixels=float(os.getenv("OCR_MAX_MEGAPIXELS", "8")),
+            target_text_px=float(os.getenv("OCR_TARGET_TEXT_PX", "32")),
+            text_height_ratio=float(os.getenv("OCR_TEXT_HEIGHT_RATIO", "0.02")),
+            min_short_side=int(os.getenv("OCR_MIN_SHORT_SIDE", "1024")),
+            max_upscale=float(os.getenv("OCR_MAX_UPSCALE", "2.0")),
+            max_bytes=int(os.getenv("OCR_MAX_VARIANT_BYTES", 10 * 1024 * 1024)),
+        )
+
+
+resolution_policy = ResolutionPolicy.from_env()
+
+# "numpy" (fused single pass, see enhance.py) or "pillow" (ImageEnhance chain)
+ENHANCE_ENGINE = os.getenv("OCR_ENHANCE_ENGINE", "numpy" if enhance.available else "pillow")
+
+
+def _fused() -> bool:
+    return ENHANCE_ENGINE == "numpy" and enhance.available
+
+
+def _scaled(size: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def _resize(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    if img.size == size:
+        return img
+    # reducing_gap lets Pillow use the cheap integer reduce() before resampling
+    return img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def open_upload(data: bytes, max_scale: float = 1.0) -> Image.Image:
+    """
+    Decode an upload, EXIF-rotated, as RGB. For JPEGs with max_scale < 1 the
+    decoder works at 1/2, 1/4 or 1/8 scale (Image.draft) when that still
+    leaves at least max_scale of the original size.
+    """
+    img = Image.open(io.BytesIO(data))
+    if max_scale < 1.0 and img.format == "JPEG":
+        img.draft("RGB", _scaled(img.size, max_scale))
+    return ImageOps.exif_transpose(img).convert("RGB")
+
+
+def clean_for_ocr(img: Image.Image) -> Image.Image:
+    """Light cleanup used for OCR: trim the border, boost contrast and sharpness."""
+    w, h = img.size
+    pad = int(min(w, h) * 0.01)
+    if pad > 0:
+        img = img.crop((pad, pad, w - pad, h - pad))
+
+    if _fused():
+        return enhance.enhance(img, contrast=1.3, sharpness=1.1)
+    img = ImageEnhance.Contrast(img).enhance(1.3)
+    img = ImageEnhance.Sharpness(img).enhance(1.1)
+    return img
+
+
+def preprocess_image(data: bytes, max_scale: float = 1.0) -> Image.Image:
+    """Decode an uploaded image and apply the light cleanup used for OCR."""
+    return clean_for_ocr(open_upload(data, max_scale))
+
+
+def make_high_contrast(img: Image.Image, size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    if _fused():
+        g = enhance.enhance(img, contrast=3.0, sharpness=2.5, grayscale=True, invert=True)
+    else:
+        g = img.convert("L")
+        g = ImageEnhance.Contrast(g).enhance(3.0)
+        g = ImageEnhance.Sharpness(g).enhance(2.5)
+        g = ImageOps.invert(g)
+
+    if size is None:
+        w, h = g.size
+        size = (w * 2, h * 2)
+    g = _resize(g, size)
+
+    return g
+
+
+def encode_jpeg(img: Image.Image, quality: int = 95) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def encode_for_vision(img: Image.Image, max_bytes: int = VISION_MAX_IMAGE_BYTES) -> bytes:
+    """JPEG-encode, lowering quality and then size until the payload fits max_bytes."""
+    data = encode_jpeg(img)
+    quality = 95
+    while len(data) > max_bytes:
+        if quality > 80:
+            quality = 80
+        else:
+            img = _resize(img, _scaled(img.size, 0.75))
+        data = encode_jpeg(img, quality)
+    return data
+
+
+def crop_center_band(img: Image.Image, band_ratio: float = 0.4) -> Image.Image:
+    """keep centre vertical band – where small embossing often is"""
+    w, h = img.size
+    band_w = int(w * band_ratio)
+    x1 = (w - band_w) // 2
+    x2 = x1 + band_w
+    return img.crop((x1, 0, x2, h))
+
+
+# perceptual hash (near_dup.py): the lowest HASH_FREQS x HASH_FREQS DCT
+# frequencies of a HASH_SIDE x HASH_SIDE greyscale copy, without the DC term
+HASH_SIDE = 32
+HASH_FREQS = 12
+HASH_BITS = HASH_FREQS * HASH_FREQS - 1
+_DCT = [[math.cos(math.pi * (2 * n + 1) * k / (2 * HASH_SIDE)) for n in range(HASH_SIDE)] for k in range(HASH_FREQS)]
+
+
+def phash(img: Image.Image) -> int:
+    """
+    One bit per low-frequency DCT coefficient: is it above the median? Low
+    frequencies are the layout of the picture, so JPEG noise, small shifts and
+    exposure changes flip few bits (unlike pixel-difference hashes, which
+    flip at random on flat metal).
+    """
+    n, k = HASH_SIDE, HASH_FREQS
+    px = img.convert("L").resize((n, n), Image.BOX).tobytes()
+    # separable 2-D DCT-II, only the k lowest frequencies each way
+    rows = [[sum(c * p for c, p in zip(_DCT[v], px[y * n:(y + 1) * n])) for v in range(k)] for y in range(n)]
+    coeffs = [sum(_DCT[u][y] * rows[y][v] for y in range(n)) for u in range(k) for v in range(k)][1:]
+    median = sorted(coeffs)[len(coeffs) // 2]
+    value = 0
+    for c in coeffs:
+        value = (value << 1) | (c > median)
+    return value
+
+
+def image_phash(data: bytes) -> int:
+    """pHash of an upload; JPEGs are decoded at 1/8 scale (the hash needs 32x32 pixels)."""
+    return phash(open_upload(data, max_scale=0.125))
+
+
+# variants derived from the high-contrast image
+_HC_DERIVED = {
+    "rotate-90": lambda hc: hc.rotate(90, expand=True),
+    "rotate-180": lambda hc: hc.rotate(180, expand=True),
+    "rotate-270": lambda hc: hc.rotate(270, expand=True),
+    "center-band": lambda hc: crop_center_band(hc, 0.45),
+}
+# "full-frame" is "document" without the region-of-interest crop
+VARIANTS = ("document", "full-frame", "high-contrast") + tuple(_HC_DERIVED)
+
+
+def render_variants(
+    data: bytes,
+    names=("document", "high-contrast"),
+    policy: Optional[ResolutionPolicy] = None,
+    use_roi: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    Build the requested OCR variants of an uploaded image (see VARIANTS) and
+    return their JPEG bytes by name. Everything stays in memory and each
+    variant is encoded exactly once, at the size chosen by the resolution
+    policy. "info" carries sizes for logging and per-step timings (seconds;
+    this usually runs in a worker process, so the caller records them).
+
+    With use_roi (default: OCR_ROI) every variant except "full-frame" is
+    cropped to the text region found by roi.py before enhancement;
+    info["roi"] is that box in original pixels, or None when the full
+    frame was used.
+    """
+    unknown = set(names) - set(VARIANTS)
+    if unknown:
+        raise ValueError(f"unknown image variants: {sorted(unknown)}")
+
+    policy = policy or resolution_policy
+    use_roi = roi.ROI_ENABLED if use_roi is None else use_roi
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    with Image.open(io.BytesIO(data)) as probe:
+        orig_w, orig_h = probe.size
+    doc_scale = policy.scale_for(orig_w, orig_h, allow_upscale=False)
+    hc_scale = policy.scale_for(orig_w, orig_h, allow_upscale=True)
+    need_hc = any(n not in ("document", "full-frame") for n in names)
+
+    work_scale = min(1.0, max(doc_scale, hc_scale) if need_hc else doc_scale)
+    img = open_upload(data, max_scale=work_scale)
+    # the decoder may already have shrunk the image (area ratio: EXIF rotation may swap w/h)
+    decoded_scale = math.sqrt(img.size[0] * img.size[1] / (orig_w * orig_h))
+    if decoded_scale > work_scale:
+        # enhance at the largest size any variant needs, not at camera resolution
+        img = _resize(img, _scaled(img.size, work_scale / decoded_scale))
+        decoded_scale = work_scale
+    t1 = time.perf_counter()
+    timings["decode"] = t1 - t0
+
+    box = None
+    if use_roi and any(n != "full-frame" for n in names):
+        box = roi.find_text_region(img)
+        t0 = time.perf_counter()
+        timings["roi"] = t0 - t1
+        t1 = t0
+    full = clean_for_ocr(img) if (box is None or "full-frame" in names) else None
+    # crop before enhancing: only the region's pixels are processed and sent
+    crop = clean_for_ocr(img.crop(box)) if box is not None else full
+    t0 = time.perf_counter()
+    timings["clean"] = t0 - t1
+
+    images: Dict[str, Image.Image] = {}
+    if "full-frame" in names:
+        images["full-frame"] = _resize(full, _scaled(full.size, doc_scale / decoded_scale))
+    if "document" in names:
+        images["document"] = _resize(crop, _scaled(crop.size, doc_scale / decoded_scale))
+    if need_hc:
+        hc = make_high_contrast(crop, size=_scaled(crop.size, hc_scale / decoded_scale))
+        for name in names:
+            if name == "high-contrast":
+                images[name] = hc
+            elif name in _HC_DERIVED:
+                images[name] = _HC_DERIVED[name](hc)
+    t1 = time.perf_counter()
+    timings["high_contrast"] = t1 - t0
+
+    out: Dict[str, Any] = {"info": {"upload_bytes": len(data), "original_size": [orig_w, orig_h], "variants": {}}}
+    out["info"]["roi"] = [round(v / decoded_scale) for v in box] if box is not None else None
+    for name, variant in images.items():
+        encoded = encode_for_vision(variant, policy.max_bytes)
+        out[name] = encoded
+        out["info"]["variants"][name] = [variant.size[0], variant.size[1], len(encoded)]
+    timings["encode"] = time.perf_counter() - t1
+    out["info"]["timings"] = timings
+    return out
+
+
+def prepare_variants(data: bytes, policy: Optional[ResolutionPolicy] = None) -> Dict[str, Any]:
+    """The two standard OCR variants: "document" (light cleanup) and "high-contrast"."""
+    return render_variants(data, ("document", "high-contrast"), policy)
@@ -0,0 +1,144 @@
+# backend/job_events.py
+"""
+Server-sent events for OCR job progress (/ocr-job/{id}/events).
+
+A stream starts with one "snapshot" event (the job so far, results
+included), then sends small deltas:
+
+  status - the job status changed             {"status", "progress"}
+  group  - one group changed                  {"product_no", "status", "progress", ["files"], ["error"], ["result"]}
+  done   - the job finished; the stream ends  {"status", "count", "progress", ["error"]}
+
+Changes made in this process wake streams up immediately (JobEventBus
+listens to the job store). Changes made by another worker sharing a SQLite
+job store are picked up by re-reading the store every `poll_interval`.
+Store reads go through the IO pool, so open streams never block the loop.
+"""
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+from executors import pipeline_executor
+from job_store import FINISHED, JobStore
+
+
+class JobEventBus:
+    """Per-job wake-up events for the streams open in this process."""
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, batch_id: str) -> asyncio.Event:
+        self._loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        self._waiters.setdefault(batch_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, batch_id: str, event: asyncio.Event) -> None:
+        waiters = self._waiters.get(batch_id)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del self._waiters[batch_id]
+
+    def notify(self, batch_id: str) -> None:
+        waiters = self._waiters.get(batch_id)
+        if not waiters or self._loop is None:
+            return
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        for event in list(waiters):
+            if in_loop:
+                event.set()
+            else:
+                self._loop.call_soon_threadsafe(event.set)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"jobs": len(self._waiters), "streams": sum(len(w) for w in self._waiters.values())}
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def job_event_stream(
+    store: JobStore,
+    bus: JobEventBus,
+    batch_id: str,
+    poll_interval: float = 1.0,
+    heartbeat: float = 15.0,
+) -> AsyncIterator[str]:
+    wake = bus.subscribe(batch_id)
+    try:
+        job = await pipeline_executor.run_io(store.get, batch_id)
+        if job is None:
+            yield sse("done", {"status": "failed", "error": "Job not found"})
+            return
+        yield sse("snapshot", job)
+
+        seen: Dict[int, Tuple[str, Optional[str]]] = {
+            g["product_no"]: (g["status"], g.get("error")) for g in job["groups"]
+        }
+        status = job["status"]
+        idle = 0.0
+
+        while status not in FINISHED:
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=poll_interval)
+                idle = 0.0
+            except asyncio.TimeoutError:
+                idle += poll_interval
+
+            # cleared right before the read: a change notified from here on,
+            # even while the deltas below are sent, wakes the next round
+            wake.clear()
+            job = await pipeline_executor.run_io(store.get, batch_id, include_results=False)
+            if job is None:
+                yield sse("done", {"status": "failed", "error": "Job expired"})
+                return
+
+            changed = []
+            for g in job["groups"]:
+                state = (g["status"], g.get("error"))
+                if seen.get(g["product_no"]) != state:
+                    changed.append((g, g["product_no"] not in seen))
+                    seen[g["product_no"]] = state
+            finished = [g["product_no"] for g, _ in changed if g["status"] == "done"]
+            results = await pipeline_executor.run_io(store.get_results, batch_id, finished) if finished else {}
+
+            for g, is_new in changed:
+                delta: Dict[str, Any] = {"product_no": g["product_no"], "status": g["status"], "progress": job["progress"]}
+                if is_new:
+                    delta["files"] = g["files"]
+                if g.get("error"):
+                    delta["error"] = g["error"]
+                if g["product_no"] in results:
+                    delta["result"] = results[g["product_no"]]
+                yield sse("group", delta)
+
+            if job["status"] != status:
+                status = job["status"]
+                if status not in FINISHED:
+                    yield sse("status", {"status": status, "progress": job["progress"]})
+
+            if changed:
+                idle = 0.0
+            elif idle >= heartbeat:
+                # SSE comment: keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                idle = 0.0
+
+        summary: Dict[str, Any] = {"status": status, "count": job["count"], "progress": job["progress"]}
+        if job.get("error"):
+            summary["error"] = job["error"]
+        yield sse("done", summary)
+    finally:
+        bus.unsubscribe(batch_id, wake)
+
+
+job_events = JobEventBus()
+EVENTS_POLL_INTERVAL = float(os.getenv("OCR_EVENTS_POLL_INTERVAL", "1.0"))
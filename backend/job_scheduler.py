@@ -0,0 +1,86 @@
+# backend/job_scheduler.py
+import asyncio
+import logging
+import os
+from typing import Any, Coroutine, Optional, Set
+
+logger = logging.getLogger("ndt-image")
+
+
+class GroupScheduler:
+    """
+    Runs product groups as background asyncio tasks.
+
+    At most `max_concurrent_groups` groups are processed at the same time
+    (across all batches of this worker); the rest wait in the queue.
+    """
+
+    def __init__(self, max_concurrent_groups: int = 2):
+        self.max_concurrent_groups = max(1, int(max_concurrent_groups))
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.running = 0
+        self.waiting = 0
+
+    # created lazily so they bind to the running event loop
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrent_groups)
+        return self._sem
+
+    def _event(self) -> asyncio.Event:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+        """Queue a coroutine; returns the task (kept referenced until done)."""
+        started = {"value": False}
+        self.waiting += 1
+        task = asyncio.ensure_future(self._run(coro, started))
+        self._tasks.add(task)
+
+        def on_done(t: asyncio.Task) -> None:
+            self._tasks.discard(t)
+            if not started["value"]:
+                # cancelled while still queued
+                self.waiting -= 1
+                coro.close()
+            self._event().set()
+
+        task.add_done_callback(on_done)
+        return task
+
+    async def _run(self, coro: Coroutine[Any, Any, Any], started: dict) -> Any:
+        await self._semaphore().acquire()
+        started["value"] = True
+        self.waiting -= 1
+        self.running += 1
+        self._event().set()
+        try:
+            return await coro
+        finally:
+            self.running -= 1
+            self._semaphore().release()
+
+    async def wait_for_capacity(self) -> None:
+        """
+        Wait while a full round of groups is already queued behind the running
+        ones. Used as backpressure by streaming ingest so buffered images stay
+        bounded by the concurrency, not by the batch size.
+        """
+        event = self._event()
+        while self.waiting >= self.max_concurrent_groups:
+            event.clear()
+            await event.wait()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent_groups": self.max_concurrent_groups,
+            "running": self.running,
+            "waiting": self.waiting,
+        }
+
+
+scheduler = GroupScheduler(int(os.getenv("OCR_MAX_CONCURRENT_GROUPS", "2")))
@@ -0,0 +1,474 @@
+# backend/job_store.py
+"""
+Where batch jobs live while they are processed and polled.
+
+A job is {"batch_id", "status", "count", "groups", "results", "progress"}
+plus "error" / "intake_error" when something went wrong. Groups are stored
+one by one as they are registered and finished, so a poll sees results as
+soon as each group is done. A group's OCR output is also kept as a
+checkpoint (not part of the job document) so a resumed job can insert it
+without running OCR again.
+
+Backends (OCR_JOB_STORE):
+  memory - this process only; finished jobs are dropped after OCR_JOB_TTL
+  sqlite - a WAL-mode SQLite file (OCR_JOB_DB) shared by every worker
+           process on the host, so any worker can answer /ocr-job/{id}
+"""
+import abc
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("ndt-image")
+
+GROUP_STATUSES = ("queued", "running", "done", "failed")
+FINISHED = ("done", "failed")
+JOB_FIELDS = ("status", "count", "error", "intake_error")
+
+
+def _progress(groups: List[Dict[str, Any]]) -> Dict[str, int]:
+    progress = dict.fromkeys(GROUP_STATUSES, 0)
+    for g in groups:
+        progress[g["status"]] = progress.get(g["status"], 0) + 1
+    return progress
+
+
+class JobStore(abc.ABC):
+    """
+    Interface shared by the backends. All methods are synchronous and
+    thread-safe. The SQLite store can wait on its file lock (up to `timeout`
+    while other processes write), so async code calls them through
+    pipeline_executor.run_io rather than on the event loop. get() returns a
+    snapshot the caller may keep or serialise.
+
+    Listeners added with add_listener(fn) are called with the batch_id after
+    every change made through this store object (see job_events.py).
+    """
+
+    _listeners: List[Callable[[str], None]]
+
+    def add_listener(self, fn: Callable[[str], None]) -> None:
+        self._listeners.append(fn)
+
+    def _changed(self, batch_id: str) -> None:
+        for fn in self._listeners:
+            try:
+                fn(batch_id)
+            except Exception:
+                logger.exception("Job store listener failed")
+
+    @abc.abstractmethod
+    def create(self, batch_id: str, status: str = "queued") -> Dict[str, Any]:
+        ...
+
+    @abc.abstractmethod
+    def get(self, batch_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        """The job, or None. With include_results=False "results" is left empty (cheap status checks)."""
+
+    @abc.abstractmethod
+    def get_results(self, batch_id: str, product_nos: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Results of the given groups that have one, by product_no."""
+
+    @abc.abstractmethod
+    def update(self, batch_id: str, **fields: Any) -> None:
+        """Set job-level fields (status, count, error, intake_error)."""
+
+    @abc.abstractmethod
+    def add_group(self, batch_id: str, files: List[str]) -> int:
+        """Register the next group of a job; returns its product_no (1-based)."""
+
+    @abc.abstractmethod
+    def set_group_status(
+        self,
+        batch_id: str,
+        product_no: int,
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        """
+        Update one group; the first group to start running moves the job from
+        queued to processing. A new result replaces the group's old one, and
+        a group that runs again loses the error of its failed run.
+        """
+
+    @abc.abstractmethod
+    def set_group_checkpoint(self, batch_id: str, product_no: int, checkpoint: Dict[str, Any]) -> None:
+        """Keep a group's OCR output until the job is purged."""
+
+    @abc.abstractmethod
+    def get_group_checkpoint(self, batch_id: str, product_no: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def purge(self) -> int:
+        """Drop finished jobs older than the TTL; returns how many were removed."""
+
+    @abc.abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+
+# ─────────────────────────────
+# IN-MEMORY
+# ─────────────────────────────
+class MemoryJobStore(JobStore):
+    def __init__(self, ttl: float = 24 * 3600, sweep_interval: float = 60.0):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._listeners = []
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._finished_at: Dict[str, float] = {}
+        self._checkpoints: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._evicted = 0
+
+    def create(self, batch_id: str, status: str = "queued") -> Dict[str, Any]:
+        job = {"batch_id": batch_id, "status": status, "count": 0, "groups": [], "results": []}
+        job["progress"] = _progress(job["groups"])
+        with self._lock:
+            self._jobs[batch_id] = job
+            self._finished_at.pop(batch_id, None)
+            self._checkpoints.pop(batch_id, None)
+            self._maybe_sweep()
+            snapshot = copy.deepcopy(job)
+        self._changed(batch_id)
+        return snapshot
+
+    def get(self, batch_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._maybe_sweep()
+            job = self._jobs.get(batch_id)
+            if not job:
+                return None
+            if include_results:
+                return copy.deepcopy(job)
+            snapshot = copy.deepcopy({k: v for k, v in job.items() if k != "results"})
+            snapshot["results"] = []
+            return snapshot
+
+    def get_results(self, batch_id: str, product_nos: List[int]) -> Dict[int, Dict[str, Any]]:
+        wanted = set(product_nos)
+        with self._lock:
+            job = self._jobs.get(batch_id)
+            if not job:
+                return {}
+            return {r["product_no"]: copy.deepcopy(r) for r in job["results"] if r["product_no"] in wanted}
+
+    def update(self, batch_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(batch_id)
+            if not job:
+                return
+            for key, value in fields.items():
+                if key not in JOB_FIELDS:
+                    raise ValueError(f"unknown job field {key!r}")
+                if value is None and key in ("error", "intake_error"):
+                    job.pop(key, None)  # cleared, as the SQLite store leaves it out
+                else:
+                    job[key] = value
+            if job["status"] in FINISHED:
+                self._finished_at.setdefault(batch_id, time.monotonic())
+            else:
+                self._finished_at.pop(batch_id, None)
+        self._changed(batch_id)
+
+    def add_group(self, batch_id: str, files: List[str]) -> int:
+        with self._lock:
+            job = self._jobs[batch_id]
+            product_no = len(job["groups"]) + 1
+            job["groups"].append({"product_no": product_no, "files": list(files), "status": "queued"})
+            job["progress"] = _progress(job["groups"])
+        self._changed(batch_id)
+        return product_no
+
+    def set_group_status(self, batch_id, product_no, status, result=None, error=None) -> None:
+        with self._lock:
+            job = self._jobs.get(batch_id)
+            if not job:
+                return
+            group = job["groups"][product_no - 1]
+            group["status"] = status
+            if error:
+                group["error"] = error
+            elif status != "failed":
+                group.pop("error", None)
+            if result is not None:
+                job["results"] = [r for r in job["results"] if r["product_no"] != product_no]
+                job["results"].append(result)
+                job["results"].sort(key=lambda r: r["product_no"])
+            if job["status"] == "queued" and status == "running":
+                job["status"] = "processing"
+            job["progress"] = _progress(job["groups"])
+        self._changed(batch_id)
+
+    def set_group_checkpoint(self, batch_id, product_no, checkpoint) -> None:
+        with self._lock:
+            if batch_id in self._jobs:
+                self._checkpoints.setdefault(batch_id, {})[product_no] = copy.deepcopy(checkpoint)
+
+    def get_group_checkpoint(self, batch_id, product_no) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            checkpoint = self._checkpoints.get(batch_id, {}).get(product_no)
+            return copy.deepcopy(checkpoint) if checkpoint is not None else None
+
+    def purge(self) -> int:
+        with self._lock:
+            return self._sweep()
+
+    def _maybe_sweep(self) -> None:
+        # caller holds the lock
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._sweep()
+
+    def _sweep(self) -> int:
+        # caller holds the lock
+        self._last_sweep = now = time.monotonic()
+        expired = [b for b, t in self._finished_at.items() if now - t >= self.ttl]
+        for batch_id in expired:
+            self._jobs.pop(batch_id, None)
+            self._checkpoints.pop(batch_id, None)
+            del self._finished_at[batch_id]
+        self._evicted += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "jobs": len(self._jobs),
+                "finished": len(self._finished_at),
+                "evicted": self._evicted,
+                "ttl": self.ttl,
+            }
+
+
+# ─────────────────────────────
+# SQLITE
+# ─────────────────────────────
+class SQLiteJobStore(JobStore):
+    """
+    Jobs in one SQLite file (WAL mode, so readers in other processes don't
+    block the writer). Each group's result is written when the group
+    finishes; get() assembles the job from its group rows.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, sweep_interval: float = 60.0, timeout: float = 30.0):
+        self.path = path
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._evicted = 0
+
+        self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " batch_id TEXT PRIMARY KEY, status TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT, intake_error TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL, finished_at REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_groups ("
+            " batch_id TEXT NOT NULL, product_no INTEGER NOT NULL, files TEXT NOT NULL,"
+            " status TEXT NOT NULL, error TEXT, result TEXT, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (batch_id, product_no))"
+        )
+        try:
+            self._db.execute("ALTER TABLE job_groups ADD COLUMN checkpoint TEXT")
+        except sqlite3.OperationalError:
+            pass  # column already added (by an earlier start or another worker)
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+        logger.info("Job store at %s", path)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        """One write transaction, taken up front (BEGIN IMMEDIATE) so workers don't deadlock."""
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+
+    def create(self, batch_id: str, status: str = "queued") -> Dict[str, Any]:
+        now = time.time()
+        with self._transaction() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO jobs (batch_id, status, count, created_at, updated_at) VALUES (?, ?, 0, ?, ?)",
+                (batch_id, status, now, now),
+            )
+            cur.execute("DELETE FROM job_groups WHERE batch_id = ?", (batch_id,))
+        self._changed(batch_id)
+        self._maybe_sweep()
+        return {"batch_id": batch_id, "status": status, "count": 0, "groups": [], "results": [], "progress": _progress([])}
+
+    def get(self, batch_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        self._maybe_sweep()
+        result_col = "result" if include_results else "NULL"
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, count, error, intake_error FROM jobs WHERE batch_id = ?", (batch_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            group_rows = self._db.execute(
+                f"SELECT product_no, files, status, error, {result_col} FROM job_groups"
+                " WHERE batch_id = ? ORDER BY product_no",
+                (batch_id,),
+            ).fetchall()
+
+        status, count, error, intake_error = row
+        groups: List[Dict[str, Any]] = []
+        results: List[Dict[str, Any]] = []
+        for product_no, files, g_status, g_error, result in group_rows:
+            group = {"product_no": product_no, "files": json.loads(files), "status": g_status}
+            if g_error:
+                group["error"] = g_error
+            groups.append(group)
+            if result is not None:
+                results.append(json.loads(result))
+
+        job: Dict[str, Any] = {
+            "batch_id": batch_id,
+            "status": status,
+            "count": count,
+            "groups": groups,
+            "results": results,
+            "progress": _progress(groups),
+        }
+        if error is not None:
+            job["error"] = error
+        if intake_error is not None:
+            job["intake_error"] = intake_error
+        return job
+
+    def get_results(self, batch_id: str, product_nos: List[int]) -> Dict[int, Dict[str, Any]]:
+        if not product_nos:
+            return {}
+        marks = ", ".join("?" * len(product_nos))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT product_no, result FROM job_groups WHERE batch_id = ? AND product_no IN ({marks})"
+                " AND result IS NOT NULL",
+                (batch_id, *product_nos),
+            ).fetchall()
+        return {product_no: json.loads(result) for product_no, result in rows}
+
+    def update(self, batch_id: str, **fields: Any) -> None:
+        unknown = set(fields) - set(JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown job fields {sorted(unknown)}")
+        if not fields:
+            return
+        now = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        params = list(fields.values())
+        sql = f"UPDATE jobs SET {assignments}, updated_at = ?"
+        params.append(now)
+        if "status" in fields:
+            # finished jobs age out after the TTL; a job that is running again does not
+            if fields["status"] in FINISHED:
+                sql += ", finished_at = COALESCE(finished_at, ?)"
+                params.append(now)
+            else:
+                sql += ", finished_at = NULL"
+        with self._transaction() as cur:
+            cur.execute(sql + " WHERE batch_id = ?", (*params, batch_id))
+        self._changed(batch_id)
+
+    def add_group(self, batch_id: str, files: List[str]) -> int:
+        with self._transaction() as cur:
+            product_no = cur.execute(
+                "SELECT COALESCE(MAX(product_no), 0) + 1 FROM job_groups WHERE batch_id = ?", (batch_id,)
+            ).fetchone()[0]
+            cur.execute(
+                "INSERT INTO job_groups (batch_id, product_no, files, status, updated_at) VALUES (?, ?, ?, 'queued', ?)",
+                (batch_id, product_no, json.dumps(list(files)), time.time()),
+            )
+        self._changed(batch_id)
+        return product_no
+
+    def set_group_status(self, batch_id, product_no, status, result=None, error=None) -> None:
+        now = time.time()
+        # a failed group keeps its last error unless given a new one; any other status clears it
+        error_sql = "COALESCE(?, error)" if status == "failed" else "?"
+        with self._transaction() as cur:
+            cur.execute(
+                f"UPDATE job_groups SET status = ?, error = {error_sql},"
+                " result = COALESCE(?, result), updated_at = ? WHERE batch_id = ? AND product_no = ?",
+                (status, error or None, json.dumps(result) if result is not None else None, now, batch_id, product_no),
+            )
+            if status == "running":
+                cur.execute(
+                    "UPDATE jobs SET status = 'processing', updated_at = ? WHERE batch_id = ? AND status = 'queued'",
+                    (now, batch_id),
+                )
+        self._changed(batch_id)
+
+    def set_group_checkpoint(self, batch_id, product_no, checkpoint) -> None:
+        with self._transaction() as cur:
+            cur.execute(
+                "UPDATE job_groups SET checkpoint = ? WHERE batch_id = ? AND product_no = ?",
+                (json.dumps(checkpoint), batch_id, product_no),
+            )
+
+    def get_group_checkpoint(self, batch_id, product_no) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT checkpoint FROM job_groups WHERE batch_id = ? AND product_no = ?", (batch_id, product_no)
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def purge(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._transaction() as cur:
+            cur.execute(
+                "DELETE FROM job_groups WHERE batch_id IN (SELECT batch_id FROM jobs WHERE finished_at < ?)", (cutoff,)
+            )
+            removed = cur.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,)).rowcount
+        self._evicted += removed
+        return removed
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        try:
+            self.purge()
+        except sqlite3.Error as e:
+            logger.warning("Job store purge failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            jobs, finished = self._db.execute(
+                "SELECT COUNT(*), COUNT(finished_at) FROM jobs"
+            ).fetchone()
+        return {"backend": "sqlite", "path": self.path, "jobs": jobs, "finished": finished, "evicted": self._evicted, "ttl": self.ttl}
+
+
+def job_store_from_env() -> JobStore:
+    backend = os.getenv("OCR_JOB_STORE", "memory").lower()
+    ttl = float(os.getenv("OCR_JOB_TTL", 24 * 3600))
+    if backend == "sqlite":
+        return SQLiteJobStore(os.getenv("OCR_JOB_DB", "jobs.db"), ttl=ttl)
+    if backend != "memory":
+        raise ValueError(f"unknown OCR_JOB_STORE {backend!r}; use 'memory' or 'sqlite'")
+    return MemoryJobStore(ttl=ttl)
+
+
+job_store = job_store_from_env()
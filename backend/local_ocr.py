@@ -0,0 +1,97 @@
+# backend/local_ocr.py
+"""
+On-host OCR with Tesseract (used by ocr_engines.TesseractEngine).
+
+Kept free of FastAPI / Vision imports like imaging.py, because it runs
+inside process-pool workers. pytesseract and the tesseract binary are
+optional: without them `available()` is False and the pipeline stays on
+Google Vision.
+
+pytesseract (requirements.txt) only wraps the `tesseract` command, which
+is a system package: apt-get install tesseract-ocr (plus tesseract-ocr-<lang>
+for TESSERACT_LANG other than eng), brew install tesseract on macOS. It
+must be on PATH, or pytesseract.pytesseract.tesseract_cmd set to it.
+"""
+import io
+import os
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from imaging import open_upload
+from ocr_words import WordBoxes
+
+try:
+    import pytesseract
+except ImportError:  # pragma: no cover - optional dependency
+    pytesseract = None
+
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng")
+
+# page segmentation per OCR mode: one uniform block of text for "document"
+# (a nameplate), sparse text anywhere for "text"
+PSM = {"document": 6, "text": 11}
+
+_available: Optional[bool] = None
+
+
+def available() -> bool:
+    """pytesseract is installed and can run the tesseract binary."""
+    global _available
+    if _available is None:
+        if pytesseract is None:
+            _available = False
+        else:
+            try:
+                pytesseract.get_tesseract_version()
+                _available = True
+            except Exception:
+                _available = False
+    return _available
+
+
+def recognize(content: bytes, mode: str = "document", lang: str = TESSERACT_LANG) -> Tuple[str, Optional[float], WordBoxes]:
+    """
+    OCR one encoded image. Returns (text, confidence, words): text line by
+    line in reading order, confidence the mean word confidence in 0..1 (None
+    when no words were found), and the words with their boxes.
+    """
+    if pytesseract is None:
+        raise RuntimeError("pytesseract is not installed")
+    with Image.open(io.BytesIO(content)) as img:
+        gray = img.convert("L")
+
+    data = pytesseract.image_to_data(
+        gray,
+        lang=lang,
+        config=f"--psm {PSM.get(mode, 6)}",
+        output_type=pytesseract.Output.DICT,
+    )
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences: List[float] = []
+    words = WordBoxes()
+    for i, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        conf = float(data["conf"][i])
+        if not word or conf < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(conf)
+        left, top = data["left"][i], data["top"][i]
+        words.add(word, (left, top, left + data["width"][i], top + data["height"][i]), conf / 100.0)
+
+    text = "\n".join(" ".join(line) for line in lines.values())
+    confidence = sum(confidences) / len(confidences) / 100.0 if confidences else None
+    return text, confidence, words
+
+
+def quick_read(data: bytes, lang: str = TESSERACT_LANG) -> str:
+    """
+    Cheap read of an upload (decoded at half size, no preprocessing), enough
+    to check a near-duplicate's serial before reusing another image's OCR.
+    """
+    if pytesseract is None:
+        raise RuntimeError("pytesseract is not installed")
+    img = open_upload(data, max_scale=0.5).convert("L")
+    return pytesseract.image_to_string(img, lang=lang, config=f"--psm {PSM['document']}")
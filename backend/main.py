@@ -1,41 +1,84 @@
 # main.py
 from itertools import islice
+import asyncio
 import os
 import logging
-import socket
+import time
 import uuid
-import json
-from pathlib import Path
-from typing import List, Optional, Dict, Any
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, Tuple
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-from supabase import create_client, Client
 import httpx
-from google.cloud import vision_v1
-from google.oauth2 import service_account
-from PIL import Image, ImageEnhance, ImageOps
+from dotenv import load_dotenv
+from PIL import Image
 
+# load .env before the local modules below read their settings from the environment
 load_dotenv()
 
-# ─────────────────────────────
-# CONFIG
-# ─────────────────────────────
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("ROLE_KEY")
-SUPABASE_TABLE = "products"
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+import metrics
+from executors import pipeline_executor
+from imaging import encode_jpeg
+from job_scheduler import scheduler
+from job_events import EVENTS_POLL_INTERVAL, job_event_stream, job_events
+from job_store import FINISHED, job_store
+from near_dup import NEAR_DUP_MODE, REUSE_DISTANCE, near_dup_index
+from ocr_cache import ocr_cache
+from ocr_engines import ocr_engine
+from pipeline import (
+    SUPABASE_KEY,
+    SUPABASE_URL,
+    check_queue_setup,
+    finish_job,
+    make_warmup,
+    process_group,
+    supabase_writer,
+)
+from products_query import MAX_PAGE_SIZE, build_params, csv_header, csv_lines, ndjson_lines, parse_columns, split_page
+from upload_spool import upload_spool
+from upload_stream import iter_upload_files
+from vision_batcher import vision_batcher
+from vision_control import vision_controller
+from vision_client import vision_clients
+from work_queue import work_queue
 
-# Be careful in production — don't log secrets. These prints are helpful while debugging.
-print("SUPABASE_URL =", SUPABASE_URL)
-print("SUPABASE_SERVICE_ROLE (first 10) =", (SUPABASE_KEY[:10] if SUPABASE_KEY else None))
+if TYPE_CHECKING:
+    from supabase import Client
 
 logger = logging.getLogger("ndt-image")
 logger.setLevel(logging.INFO)
 
+# groups run in this process unless OCR_WORK_QUEUE hands them to worker.py
+check_queue_setup()
+warmup = make_warmup(ocr=work_queue is None)
+
+_supabase: Optional["Client"] = None
+
+
+def get_supabase() -> "Client":
+    """supabase-py client, created on first use (the OCR path writes through supabase_writer)."""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Be careful in production — don't log secrets.
+    logger.info("SUPABASE_URL = %s, service role key %s", SUPABASE_URL, "set" if SUPABASE_KEY else "missing")
+    warmup.start()
+    yield
+    await warmup.stop()
+    await supabase_writer.aclose()
+    pipeline_executor.shutdown()
 
-app = FastAPI(title="OCR Nameplate Backend")
+
+app = FastAPI(title="OCR Nameplate Backend", lifespan=lifespan)
 
 _allowed = os.environ.get("ALLOWED_ORIGINS") or os.environ.get("VERCEL_URL") or ""
 if _allowed:
@@ -45,13 +88,15 @@ else:
         "http://localhost:3000",
         "http://127.0.0.1:3000",
     ]
-print("Allowed origins:", origins)
+logger.info("Allowed origins: %s", origins)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,  # change if needed
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # /products pages: the browser may only read these cross-origin if exposed
+    expose_headers=["Link", "X-Next-Cursor"],
 )
 
 
@@ -60,356 +105,169 @@ def read_root():
     return {"ok": True}
 
 
-@app.get("/products")
-def list_products():
-    data = supabase.table("products").select("*").execute()
-    return data.data
-
-
-# ─────────────────────────────
-# IMAGE PROCESSING
-# ─────────────────────────────
-def preprocess_image_to_tmp(upload_path: str) -> str:
-    img = Image.open(upload_path)
-    img = ImageOps.exif_transpose(img).convert("RGB")
-    w, h = img.size
-    pad = int(min(w, h) * 0.01)
-    if pad > 0:
-        img = img.crop((pad, pad, w - pad, h - pad))
-
-    img = ImageEnhance.Contrast(img).enhance(1.3)
-    img = ImageEnhance.Sharpness(img).enhance(1.1)
-
-    tmp_path = "tmp_preprocessed.jpg"
-    img.save(tmp_path, quality=95)
-    return tmp_path
-
-
-def make_high_contrast(img: Image.Image) -> Image.Image:
-    g = img.convert("L")
-    g = ImageEnhance.Contrast(g).enhance(3.0)
-    g = ImageEnhance.Sharpness(g).enhance(2.5)
-    g = ImageOps.invert(g)
+async def _fetch_products_page(params: Dict[str, str]) -> List[Dict[str, Any]]:
+    """One PostgREST read over the writer's pooled client."""
+    if not supabase_writer.configured:
+        raise HTTPException(status_code=503, detail="Supabase not configured")
+    try:
+        resp = await supabase_writer.client().get(supabase_writer.endpoint, params=params)
+    except httpx.HTTPError as e:
+        logger.warning("Supabase read failed: %s", e)
+        raise HTTPException(status_code=502, detail=f"Supabase unreachable: {e}")
+    if resp.status_code != 200:
+        logger.warning("Supabase read failed status=%s body=%s", resp.status_code, resp.text)
+        raise HTTPException(status_code=502, detail=resp.text or f"Supabase returned {resp.status_code}")
+    return resp.json()
 
-    w, h = g.size
-    g = g.resize((w * 2, h * 2))
 
-    return g
+@app.get("/products")
+async def list_products(
+    request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    columns: Optional[str] = None,
+    batch_id: Optional[str] = None,
+    serial_number: Optional[str] = None,
+    model: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson|csv)$"),
+):
+    """
+    Products, newest first.
+
+    json: one page, as a plain array like before pagination. When there is
+    a next page, its cursor is in the X-Next-Cursor header (pass it back as
+    `cursor`) and its URL in a Link: <...>; rel="next" header; the last page
+    has neither. ndjson / csv: every matching row,
+    streamed page by page (limit is the page size). `columns` is a
+    comma-separated projection; raw_text is left out unless asked for.
+    serial_number and model match substrings, case-insensitively.
+    """
+    try:
+        cols = parse_columns(columns)
+        params = build_params(cols, limit, cursor, batch_id, serial_number, model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "json":
+        items, next_cursor = split_page(await _fetch_products_page(params), limit, cols)
+        headers = {}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+        return JSONResponse(items, headers=headers)
+
+    # fetch the first page up front so errors still come back as a proper status
+    first = await _fetch_products_page(params)
+
+    async def pages():
+        rows, next_cursor = split_page(first, limit, cols)
+        while True:
+            yield rows
+            if not next_cursor:
+                return
+            page_params = build_params(cols, limit, next_cursor, batch_id, serial_number, model)
+            rows, next_cursor = split_page(await _fetch_products_page(page_params), limit, cols)
+
+    if format == "ndjson":
+        async def body():
+            async for rows in pages():
+                yield "".join(ndjson_lines(rows))
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    async def body():
+        yield csv_header(cols)
+        async for rows in pages():
+            yield "".join(csv_lines(rows, cols))
+
+    return StreamingResponse(
+        body(),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="products.csv"'},
+    )
 
 
 # ─────────────────────────────
-#  VISION OCR
+#  OCR (engine chosen by OCR_ENGINE, see ocr_engines.py)
 # ─────────────────────────────
 def get_vision_client():
-    """
-    Create a Google Vision client.
+    """Shared, process-wide Vision client (see vision_client.VisionClientManager)."""
+    return vision_clients.get()
 
-    Preferred: set GOOGLE_APPLICATION_CREDENTIALS_JSON env var to the JSON contents of
-    the service account key (safe when stored in Render as a secret).
-    Fallback: use default ADC (e.g., GOOGLE_APPLICATION_CREDENTIALS file on local dev).
-    """
-    creds_json = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-    # Only try to load if it looks like real JSON data (starts with {) and isn't just whitespace
-    if creds_json and creds_json.strip() and creds_json.strip().startswith("{"):
-        try:
-            info = json.loads(creds_json)
-            credentials = service_account.Credentials.from_service_account_info(info)
-            client = vision_v1.ImageAnnotatorClient(credentials=credentials)
-            logger.info("Vision client created from GOOGLE_APPLICATION_CREDENTIALS_JSON")
-            return client
-        except Exception as e:
-            logger.exception("Failed to create Vision client from env JSON: %s", e)
-            # Don't raise here; fall back to trying file-based credentials if JSON failed/was garbage
-            logger.warning("Falling back to file-based credentials due to JSON error.")
-
-    # DEBUG: print all GOOGLE_ keys to see what is loaded
-    for k, v in os.environ.items():
-        if k.startswith("GOOGLE_"):
-            print(f"DEBUG ENV: {k} = {v}")
-
-    # fallback to application default credentials (useful for local dev when GOOGLE_APPLICATION_CREDENTIALS points to a file)
-    try:
-        # HARDCODED FALLBACK: If env var is missing, try the known file in root
-        if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
-            hardcoded_path = os.path.abspath("../image-extract-476710-c6a143e5254f.json")
-            if os.path.exists(hardcoded_path):
-                logger.info("Setting GOOGLE_APPLICATION_CREDENTIALS to hardcoded path: %s", hardcoded_path)
-                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = hardcoded_path
-
-        client = vision_v1.ImageAnnotatorClient()
-        logger.info("Vision client created using default credentials")
-        return client
-    except Exception as e:
-        logger.exception("Failed to create Vision client using default credentials: %s", e)
-        raise
+
+def ocr_content(content: bytes, mode="document") -> str:
+    """Blocking OCR of already-encoded image bytes with the configured engine."""
+    return ocr_engine.recognize(content, mode).text
 
 
 def ocr_image(pil_img: Image.Image, mode="document") -> str:
-    tmp = "tmp_to_vision.jpg"
-    pil_img.save(tmp, quality=95)
+    return ocr_content(encode_jpeg(pil_img), mode=mode)
 
-    with open(tmp, "rb") as f:
-        content = f.read()
 
-    # use vision_v1.Image wrapper
-    image = vision_v1.types.Image(content=content)
-    client = get_vision_client()
+# ─────────────────────────────
+# JOB STORAGE (see job_store.py)
+# ─────────────────────────────
+# wake up /ocr-job/{id}/events streams whenever this process changes a job
+job_store.add_listener(job_events.notify)
+MAX_FILE_BYTES = int(os.getenv("OCR_MAX_FILE_BYTES", 25 * 1024 * 1024))
+# keep references to running batch tasks so they are not garbage collected
+_BATCH_TASKS: set = set()
+
+
+def chunked(iterable, n):
+    """helper to iterate in chunks of size n"""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, n))
+        if not chunk:
+            break
+        yield chunk
 
-    if mode == "document":
-        resp = client.document_text_detection(image=image)
-        if resp.error.message:
-            raise Exception(resp.error.message)
-        if resp.full_text_annotation:
-            return resp.full_text_annotation.text or ""
-        return ""
 
-    else:
-        resp = client.text_detection(image=image)
-        if resp.error.message:
-            raise Exception(resp.error.message)
-        if resp.text_annotations:
-            return resp.text_annotations[0].description
-        return ""
+# job store calls from handlers go through the IO pool (see job_store.JobStore)
+async def _new_job(batch_id: str, status: str = "queued") -> Dict[str, Any]:
+    return await pipeline_executor.run_io(job_store.create, batch_id, status)
 
 
-# ─────────────────────────────
-# PARSER HELPERS
-# ─────────────────────────────
-def is_valid_line(line: str) -> bool:
+async def _start_group(batch_id: str, group: List[Tuple[str, bytes]]) -> Optional[asyncio.Task]:
     """
-    Returns False if the line looks like OCR noise/garbage.
-    Heuristic: high ratio of symbols vs alphanumeric, or very long tokens.
+    Register the next group of the batch and hand it to the scheduler - or,
+    in worker mode, spool its images and put it on the work queue (no task
+    then). Inline groups stay in memory; process_group spools the ones that
+    fail, for /ocr-job/{id}/resume.
     """
-    s = line.strip()
-    if not s:
-        return False
-    
-    # If it's very long with no spaces, it's likely noise
-    if len(s) > 40 and " " not in s:
-        return False
-
-    # Count alphanumeric vs "bad" symbols
-    # Allowed symbols in normal text: space, ., -, /, (, ), :, "
-    allowed_symbols = " .-/:()\"'"
-    bad_count = sum(1 for c in s if not c.isalnum() and c not in allowed_symbols)
-    
-    # If more than 30% of characters are weird symbols, reject it
-    if len(s) > 5 and (bad_count / len(s)) > 0.3:
-        return False
-
-    return True
-
-
-def normalize_lines(txt: str) -> List[str]:
-    # split lines, then filter out garbage
-    lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
-    return [ln for ln in lines if is_valid_line(ln)]
-
-
-def looks_like_casting(line: str) -> bool:
-    s = line.strip()
-    if not s:
-        return False
-
-    up = s.upper()
-    # "T(" is often start of Temp, but if it has no digits it might be noise.
-    # We'll rely on extract_fields strictness for that.
-    
-    plate_starters = ("SN", "S/N", "MODEL", "DN", "PN", "PT", "BODY", "DISC", "SEAT", "DATE", "WWW.")
-    if up.startswith(plate_starters):
-        return False
-
-    if " " not in up and 2 <= len(up) <= 8:
-        return True
-
-    return False
-
-
-def extract_fields(lines: List[str]) -> dict:
-    data = {
-        "serial_number": None,
-        "model": None,
-        "dn": None,
-        "pn": None,
-        "pt": None,
-        "body": None,
-        "disc": None,
-        "seat": None,
-        "temp": None,
-        "date": None,
-    }
-
-    for ln in lines:
-        up = ln.upper().strip()
-
-        if data["serial_number"] is None and ("SN " in up or up.startswith("SN") or "S/N" in up):
-            data["serial_number"] = ln
-            continue
-
-        if data["model"] is None and up.startswith("MODEL"):
-            parts = ln.split(None, 1)
-            data["model"] = parts[1] if len(parts) > 1 else ln
-            continue
-
-        if data["dn"] is None and (up.startswith("DN")):
-            data["dn"] = ln
-            continue
-
-        if data["pn"] is None and (up.startswith("PN")):
-            data["pn"] = ln
-            continue
-
-        if data["pt"] is None and (up.startswith("PT")):
-            data["pt"] = ln
-            continue
-
-        if data["body"] is None and "BODY" in up:
-            data["body"] = ln
-            continue
-
-        if data["disc"] is None and "DISC" in up:
-            data["disc"] = ln
-            continue
-
-        if data["seat"] is None and "SEAT" in up:
-            data["seat"] = ln
-            continue
-
-        # STRICTER TEMP CHECK: must contain digits to be a valid temperature
-        if data["temp"] is None and ("T(" in up or "°C" in up or up.startswith("T°")):
-            if any(c.isdigit() for c in ln):
-                data["temp"] = ln
-            continue
-
-        if data["date"] is None and up.startswith("DATE"):
-            data["date"] = (
-                ln.replace("DATE", "", 1)
-                  .replace("Date", "", 1)
-                  .replace("date", "", 1)
-                  .strip()
-            )
-            continue
-
-    return data
-
-
-def try_fill_from_casting(parsed: dict, casting_lines: List[str]) -> dict:
-    up_lines = [c.upper() for c in casting_lines]
-
-    if not parsed.get("dn"):
-        for u in up_lines:
-            if u.startswith("DN"):
-                parsed["dn"] = u
-                break
-
-    cf8m = None
-    for u, raw in zip(up_lines, casting_lines):
-        if "CF8M" in u.replace("-", "").replace(" ", ""):
-            cf8m = raw
-            break
-
-    if cf8m:
-        parsed.setdefault("disc", cf8m)
-        parsed.setdefault("body", cf8m)
+    product_no = await pipeline_executor.run_io(job_store.add_group, batch_id, [name for name, _ in group])
+    if work_queue is not None:
+        # a worker can only get the images from the spool
+        with metrics.span("spool_write"):
+            await pipeline_executor.run_io(upload_spool.save_group, batch_id, product_no, group)
+    return await _dispatch(batch_id, product_no, group)
 
-    if not parsed.get("model"):
-        for u, raw in zip(up_lines, casting_lines):
-            if u == "TTV":
-                parsed["model"] = "TTV"
-                break
 
-    return parsed
+async def _dispatch(batch_id: str, product_no: int, group: Optional[List[Tuple[str, bytes]]] = None) -> Optional[asyncio.Task]:
+    if work_queue is not None:
+        await pipeline_executor.run_io(work_queue.put, batch_id, product_no)
+        return None
+    return scheduler.submit(process_group(batch_id, product_no, group))
 
 
-# ─────────────────────────────
-# SUPABASE INSERT (REST API)
-# ─────────────────────────────
-async def insert_product_to_supabase(
-    batch_id: str,
-    product_no: int,
-    parsed: dict,
-    raw_text: str,
-    casting_lines: Optional[List[str]] = None,
-    images_json: Optional[List[Dict[str, Any]]] = None,
-) -> dict:
-    """
-    Async-safe supabase insert with robust error handling and logging.
-    Returns dict with ok: True/False and details.
-    """
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        logger.error("Supabase not configured (missing SUPABASE_URL or SUPABASE_KEY)")
-        return {"ok": False, "reason": "Supabase not configured"}
-
-    casting_lines = casting_lines or []
-    images_json = images_json or []
-    casting_summary = ", ".join(casting_lines)
-
-    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/{SUPABASE_TABLE}"
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation",
-    }
-    payload = {
-        "batch_id": batch_id,
-        "product_no": product_no,
-        "serial_number": parsed.get("serial_number"),
-        "model": parsed.get("model"),
-        "dn": parsed.get("dn"),
-        "pn": parsed.get("pn"),
-        "pt": parsed.get("pt"),
-        "body": parsed.get("body"),
-        "disc": parsed.get("disc"),
-        "seat": parsed.get("seat"),
-        "temp": parsed.get("temp"),
-        "raw_text": raw_text,
-        "casting_lines": casting_lines,
-        "images_json": images_json,
-        "casting_summary": casting_summary,
-    }
+def _unfinished_groups(job: Dict[str, Any]) -> List[int]:
+    """Groups of a job that failed, never ran, or whose row didn't make it into Supabase."""
+    inserted = {r["product_no"] for r in job["results"] if (r.get("supabase") or {}).get("ok")}
+    return [g["product_no"] for g in job["groups"] if g["status"] != "done" or g["product_no"] not in inserted]
 
-    # Log the call for debugging (avoid logging secret keys in production)
-    logger.info("POST to Supabase URL: %s (product_no=%s, batch_id=%s)", url, product_no, batch_id)
 
-    try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            resp = await client.post(url, headers=headers, json=payload)
-            text = resp.text
-            status = resp.status_code
-            logger.info("Supabase response status=%s", status)
-            if 200 <= status < 300:
-                try:
-                    data = resp.json()
-                except Exception:
-                    data = text
-                return {"ok": True, "data": data}
-            else:
-                logger.warning("Supabase insert failed status=%s body=%s", status, text)
-                return {"ok": False, "status": status, "body": text}
-    except httpx.ConnectError as e:
-        # DNS or connection problem
-        logger.exception("httpx.ConnectError while POSTing to Supabase: %s", e)
-        return {"ok": False, "reason": "connect_error", "error": str(e)}
-    except httpx.ReadTimeout as e:
-        logger.exception("httpx.ReadTimeout while contacting Supabase: %s", e)
-        return {"ok": False, "reason": "timeout", "error": str(e)}
-    except socket.gaierror as e:
-        logger.exception("socket.gaierror (DNS) while contacting Supabase: %s", e)
-        return {"ok": False, "reason": "dns_error", "error": str(e)}
-    except Exception as e:
-        logger.exception("Unexpected error while contacting Supabase: %s", e)
-        return {"ok": False, "reason": "unexpected", "error": str(e)}
+async def _finish_batch(batch_id: str, tasks: List[Optional[asyncio.Task]]) -> None:
+    # in worker mode there are no tasks here: the worker finishing the last group closes the job
+    await asyncio.gather(*(t for t in tasks if t is not None), return_exceptions=True)
+    await pipeline_executor.run_io(finish_job, batch_id)
 
 
-# ─────────────────────────────
-# OCR BULK ENDPOINT
-# ─────────────────────────────
+def _run_in_background(coro) -> None:
+    task = asyncio.ensure_future(coro)
+    _BATCH_TASKS.add(task)
+    task.add_done_callback(_BATCH_TASKS.discard)
 
-# ─────────────────────────────
-# JOB STORAGE (In-Memory)
-# ─────────────────────────────
-JOBS = {}
 
 @app.post("/ocr-bulk")
 async def ocr_bulk(files: List[UploadFile] = File(...)):
@@ -417,126 +275,86 @@ async def ocr_bulk(files: List[UploadFile] = File(...)):
     Treat every 3 images as 1 product:
     - 1 row in Supabase per group of up to 3 images.
     - OCR + parse each image, then aggregate within the group.
+
+    The upload is accepted and handed to the group scheduler (or the OCR
+    workers); the batch_id is returned right away. Poll /ocr-job/{batch_id}
+    for per-group progress.
+    """
+    batch_id = str(uuid.uuid4())
+
+    # UploadFile objects are closed once the response is sent, so read them now
+    images: List[Tuple[str, bytes]] = []
+    for file in files:
+        with metrics.span("upload_read"):
+            images.append((file.filename, await file.read()))
+
+    await _new_job(batch_id)
+    # one after another, so product numbers follow the upload order
+    tasks = [await _start_group(batch_id, group) for group in chunked(images, 3)]
+    _run_in_background(_finish_batch(batch_id, tasks))
+
+    return {"batch_id": batch_id, "status": "queued", "groups": len(tasks)}
+
+
+@app.post("/ocr-bulk/stream")
+async def ocr_bulk_stream(request: Request):
+    """
+    Streaming variant of /ocr-bulk (same multipart "files" field).
+
+    The body is parsed as it arrives and each 3-image group is scheduled as
+    soon as its images are in, so OCR overlaps with the rest of the upload.
+    Reading pauses while the scheduler is saturated, which keeps memory
+    bounded by the number of concurrent groups instead of the batch size.
+    (In worker mode each group goes to the spool and the work queue, so
+    nothing piles up here.)
     """
-    import traceback
+    batch_id = str(uuid.uuid4())
+    await _new_job(batch_id, status="receiving")
+    tasks: List[Optional[asyncio.Task]] = []
+    group: List[Tuple[str, bytes]] = []
+
     try:
-        batch_id = str(uuid.uuid4())
-        # Initialize job status
-        JOBS[batch_id] = {"status": "processing", "results": []}
-        
-        results = []
-        product_no = 1
-
-        # helper to iterate in chunks of size n
-        def chunked(iterable, n):
-            it = iter(iterable)
-            while True:
-                chunk = list(islice(it, n))
-                if not chunk:
-                    break
-                yield chunk
-
-        # Group incoming files 3-by-3
-        for group in chunked(files, 3):
-            group_texts: List[str] = []
-            group_casting: List[str] = []
-            group_plate_lines: List[str] = []
-            group_images_json: List[Dict[str, Any]] = []
-            group_results = []
-
-            # OCR each file in this group
-            for file in group:
-                tmp_path = f"upload_{uuid.uuid4()}.jpg"
-                try:
-                    with open(tmp_path, "wb") as f:
-                        f.write(await file.read())
-
-                    preprocessed = preprocess_image_to_tmp(tmp_path)
-                    pil_img = Image.open(preprocessed)
-
-                    text1 = ocr_image(pil_img, mode="document")
-                    hc = make_high_contrast(pil_img)
-                    text2 = ocr_image(hc, mode="document")
-
-                    raw_text = (text1 or "") + "\n" + (text2 or "")
-                    lines = normalize_lines(raw_text)
-                    casting = [ln for ln in lines if looks_like_casting(ln)]
-                    plate_lines = [ln for ln in lines if not looks_like_casting(ln)]
-
-                    group_texts.append(raw_text)
-                    group_casting.extend(casting)
-                    group_plate_lines.extend(plate_lines)
-                    group_images_json.append({"filename": file.filename})
-
-                    # per-image debug info (not inserted)
-                    group_results.append(
-                        {
-                            "file": file.filename,
-                            "raw_text": raw_text,
-                            "casting_lines": casting,
-                        }
-                    )
-                finally:
-                    try:
-                        if os.path.exists(tmp_path):
-                            os.remove(tmp_path)
-                    except Exception:
-                        pass
-
-            # Now parse once per group (all plate lines merged)
-            parsed = extract_fields(group_plate_lines)
-            parsed = try_fill_from_casting(parsed, group_casting)
-
-            # Join all texts and unique casting lines
-            combined_raw_text = "\n\n".join(group_texts)
-            unique_casting = list(dict.fromkeys(group_casting))  # preserve order
-
-            # Insert ONE row into Supabase for this group
-            supabase_res = await insert_product_to_supabase(
-                batch_id=batch_id,
-                product_no=product_no,
-                parsed=parsed,
-                raw_text=combined_raw_text,
-                casting_lines=unique_casting,
-                images_json=group_images_json,
-            )
-
-            results.append(
-                {
-                    "product_no": product_no,
-                    "files": [r["file"] for r in group_results],
-                    "parsed": parsed,
-                    "casting_lines": unique_casting,
-                    "supabase": supabase_res,
-                    "images": group_images_json,
-                }
-            )
-
-            product_no += 1
-
-        response_data = {
-            "batch_id": batch_id,
-            "count": len(results),  # number of products (groups)
-            "results": results,
-            "status": "done"
-        }
-        
-        # Update job storage
-        JOBS[batch_id] = response_data
-        
-        return response_data
-        
+        t0 = time.perf_counter()
+        async for filename, data in iter_upload_files(request, "files", MAX_FILE_BYTES):
+            # time spent receiving/parsing this file's part of the body
+            metrics.observe("upload_read", time.perf_counter() - t0)
+            group.append((filename, data))
+            if len(group) == 3:
+                with metrics.span("backpressure_wait"):
+                    await scheduler.wait_for_capacity()
+                tasks.append(await _start_group(batch_id, group))
+                group = []
+            t0 = time.perf_counter()
+        if group:
+            tasks.append(await _start_group(batch_id, group))
     except Exception as e:
-        logger.error("CRITICAL ERROR in /ocr-bulk: %s", e)
-        traceback.print_exc()
-        if 'batch_id' in locals():
-            JOBS[batch_id] = {"status": "failed", "error": str(e)}
-        raise HTTPException(status_code=500, detail=str(e))
+        # groups that were already received keep running; the job ends up failed
+        logger.warning("Upload of batch %s interrupted: %s", batch_id, e)
+        intake_error = getattr(e, "detail", None) or f"upload interrupted: {e}"
+        await pipeline_executor.run_io(job_store.update, batch_id, intake_error=intake_error)
+        _run_in_background(_finish_batch(batch_id, tasks))
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=400, detail=intake_error)
+
+    if not tasks:
+        await pipeline_executor.run_io(job_store.update, batch_id, status="failed", error="no files uploaded")
+        raise HTTPException(status_code=400, detail="No files uploaded")
+
+    job = await pipeline_executor.run_io(job_store.get, batch_id, include_results=False)
+    status = job["status"]
+    if status == "receiving":
+        status = "processing" if job["progress"]["queued"] < len(tasks) else "queued"
+        await pipeline_executor.run_io(job_store.update, batch_id, status=status)
+    _run_in_background(_finish_batch(batch_id, tasks))
+
+    return {"batch_id": batch_id, "status": status, "groups": len(tasks)}
 
 
 @app.get("/ocr-job/{job_id}")
 def get_job_status(job_id: str):
-    job = JOBS.get(job_id)
+    # a plain def: FastAPI runs it in its thread pool, off the event loop
+    job = job_store.get(job_id)
     if not job:
         # If job not found, return failed 404 or just a "not found" status 
         # to prevent frontend crash loop, we return 404
@@ -544,9 +362,101 @@ def get_job_status(job_id: str):
     return job
 
 
+def _requeue(batch_id: str, product_nos: List[int]) -> None:
+    for product_no in product_nos:
+        job_store.set_group_status(batch_id, product_no, "queued")
+    job_store.update(batch_id, status="processing", error=None)
+
+
+@app.post("/ocr-job/{job_id}/resume")
+async def resume_job(job_id: str):
+    """
+    Run the unfinished groups of a finished job again: failed groups, and
+    groups whose Supabase insert failed. Groups whose OCR finished are only
+    inserted (from their checkpoint); the rest are OCR'd from the spooled
+    upload. Rows are upserted on (batch_id, product_no), so a group that
+    was inserted before is not duplicated. Poll /ocr-job/{id} as usual.
+    """
+    job = await pipeline_executor.run_io(job_store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}; resume it once it has finished")
+
+    product_nos = _unfinished_groups(job)
+    if not product_nos:
+        return {"batch_id": job_id, "status": job["status"], "resumed": []}
+
+    # queued again before anything runs, so the job can't be closed while some are still waiting
+    await pipeline_executor.run_io(_requeue, job_id, product_nos)
+    tasks = [await _dispatch(job_id, product_no) for product_no in product_nos]
+    _run_in_background(_finish_batch(job_id, tasks))
+    logger.info("Resuming %d of %d groups of batch %s", len(product_nos), len(job["groups"]), job_id)
+    return {"batch_id": job_id, "status": "processing", "resumed": product_nos}
+
+
+@app.get("/ocr-job/{job_id}/events")
+async def job_events_stream(job_id: str):
+    """
+    Server-sent events for one job: a snapshot, then a small event per group
+    as it changes, then a final "done" summary (see job_events.py).
+    """
+    if await pipeline_executor.run_io(job_store.get, job_id, include_results=False) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job_event_stream(job_store, job_events, job_id, poll_interval=EVENTS_POLL_INTERVAL),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ─────────────────────────────
 # HEALTH CHECK
 # ─────────────────────────────
 @app.get("/health")
 def root_health():
     return {"status": "OK", "message": "OCR backend live"}
+
+
+@app.get("/ready")
+def readiness():
+    """200 once the startup warmup has finished (failed steps are listed), 503 before."""
+    return JSONResponse(warmup.stats(), status_code=200 if warmup.ready else 503)
+
+
+@app.get("/stats")
+def pipeline_stats():
+    return {
+        "scheduler": scheduler.stats(),
+        "executor": pipeline_executor.stats(),
+        "vision": vision_clients.stats(),
+        "vision_batches": vision_batcher.stats(),
+        "vision_control": vision_controller.stats(),
+        "ocr_engine": ocr_engine.stats(),
+        "ocr_cache": ocr_cache.stats(),
+        "near_duplicates": dict(near_dup_index.stats(), mode=NEAR_DUP_MODE, reuse_distance=REUSE_DISTANCE),
+        "jobs": job_store.stats(),
+        "job_events": job_events.stats(),
+        "supabase_writer": supabase_writer.stats(),
+        "upload_spool": upload_spool.stats(),
+        "work_queue": work_queue.stats() if work_queue is not None else {"backend": "inline"},
+        "warmup": warmup.stats(),
+    }
+
+
+# ─────────────────────────────
+# METRICS (Prometheus text format, see metrics.py; the pipeline's own are in pipeline.py)
+# ─────────────────────────────
+metrics.registry.gauge("ocr_scheduler_running_groups", "Groups being processed.", lambda: scheduler.running)
+metrics.registry.gauge("ocr_scheduler_waiting_groups", "Groups queued for a scheduler slot.", lambda: scheduler.waiting)
+if work_queue is not None:
+    metrics.registry.labelled(
+        "ocr_work_queue_tasks", "Group tasks waiting for / claimed by an OCR worker.", "state",
+        lambda: {k: v for k, v in work_queue.stats().items() if k in ("queued", "claimed")},
+    )
+metrics.registry.gauge("ocr_job_event_streams", "Open /ocr-job/{id}/events streams.", lambda: job_events.stats()["streams"])
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
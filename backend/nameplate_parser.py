@@ -0,0 +1,398 @@
+# backend/nameplate_parser.py
+"""
+Nameplate field extraction, driven by a rule table.
+
+Each rule names a field, the label tokens that trigger it (at the start of
+the line or anywhere in it), an optional validator and an optional
+post-processor. All tokens are compiled into one regex, so each line is
+classified with a single scan: which rules it triggers and whether it looks
+like a casting mark. Classifications are cached per line text, since the
+same lines come back from every OCR pass.
+
+Lines are matched the way the original if-chain did it: the first rule (in
+table order) whose field is still empty claims the line. A claimed line is
+not offered to later rules even if the validator rejects it.
+
+When the OCR engine gives word boxes (ocr_words.WordBoxes), parse_words()
+reads the plate by layout instead: each label word is paired with the
+words to its right, or with the value printed under it, so "DN 50 PN 16"
+on one line gives both fields. Low-confidence words are dropped first.
+Fields the layout pass can't place are filled by the line rules, and
+layout_plausible() tells when the layout got it wrong and the line parse of
+the engine's own text is the better answer.
+"""
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ocr_words import WordBoxes
+
+
+class Rule:
+    def __init__(
+        self,
+        field: str,
+        starts: Sequence[str] = (),
+        contains: Sequence[str] = (),
+        validate: Optional[Callable[[str], bool]] = None,
+        post: Optional[Callable[[str], str]] = None,
+    ):
+        self.field = field
+        self.starts = tuple(starts)
+        self.contains = tuple(contains)
+        self.validate = validate
+        self.post = post
+
+    def __repr__(self) -> str:
+        return f"Rule({self.field!r})"
+
+
+def _has_digit(ln: str) -> bool:
+    return any(c.isdigit() for c in ln)
+
+
+def _after_label(ln: str) -> str:
+    parts = ln.split(None, 1)
+    return parts[1] if len(parts) > 1 else ln
+
+
+def _strip_date_label(ln: str) -> str:
+    return ln.replace("DATE", "", 1).replace("Date", "", 1).replace("date", "", 1).strip()
+
+
+# tokens are matched against the upper-cased, stripped line
+RULES: Tuple[Rule, ...] = (
+    Rule("serial_number", starts=("SN",), contains=("SN ", "S/N")),
+    Rule("model", starts=("MODEL",), post=_after_label),
+    Rule("dn", starts=("DN",)),
+    Rule("pn", starts=("PN",)),
+    Rule("pt", starts=("PT",)),
+    Rule("body", contains=("BODY",)),
+    Rule("disc", contains=("DISC",)),
+    Rule("seat", contains=("SEAT",)),
+    # a temperature without digits is OCR noise
+    Rule("temp", starts=("T°",), contains=("T(", "°C"), validate=_has_digit),
+    Rule("date", starts=("DATE",), post=_strip_date_label),
+)
+
+# a short single token is a casting mark unless it starts like a plate label
+PLATE_STARTERS = ("SN", "S/N", "MODEL", "DN", "PN", "PT", "BODY", "DISC", "SEAT", "DATE", "WWW.")
+CASTING_MIN_LEN = 2
+CASTING_MAX_LEN = 8
+
+
+# ─────────────────────────────
+# LINE FILTERING
+# ─────────────────────────────
+def is_valid_line(line: str) -> bool:
+    """
+    Returns False if the line looks like OCR noise/garbage.
+    Heuristic: high ratio of symbols vs alphanumeric, or very long tokens.
+    """
+    s = line.strip()
+    if not s:
+        return False
+
+    # If it's very long with no spaces, it's likely noise
+    if len(s) > 40 and " " not in s:
+        return False
+
+    # Count alphanumeric vs "bad" symbols
+    # Allowed symbols in normal text: space, ., -, /, (, ), :, "
+    allowed_symbols = " .-/:()\"'"
+    bad_count = sum(1 for c in s if not c.isalnum() and c not in allowed_symbols)
+
+    # If more than 30% of characters are weird symbols, reject it
+    if len(s) > 5 and (bad_count / len(s)) > 0.3:
+        return False
+
+    return True
+
+
+def normalize_lines(txt: str) -> List[str]:
+    # split lines, then filter out garbage
+    lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
+    return [ln for ln in lines if is_valid_line(ln)]
+
+
+# ─────────────────────────────
+# PARSER
+# ─────────────────────────────
+class NameplateParser:
+    def __init__(self, rules: Sequence[Rule] = RULES, plate_starters: Sequence[str] = PLATE_STARTERS, cache_size: int = 16384):
+        self.rules = tuple(rules)
+        self.fields = tuple(r.field for r in self.rules)
+        self.cache_size = cache_size
+        self._cache: Dict[str, Tuple[Tuple[int, ...], bool]] = {}
+
+        # per token: rule bits when seen at position 0 / elsewhere, and whether it marks a plate line
+        starts: Dict[str, int] = {}
+        contains: Dict[str, int] = {}
+        for i, rule in enumerate(self.rules):
+            for tok in rule.starts:
+                starts[tok] = starts.get(tok, 0) | (1 << i)
+            for tok in rule.contains:
+                contains[tok] = contains.get(tok, 0) | (1 << i)
+        tokens = set(starts) | set(contains) | set(plate_starters)
+
+        # The regex reports one token per position: the longest, as alternatives
+        # are tried longest first. Any shorter token matching at the same
+        # position is a prefix of it, so fold prefixes into each token's masks.
+        self._at_start: Dict[str, int] = {}
+        self._anywhere: Dict[str, int] = {}
+        self._plate_start: Dict[str, bool] = {}
+        for tok in tokens:
+            prefixes = [p for p in tokens if tok.startswith(p)]
+            self._anywhere[tok] = _or(contains.get(p, 0) for p in prefixes)
+            self._at_start[tok] = self._anywhere[tok] | _or(starts.get(p, 0) for p in prefixes)
+            self._plate_start[tok] = any(p in plate_starters for p in prefixes)
+
+        alternation = "|".join(re.escape(t) for t in sorted(tokens, key=len, reverse=True))
+        # lookahead so overlapping tokens (e.g. "SEAT(" -> SEAT and T() are all seen
+        self._scan = re.compile(f"(?=({alternation}))").finditer
+
+    def classify(self, line: str) -> Tuple[Tuple[int, ...], bool]:
+        """(indices of the rules the line triggers, in table order; looks like a casting mark)"""
+        hit = self._cache.get(line)
+        if hit is not None:
+            return hit
+
+        up = line.upper().strip()
+        mask = 0
+        plate_start = False
+        for m in self._scan(up):
+            tok = m.group(1)
+            if m.start() == 0:
+                mask |= self._at_start[tok]
+                plate_start = self._plate_start[tok]
+            else:
+                mask |= self._anywhere[tok]
+
+        rule_ids = tuple(i for i in range(len(self.rules)) if mask >> i & 1)
+        casting = not plate_start and " " not in up and CASTING_MIN_LEN <= len(up) <= CASTING_MAX_LEN
+        hit = (rule_ids, casting)
+
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[line] = hit
+        return hit
+
+    def looks_like_casting(self, line: str) -> bool:
+        return self.classify(line)[1]
+
+    def split_lines(self, lines: Sequence[str]) -> Tuple[List[str], List[str]]:
+        """(plate lines, casting lines), each in input order."""
+        plate: List[str] = []
+        casting: List[str] = []
+        for ln in lines:
+            (casting if self.classify(ln)[1] else plate).append(ln)
+        return plate, casting
+
+    def extract_fields(self, lines: Sequence[str]) -> Dict[str, Optional[str]]:
+        data: Dict[str, Optional[str]] = dict.fromkeys(self.fields)
+        remaining = len(self.fields)
+        for ln in lines:
+            for i in self.classify(ln)[0]:
+                rule = self.rules[i]
+                if data[rule.field] is not None:
+                    continue
+                if rule.validate is None or rule.validate(ln):
+                    data[rule.field] = rule.post(ln) if rule.post else ln
+                    remaining -= 1
+                break
+            if not remaining:
+                break
+        return data
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        """Normalize OCR text, split plate / casting lines and extract fields from the plate lines."""
+        plate, casting = self.split_lines(normalize_lines(text))
+        return {"fields": self.extract_fields(plate), "plate_lines": plate, "casting_lines": casting}
+
+
+# ─────────────────────────────
+# LAYOUT (word boxes)
+# ─────────────────────────────
+MIN_WORD_CONFIDENCE = float(os.getenv("OCR_MIN_WORD_CONFIDENCE", "0.5"))
+
+# label words -> field; a label may be glued to its value ("DN50", "PN:16")
+LABEL_WORDS = {
+    "SN": "serial_number", "S/N": "serial_number", "S.N": "serial_number", "SERIAL": "serial_number",
+    "MODEL": "model",
+    "DN": "dn", "PN": "pn", "PT": "pt",
+    "BODY": "body", "DISC": "disc", "SEAT": "seat",
+    "TEMP": "temp", "T": "temp",
+    "DATE": "date",
+}
+_GLUED = re.compile(r"^(S/N|SN|DN|PN|PT)[:.]?(\d\S*)$")
+# words after SERIAL that are still its label: "SERIAL NO.", "SERIAL # SN"
+_SERIAL_TAIL = ("NO", "#", "NR", "NUMBER", "SN", "S/N", "S.N")
+_TEMP_LABEL = re.compile(r"^T?\(?(°C|℃|°F|C)\)?$|^T\(")
+
+
+class LayoutParser:
+    """Pairs label words with their values using the word boxes."""
+
+    def __init__(self, line_parser: "NameplateParser", min_confidence: float = MIN_WORD_CONFIDENCE):
+        self.line_parser = line_parser
+        self.min_confidence = min_confidence
+        self.rules = {r.field: r for r in line_parser.rules}
+
+    @staticmethod
+    def label(words: WordBoxes, line: List[int], k: int) -> Optional[Tuple[str, int, Optional[str]]]:
+        """(field, words the label uses, value glued to it) when line[k] starts a label."""
+        raw = words.texts[line[k]]
+        up = raw.upper().rstrip(":.")
+        glued = _GLUED.match(up)
+        if glued:
+            return LABEL_WORDS[glued.group(1)], 1, raw[len(raw) - len(glued.group(2)):]
+        if up == "T" or up.startswith("T(") or up.startswith("T°"):
+            # "T (°C)" / "T(°C)" / "T°C"; a lone T must be followed by its unit
+            if up == "T":
+                nxt = words.texts[line[k + 1]].upper() if k + 1 < len(line) else ""
+                if not _TEMP_LABEL.match(nxt):
+                    return None
+                return "temp", 2, None
+            return "temp", 1, None
+        if up == "SERIAL":
+            used = 1
+            while k + used < len(line) and words.texts[line[k + used]].upper().rstrip(":.") in _SERIAL_TAIL:
+                used += 1
+            if k + used < len(line) and _GLUED.match(words.texts[line[k + used]].upper().rstrip(":.")):
+                return None  # "SERIAL NO SN2231": the glued SN word is the label
+            return "serial_number", used, None
+        field = LABEL_WORDS.get(up)
+        return (field, 1, None) if field else None
+
+    def _below(self, words: WordBoxes, lines: List[List[int]], li: int, box) -> List[int]:
+        """Words of the nearest following line that sit under the label."""
+        x0, y0, x1, y1 = box
+        h = max(1, y1 - y0)
+        for line in lines[li + 1:li + 3]:
+            top = min(words.box(i)[1] for i in line)
+            if top - y1 > 1.5 * h:
+                break
+            under = [i for i in line if words.box(i)[0] < x1 + h and words.box(i)[2] > x0 - h]
+            if under:
+                return under
+        return []
+
+    def parse(self, words: WordBoxes) -> Dict[str, Any]:
+        words = words.filter(self.min_confidence)
+        lines = words.lines()
+        labels = [[self.label(words, line, k) for k in range(len(line))] for line in lines]
+        fields: Dict[str, Optional[str]] = dict.fromkeys(self.line_parser.fields)
+
+        for li, line in enumerate(lines):
+            k = 0
+            while k < len(line):
+                found = labels[li][k]
+                if not found:
+                    k += 1
+                    continue
+                field, used, glued = found
+                label_text = " ".join(words.texts[i] for i in line[k:k + used])
+                end = k + used
+                while end < len(line) and not labels[li][end]:
+                    end += 1
+                value = [words.texts[i] for i in line[k + used:end]]
+                if glued is None and not value:
+                    below = [i for i in self._below(words, lines, li, words.box(line[k])) if words.texts[i].upper().rstrip(":.") not in LABEL_WORDS]
+                    value = [words.texts[i] for i in below]
+                if fields[field] is None and (glued or value):
+                    rule = self.rules[field]
+                    text = label_text if glued else f"{label_text} {' '.join(value)}"
+                    if rule.validate is None or rule.validate(text):
+                        fields[field] = rule.post(text) if rule.post else text
+                k = end
+
+        line_texts = normalize_lines("\n".join(" ".join(words.texts[i] for i in line) for line in lines))
+        plate, casting = self.line_parser.split_lines(line_texts)
+        # whatever the layout didn't place, the line rules may still find
+        for field, value in self.line_parser.extract_fields(plate).items():
+            if fields[field] is None:
+                fields[field] = value
+        return {"fields": fields, "plate_lines": plate, "casting_lines": casting}
+
+
+_DIGITS = re.compile(r"\d+")
+
+
+def layout_plausible(layout: Dict[str, Optional[str]], lines: Dict[str, Optional[str]]) -> bool:
+    """
+    Whether a layout parse holds up against the line parse of the same
+    text: it found at least as many fields, and where the line value has
+    numbers, the layout value has at least one of them.
+    """
+    if sum(v is not None for v in layout.values()) < sum(v is not None for v in lines.values()):
+        return False
+    for field, line_value in lines.items():
+        line_digits = set(_DIGITS.findall(line_value or ""))
+        if line_digits and not line_digits & set(_DIGITS.findall(layout.get(field) or "")):
+            return False
+    return True
+
+
+def merge_fields(results: Sequence[Dict[str, Optional[str]]]) -> Dict[str, Optional[str]]:
+    """Field by field, the first non-empty value (results in order of preference)."""
+    out: Dict[str, Optional[str]] = {}
+    for fields in results:
+        for k, v in fields.items():
+            if out.get(k) is None:
+                out[k] = v
+    return out
+
+
+def _or(masks) -> int:
+    out = 0
+    for m in masks:
+        out |= m
+    return out
+
+
+parser = NameplateParser()
+layout_parser = LayoutParser(parser)
+
+
+def extract_fields(lines: Sequence[str]) -> Dict[str, Optional[str]]:
+    return parser.extract_fields(lines)
+
+
+def looks_like_casting(line: str) -> bool:
+    return parser.looks_like_casting(line)
+
+
+def parse_text(text: str) -> Dict[str, Any]:
+    return parser.parse(text)
+
+
+def parse_words(words: WordBoxes) -> Dict[str, Any]:
+    return layout_parser.parse(words)
+
+
+def try_fill_from_casting(parsed: dict, casting_lines: List[str]) -> dict:
+    up_lines = [c.upper() for c in casting_lines]
+
+    if not parsed.get("dn"):
+        for u in up_lines:
+            if u.startswith("DN"):
+                parsed["dn"] = u
+                break
+
+    cf8m = None
+    for u, raw in zip(up_lines, casting_lines):
+        if "CF8M" in u.replace("-", "").replace(" ", ""):
+            cf8m = raw
+            break
+
+    if cf8m:
+        parsed.setdefault("disc", cf8m)
+        parsed.setdefault("body", cf8m)
+
+    if not parsed.get("model"):
+        for u, raw in zip(up_lines, casting_lines):
+            if u == "TTV":
+                parsed["model"] = "TTV"
+                break
+
+    return parsed
@@ -0,0 +1,184 @@
+# backend/near_dup.py
+"""
+Near-duplicate photos: operators often take two or three shots of the same
+plate, which differ in every byte but show the same thing.
+
+Each upload gets a perceptual hash (imaging.image_phash: the signs of the
+low DCT frequencies of a 32x32 greyscale copy, HASH_BITS bits). Re-shoots of
+the same plate land a handful of bits apart; different scenes are far
+apart. NearDuplicateIndex remembers the hash of every image OCR'd so far
+(optionally in SQLite, so it survives restarts) and finds the closest one
+within `max_distance` bits.
+
+The hash can't tell plates of the same model apart: they differ only in a
+few digits, which a 32x32 copy barely shows, so a re-shoot and a plate
+with another serial land equally close (2-18 bits either way). Matches are
+therefore only recorded by default (OCR_NEAR_DUP=flag). In reuse mode an
+image reuses another's OCR only when it is within the tighter
+OCR_NEAR_DUP_REUSE_DISTANCE *and* a cheap local read of it agrees with the
+other image's text (texts_agree); without a local reader nothing is reused.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from imaging import HASH_BITS
+from nameplate_parser import parse_text
+
+logger = logging.getLogger("ndt-image")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+_NUMBERS = re.compile(r"\d{3,}")
+
+
+def _serial(text: str) -> Optional[str]:
+    serial = parse_text(text)["fields"].get("serial_number")
+    return re.sub(r"[^0-9A-Z]", "", serial.upper()) if serial else None
+
+
+def texts_agree(read: str, reference: str) -> bool:
+    """
+    Whether a quick read of an image shows the same plate as `reference`
+    (the OCR text it would reuse): the same serial number when the reference
+    has one, and no number of 3+ digits the reference lacks. A read too poor
+    to find the numbers doesn't agree.
+    """
+    numbers = set(_NUMBERS.findall(read))
+    if not numbers or not numbers <= set(_NUMBERS.findall(reference)):
+        return False
+    serial = _serial(reference)
+    return serial is None or _serial(read) == serial
+
+
+class NearDuplicateIndex:
+    """
+    pHash -> image digest (ocr_cache.image_digest of the upload whose OCR is
+    cached), with Hamming-distance lookup.
+
+    - memory: the newest `max_entries` hashes. Each is split into
+              max_distance + 1 bands; two hashes within max_distance bits
+              share at least one band exactly, so a lookup only compares
+              the hashes in its own bands' buckets.
+    - disk:   optional SQLite file (path), loaded on start
+
+    Thread-safe.
+    """
+
+    def __init__(self, max_distance: int = 16, max_entries: int = 200_000, path: Optional[str] = None):
+        self.max_distance = max(0, min(max_distance, HASH_BITS - 1))
+        bands = self.max_distance + 1
+        self._cuts = [HASH_BITS * b // bands for b in range(bands + 1)]
+        self.max_entries = max(1, max_entries)
+        self.path = path
+        self._entries: "OrderedDict[int, str]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._stats = {"lookups": 0, "matches": 0, "added": 0, "evictions": 0}
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS near_dup ("
+                    " hash TEXT PRIMARY KEY, digest TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+                rows = self._db.execute(
+                    "SELECT hash, digest FROM near_dup ORDER BY created_at DESC LIMIT ?", (self.max_entries,)
+                ).fetchall()
+                for hex_hash, digest in reversed(rows):
+                    self._remember(int(hex_hash, 16), digest)
+                logger.info("Near-duplicate index at %s (%d hashes)", path, len(rows))
+            except sqlite3.Error as e:
+                logger.exception("Could not open near-duplicate index %s: %s", path, e)
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def match(self, value: int) -> Optional[Tuple[str, int]]:
+        """(digest, distance) of the closest indexed hash within max_distance, or None."""
+        with self._lock:
+            self._stats["lookups"] += 1
+            candidates = {h for key in self._bands(value) for h in self._buckets.get(key, ())}
+            best: Optional[Tuple[int, int]] = None
+            for h in candidates:
+                d = hamming(value, h)
+                if d <= self.max_distance and (best is None or d < best[0]):
+                    best = (d, h)
+            if best is None:
+                return None
+            self._stats["matches"] += 1
+            self._entries.move_to_end(best[1])
+            return self._entries[best[1]], best[0]
+
+    def add(self, value: int, digest: str) -> None:
+        with self._lock:
+            self._stats["added"] += 1
+            self._remember(value, digest)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO near_dup (hash, digest, created_at) VALUES (?, ?, ?)",
+                        (format(value, "x"), digest, time.time()),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning("Near-duplicate index write failed: %s", e)
+
+    def _bands(self, value: int) -> List[Tuple[int, int]]:
+        cuts = self._cuts
+        return [(b, (value >> cuts[b]) & ((1 << (cuts[b + 1] - cuts[b])) - 1)) for b in range(len(cuts) - 1)]
+
+    def _remember(self, value: int, digest: str) -> None:
+        # caller holds the lock (or is __init__)
+        if value in self._entries:
+            self._entries[value] = digest
+            self._entries.move_to_end(value)
+            return
+        self._entries[value] = digest
+        for key in self._bands(value):
+            self._buckets.setdefault(key, []).append(value)
+        while len(self._entries) > self.max_entries:
+            old, _ = self._entries.popitem(last=False)
+            for key in self._bands(old):
+                bucket = self._buckets[key]
+                bucket.remove(old)
+                if not bucket:
+                    del self._buckets[key]
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["entries"] = len(self._entries)
+            out["disk"] = self._db is not None
+        out["max_distance"] = self.max_distance
+        return out
+
+
+# "flag":  matches are only recorded (images_json), every image is OCR'd
+# "reuse": near-duplicates within REUSE_DISTANCE whose quick read agrees reuse
+#          the OCR of the image they match
+# "off":   no hashing at all
+NEAR_DUP_MODE = os.getenv("OCR_NEAR_DUP", "flag").strip().lower()
+if NEAR_DUP_MODE not in ("reuse", "flag", "off"):
+    raise ValueError(f"unknown OCR_NEAR_DUP {NEAR_DUP_MODE!r}; use reuse, flag or off")
+REUSE_DISTANCE = int(os.getenv("OCR_NEAR_DUP_REUSE_DISTANCE", "6"))
+
+near_dup_index = NearDuplicateIndex(
+    max_distance=int(os.getenv("OCR_NEAR_DUP_DISTANCE", "16")),
+    max_entries=int(os.getenv("OCR_NEAR_DUP_MAX_ENTRIES", "200000")),
+    path=os.getenv("OCR_NEAR_DUP_PATH") or None,
+)
@@ -0,0 +1,128 @@
+# backend/ocr_cache.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger("ndt-image")
+
+# bump when preprocessing changes enough that old OCR results should not be reused
+# 2: variants sized by the resolution policy and cropped to the text region
+CACHE_VERSION = "2"
+
+
+def image_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(digest: str, variant: str) -> str:
+    """Key for one OCR result: hash of the uploaded bytes + preprocessing variant."""
+    return f"v{CACHE_VERSION}:{variant}:{digest}"
+
+
+class OCRCache:
+    """
+    Two-tier OCR result cache.
+
+    - memory: LRU bounded by the total size of the stored values (max_bytes)
+    - disk:   optional SQLite file (path) that survives restarts; disk hits
+              are promoted to memory
+
+    Values must be JSON-serialisable. Thread-safe.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: Optional[str] = None):
+        self.max_bytes = max(0, max_bytes)
+        self.path = path
+        self._mem: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+                logger.info("OCR disk cache at %s", path)
+            except sqlite3.Error as e:
+                logger.exception("Could not open OCR disk cache %s: %s", path, e)
+                self._db = None
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                self._mem.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return hit[0]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT value FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning("OCR disk cache read failed: %s", e)
+                    row = None
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value, len(row[0]))
+                    self._stats["disk_hits"] += 1
+                    return value
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        encoded = json.dumps(value)
+        with self._lock:
+            self._stats["puts"] += 1
+            self._remember(key, value, len(encoded))
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO ocr_cache (key, value, created_at) VALUES (?, ?, ?)",
+                        (key, encoded, time.time()),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning("OCR disk cache write failed: %s", e)
+
+    def _remember(self, key: str, value: Any, size: int) -> None:
+        # caller holds the lock
+        if size > self.max_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= old[1]
+        self._mem[key] = (value, size)
+        self._mem_bytes += size
+        while self._mem_bytes > self.max_bytes and self._mem:
+            _, (_, evicted) = self._mem.popitem(last=False)
+            self._mem_bytes -= evicted
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["memory_entries"] = len(self._mem)
+            out["memory_bytes"] = self._mem_bytes
+            out["disk"] = self._db is not None
+        lookups = out["memory_hits"] + out["disk_hits"] + out["misses"]
+        out["hit_rate"] = round((out["memory_hits"] + out["disk_hits"]) / lookups, 4) if lookups else None
+        return out
+
+
+ocr_cache = OCRCache(
+    max_bytes=int(os.getenv("OCR_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    path=os.getenv("OCR_CACHE_PATH") or None,
+)
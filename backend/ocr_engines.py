@@ -0,0 +1,219 @@
+# backend/ocr_engines.py
+"""
+OCR engines behind one interface, so the pipeline doesn't care who reads
+the image.
+
+  vision      - Google Vision (batched through vision_batcher)
+  tesseract   - local Tesseract on the CPU process pool (see local_ocr.py)
+  local-first - Tesseract first; images it reads with low confidence (or
+                not at all) are sent to Vision
+
+Chosen with OCR_ENGINE (default "vision"). OCR_LOCAL_MIN_CONFIDENCE sets
+the escalation threshold of local-first (mean word confidence, 0..1).
+"""
+import abc
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import local_ocr
+import metrics
+from executors import PipelineExecutor, pipeline_executor
+from ocr_words import WordBoxes, from_vision
+from vision_batcher import VisionBatcher, vision_batcher
+from vision_client import VisionClientManager, VisionError, response_text, vision_clients
+
+logger = logging.getLogger("ndt-image")
+
+
+class OCRResult:
+    """
+    Text of one image, its overall confidence (0..1, None if unknown) and, if
+    the engine has them, word boxes. `error` is set (and the text empty) when
+    the engine could not read this image at all.
+    """
+
+    __slots__ = ("text", "confidence", "engine", "words", "error")
+
+    def __init__(
+        self,
+        text: str,
+        confidence: Optional[float],
+        engine: str,
+        words: Optional[WordBoxes] = None,
+        error: Optional[str] = None,
+    ):
+        self.text = text or ""
+        self.confidence = confidence
+        self.engine = engine
+        self.words = words
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"OCRResult(engine={self.engine!r}, confidence={self.confidence}, {len(self.text)} chars)"
+
+
+class OCREngine(abc.ABC):
+    """
+    recognize_many: OCR several (content, mode) items, one OCRResult each, in order.
+    recognize:      the blocking single-image version (scripts).
+    """
+
+    name = ""
+
+    @property
+    def cache_suffix(self) -> str:
+        """Appended to OCR cache keys, so engines don't share cached text."""
+        return f"@{self.name}"
+
+    @abc.abstractmethod
+    async def recognize_many(self, items: Sequence[Tuple[bytes, str]]) -> List[OCRResult]:
+        ...
+
+    @abc.abstractmethod
+    def recognize(self, content: bytes, mode: str = "document") -> OCRResult:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {"engine": self.name}
+
+
+def vision_confidence(resp) -> Optional[float]:
+    """Mean page confidence of a document-mode response (text mode has none)."""
+    pages = resp.full_text_annotation.pages if resp.full_text_annotation else []
+    values = [p.confidence for p in pages if p.confidence]
+    return sum(values) / len(values) if values else None
+
+
+class VisionEngine(OCREngine):
+    name = "vision"
+
+    def __init__(self, batcher: VisionBatcher = vision_batcher, clients: VisionClientManager = vision_clients):
+        self.batcher = batcher
+        self.clients = clients
+
+    @property
+    def cache_suffix(self) -> str:
+        # Vision was the only engine before; keep its existing cache entries valid
+        return ""
+
+    async def recognize_many(self, items: Sequence[Tuple[bytes, str]]) -> List[OCRResult]:
+        # batching window + queueing + the RPC itself (the RPC alone is "vision_rpc")
+        with metrics.span("vision_wait"):
+            responses = await self.batcher.annotate_many(items, return_exceptions=True)
+        results = []
+        for resp, (_, mode) in zip(responses, items):
+            if isinstance(resp, BaseException):
+                # an image Vision rejects (bad data, too large) reads as empty; failed
+                # calls and transient errors that outlasted the retries fail the group
+                if not isinstance(resp, VisionError) or resp.transient or resp.code is None:
+                    raise resp
+                logger.warning("Vision could not read an image (%s mode): %s", mode, resp)
+                results.append(OCRResult("", None, self.name, error=str(resp)))
+            else:
+                results.append(OCRResult(response_text(resp, mode), vision_confidence(resp), self.name, from_vision(resp, mode)))
+        return results
+
+    def recognize(self, content: bytes, mode: str = "document") -> OCRResult:
+        from google.cloud import vision_v1
+
+        image = vision_v1.Image(content=content)
+        if mode == "document":
+            resp = self.clients.call(lambda client: client.document_text_detection(image=image))
+        else:
+            resp = self.clients.call(lambda client: client.text_detection(image=image))
+        if resp.error.message:
+            raise VisionError.from_status(resp.error)
+        return OCRResult(response_text(resp, mode), vision_confidence(resp), self.name, from_vision(resp, mode))
+
+
+class TesseractEngine(OCREngine):
+    name = "tesseract"
+
+    def __init__(self, executor: PipelineExecutor = pipeline_executor, lang: str = local_ocr.TESSERACT_LANG):
+        self.executor = executor
+        self.lang = lang
+
+    async def _one(self, content: bytes, mode: str) -> OCRResult:
+        with metrics.span("local_ocr"):
+            text, confidence, words = await self.executor.run_cpu(local_ocr.recognize, content, mode, self.lang)
+        return OCRResult(text, confidence, self.name, words)
+
+    async def recognize_many(self, items: Sequence[Tuple[bytes, str]]) -> List[OCRResult]:
+        return list(await asyncio.gather(*(self._one(content, mode) for content, mode in items)))
+
+    def recognize(self, content: bytes, mode: str = "document") -> OCRResult:
+        text, confidence, words = local_ocr.recognize(content, mode, self.lang)
+        return OCRResult(text, confidence, self.name, words)
+
+
+class RoutedEngine(OCREngine):
+    """
+    `local` first; a result is kept when it has text and a confidence of at
+    least `min_confidence`, everything else goes to `fallback`. If the local
+    engine fails outright, the whole call goes to the fallback.
+    """
+
+    name = "local-first"
+
+    def __init__(self, local: OCREngine, fallback: OCREngine, min_confidence: float = 0.8):
+        self.local = local
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+        self._stats = {"images": 0, "local": 0, "escalated": 0, "local_errors": 0}
+
+    def accept(self, result: OCRResult) -> bool:
+        return bool(result.text.strip()) and result.confidence is not None and result.confidence >= self.min_confidence
+
+    async def recognize_many(self, items: Sequence[Tuple[bytes, str]]) -> List[OCRResult]:
+        results: List[Optional[OCRResult]]
+        try:
+            results = list(await self.local.recognize_many(items))
+        except Exception as e:
+            logger.warning("Local OCR (%s) failed for %d images, using %s: %s", self.local.name, len(items), self.fallback.name, e)
+            self._stats["local_errors"] += 1
+            results = [None] * len(items)
+
+        redo = [i for i, r in enumerate(results) if r is None or not self.accept(r)]
+        if redo:
+            for i, r in zip(redo, await self.fallback.recognize_many([items[i] for i in redo])):
+                results[i] = r
+
+        self._stats["images"] += len(items)
+        self._stats["escalated"] += len(redo)
+        self._stats["local"] += len(items) - len(redo)
+        return results
+
+    def recognize(self, content: bytes, mode: str = "document") -> OCRResult:
+        try:
+            result = self.local.recognize(content, mode)
+            if self.accept(result):
+                return result
+        except Exception as e:
+            logger.warning("Local OCR (%s) failed, using %s: %s", self.local.name, self.fallback.name, e)
+        return self.fallback.recognize(content, mode)
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"engine": self.name, "local_engine": self.local.name, "fallback": self.fallback.name}
+        out.update(self._stats)
+        out["min_confidence"] = self.min_confidence
+        return out
+
+
+def engine_from_env() -> OCREngine:
+    kind = os.getenv("OCR_ENGINE", "vision").strip().lower()
+    if kind not in ("vision", "tesseract", "local-first"):
+        raise ValueError(f"unknown OCR_ENGINE {kind!r}; use vision, tesseract or local-first")
+    if kind == "vision":
+        return VisionEngine()
+    if not local_ocr.available():
+        logger.warning("OCR_ENGINE=%s but Tesseract is not available (pytesseract + tesseract binary); using Vision", kind)
+        return VisionEngine()
+    local = TesseractEngine(lang=local_ocr.TESSERACT_LANG)
+    if kind == "tesseract":
+        return local
+    return RoutedEngine(local, VisionEngine(), float(os.getenv("OCR_LOCAL_MIN_CONFIDENCE", "0.8")))
+
+
+ocr_engine = engine_from_env()
@@ -0,0 +1,107 @@
+# backend/ocr_strategy.py
+"""
+Adaptive multi-pass OCR.
+
+Every image gets the first stage; later stages only run when the text seen
+so far is not good enough (see Stage.trigger). Stages are configured by name
+with OCR_STAGES, e.g. "document,high-contrast,full-frame,rotate,center-band".
+"""
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# fields a nameplate should give us; their share decides "complete enough"
+KEY_FIELDS = ("serial_number", "model", "dn", "pn")
+
+
+class Stage:
+    """
+    One OCR pass: which image variant to send, in which Vision mode, and when.
+
+    trigger:
+      "always"     - run for every image
+      "incomplete" - run when the completeness score is below the threshold
+      "empty"      - run only when no text has been found yet
+    """
+
+    def __init__(self, name: str, variant: str, mode: str, trigger: str):
+        self.name = name
+        self.variant = variant
+        self.mode = mode
+        self.trigger = trigger
+
+    def wants(self, text: str, score: float, threshold: float) -> bool:
+        if self.trigger == "always":
+            return True
+        if self.trigger == "incomplete":
+            return score < threshold
+        return not text.strip()
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r}, trigger={self.trigger!r})"
+
+
+# the fallback chain from vision_test.py, as named stages
+STAGE_LIBRARY: Dict[str, List[Stage]] = {
+    "document": [Stage("document", "document", "document", "always")],
+    "text": [Stage("text", "document", "text", "empty")],
+    "high-contrast": [Stage("high-contrast", "high-contrast", "document", "incomplete")],
+    # the uncropped photo, for when the region-of-interest crop missed text
+    "full-frame": [Stage("full-frame", "full-frame", "document", "incomplete")],
+    "rotate": [Stage(f"rotate-{a}", f"rotate-{a}", "text", "empty") for a in (90, 180, 270)],
+    "center-band": [Stage("center-band", "center-band", "text", "empty")],
+}
+
+DEFAULT_STAGES = "document,high-contrast,full-frame,rotate,center-band"
+
+
+def completeness(fields: Dict[str, Optional[str]]) -> float:
+    """Share of KEY_FIELDS that were extracted (0.0 - 1.0)."""
+    return sum(1 for f in KEY_FIELDS if fields.get(f)) / len(KEY_FIELDS)
+
+
+class PassStrategy:
+    def __init__(self, stage_names: Sequence[str], threshold: float = 1.0):
+        stages: List[Stage] = []
+        for name in stage_names:
+            name = name.strip()
+            if not name:
+                continue
+            if name not in STAGE_LIBRARY:
+                raise ValueError(f"unknown OCR stage {name!r}; known: {', '.join(STAGE_LIBRARY)}")
+            stages.extend(STAGE_LIBRARY[name])
+        if not stages:
+            raise ValueError("at least one OCR stage is required")
+        # the first stage always runs, whatever its trigger says
+        stages[0] = Stage(stages[0].name, stages[0].variant, stages[0].mode, "always")
+        self.stages = stages
+        self.threshold = threshold
+
+    @classmethod
+    def from_env(cls) -> "PassStrategy":
+        return cls(
+            os.getenv("OCR_STAGES", DEFAULT_STAGES).split(","),
+            threshold=float(os.getenv("OCR_COMPLETENESS_THRESHOLD", "1.0")),
+        )
+
+    def run_sync(
+        self,
+        ocr: Callable[[Stage], str],
+        score: Callable[[str], float],
+    ) -> List[Tuple[str, str]]:
+        """
+        Run the stages one image at a time (scripts / debugging).
+        `ocr(stage)` returns the text of one pass, `score(text)` its completeness.
+        Returns [(stage name, text)] for the passes that ran.
+        """
+        passes: List[Tuple[str, str]] = []
+        text, current = "", 0.0
+        for stage in self.stages:
+            if not stage.wants(text, current, self.threshold):
+                continue
+            passes.append((stage.name, ocr(stage) or ""))
+            text = "\n".join(t for _, t in passes)
+            current = score(text)
+        return passes
+
+
+pass_strategy = PassStrategy.from_env()
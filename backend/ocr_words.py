@@ -0,0 +1,170 @@
+# backend/ocr_words.py
+"""
+Compact word-level OCR output: text, bounding box and confidence per word.
+
+Boxes and confidences live in flat arrays (array module), so a page of a few
+hundred words costs a few KB and filters by confidence without building
+objects per word. Confidence is NaN when the engine gives none (Vision text
+mode). No Vision imports: responses are read by attribute, so this is
+cheap to import in worker processes.
+"""
+import json
+import math
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Box = Tuple[int, int, int, int]
+
+
+class WordBoxes:
+    __slots__ = ("texts", "boxes", "conf")
+
+    def __init__(self, texts: Sequence[str] = (), boxes: Iterable[int] = (), conf: Iterable[float] = ()):
+        self.texts: List[str] = list(texts)
+        self.boxes = array("i", boxes)  # x0, y0, x1, y1 per word
+        self.conf = array("f", conf)
+        if len(self.boxes) != 4 * len(self.texts) or len(self.conf) != len(self.texts):
+            raise ValueError("texts, boxes and conf lengths don't match")
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __repr__(self) -> str:
+        return f"WordBoxes({len(self)} words)"
+
+    def add(self, text: str, box: Box, confidence: float = math.nan) -> None:
+        self.texts.append(text)
+        self.boxes.extend(box)
+        self.conf.append(confidence)
+
+    def box(self, i: int) -> Box:
+        b = self.boxes
+        return b[4 * i], b[4 * i + 1], b[4 * i + 2], b[4 * i + 3]
+
+    def filter(self, min_confidence: float) -> "WordBoxes":
+        """Words with confidence >= min_confidence (words without a confidence are kept)."""
+        keep = [i for i, c in enumerate(self.conf) if not c < min_confidence]
+        if len(keep) == len(self):
+            return self
+        out = WordBoxes()
+        for i in keep:
+            out.add(self.texts[i], self.box(i), self.conf[i])
+        return out
+
+    def slope(self) -> float:
+        """
+        Baseline slope (dy/dx) of the text: the median over words and their
+        nearest neighbour to the right on the same line. 0 with fewer than
+        three such pairs.
+        """
+        b = self.boxes
+        order = sorted(range(len(self)), key=lambda i: b[4 * i])
+        starts = [b[4 * i] for i in order]
+        slopes = []
+        for i in order:
+            x1, y0, y1 = b[4 * i + 2], b[4 * i + 1], b[4 * i + 3]
+            h = max(1, y1 - y0)
+            cx, cy = (b[4 * i] + x1) / 2, (y0 + y1) / 2
+            best = None
+            for n in range(bisect_left(starts, x1 - h / 2), len(order)):
+                j = order[n]
+                gap = b[4 * j] - x1
+                if gap > 2 * h:
+                    break  # sorted by x0: everything further is further right
+                if j == i:
+                    continue
+                hj = max(1, b[4 * j + 3] - b[4 * j + 1])
+                dy = (b[4 * j + 1] + b[4 * j + 3]) / 2 - cy
+                if abs(dy) <= min(h, hj) / 2 and (best is None or gap < best[0]):
+                    best = (gap, dy / max(1.0, (b[4 * j] + b[4 * j + 2]) / 2 - cx))
+            if best is not None:
+                slopes.append(best[1])
+        if len(slopes) < 3:
+            return 0.0
+        slopes.sort()
+        # beyond ~11 degrees the pairs are more likely across lines than along them
+        return max(-0.2, min(0.2, slopes[len(slopes) // 2]))
+
+    def lines(self) -> List[List[int]]:
+        """
+        Word indices grouped into text lines (top to bottom), each line left to
+        right. Centres are first corrected for the baseline slope (a plate shot
+        a few degrees off level); a word then joins the current line when its
+        corrected centre is within half a word height of the line's centre.
+        """
+        b = self.boxes
+        slope = self.slope()
+        # the centre moved back onto a level baseline, and the word's own
+        # height (a tilted word's box is taller by its width x slope)
+        level = [
+            ((b[4 * i + 1] + b[4 * i + 3]) / 2 - slope * (b[4 * i] + b[4 * i + 2]) / 2,
+             max(1.0, b[4 * i + 3] - b[4 * i + 1] - abs(slope) * (b[4 * i + 2] - b[4 * i])))
+            for i in range(len(self))
+        ]
+        order = sorted(range(len(self)), key=lambda i: level[i][0])
+        lines: List[List[int]] = []
+        centre = height = 0.0
+        for i in order:
+            cy, h = level[i]
+            if lines and abs(cy - centre) <= max(h, height) / 2:
+                line = lines[-1]
+                line.append(i)
+                centre += (cy - centre) / len(line)
+                height = max(height, h)
+            else:
+                lines.append([i])
+                centre, height = cy, h
+        for line in lines:
+            line.sort(key=lambda i: b[4 * i])
+        return lines
+
+    def text(self) -> str:
+        return "\n".join(" ".join(self.texts[i] for i in line) for line in self.lines())
+
+    # ---- serialisation (OCR cache, process boundaries) ----
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "t": self.texts,
+            "b": self.boxes.tolist(),
+            "c": [None if math.isnan(c) else round(c, 3) for c in self.conf],
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "WordBoxes":
+        return cls(d["t"], d["b"], (math.nan if c is None else c for c in d["c"]))
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, s: str) -> "WordBoxes":
+        return cls.from_dict(json.loads(s))
+
+
+def _bounds(vertices) -> Box:
+    xs = [v.x for v in vertices]
+    ys = [v.y for v in vertices]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def from_vision(resp, mode: str = "document") -> Optional[WordBoxes]:
+    """Words of an AnnotateImageResponse (None when it has no word structure)."""
+    words = WordBoxes()
+    if mode == "document":
+        annotation = resp.full_text_annotation
+        if not annotation:
+            return None
+        for page in annotation.pages:
+            for block in page.blocks:
+                for paragraph in block.paragraphs:
+                    for word in paragraph.words:
+                        text = "".join(s.text for s in word.symbols)
+                        if text:
+                            words.add(text, _bounds(word.bounding_box.vertices), word.confidence)
+    else:
+        # text mode: [0] is the whole text, the rest are words (no confidences)
+        for ann in list(resp.text_annotations)[1:]:
+            if ann.description:
+                words.add(ann.description, _bounds(ann.bounding_poly.vertices))
+    return words if len(words) else None
@@ -0,0 +1,550 @@
+# backend/pipeline.py
+"""
+What happens to one group of uploaded images: OCR + parse each image,
+aggregate the group, insert its row into Supabase, record the result in
+the job store. Shared by the API (main.py, which runs groups itself unless
+OCR_WORK_QUEUE is set) and the OCR workers (worker.py).
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from executors import pipeline_executor
+from imaging import image_phash, render_variants
+from job_store import FINISHED, MemoryJobStore, job_store
+from nameplate_parser import extract_fields, layout_plausible, merge_fields, parse_text, parse_words, try_fill_from_casting
+import local_ocr
+from near_dup import NEAR_DUP_MODE, REUSE_DISTANCE, hamming, near_dup_index, texts_agree
+from ocr_cache import cache_key, image_digest, ocr_cache
+from ocr_engines import ocr_engine
+from ocr_strategy import completeness, pass_strategy
+from ocr_words import WordBoxes
+from supabase_writer import SupabaseWriter
+from upload_spool import upload_spool
+from vision_batcher import vision_batcher
+from vision_client import vision_clients
+from vision_control import vision_controller
+from warmup import Warmup
+from work_queue import work_queue
+
+logger = logging.getLogger("ndt-image")
+
+# ─────────────────────────────
+# CONFIG
+# ─────────────────────────────
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("ROLE_KEY")
+SUPABASE_TABLE = "products"
+supabase_writer = SupabaseWriter(
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    SUPABASE_TABLE,
+    max_batch=int(os.getenv("SUPABASE_BATCH_SIZE", "20")),
+    max_wait_ms=float(os.getenv("SUPABASE_BATCH_WINDOW_MS", "250")),
+    max_connections=int(os.getenv("SUPABASE_MAX_CONNECTIONS", "10")),
+    max_retries=int(os.getenv("SUPABASE_MAX_RETRIES", "4")),
+    # upsert key, so a resumed group never adds a second row; "" = plain inserts
+    on_conflict=os.getenv("SUPABASE_ON_CONFLICT", "batch_id,product_no"),
+)
+
+
+def check_queue_setup() -> None:
+    """Worker mode needs state every process sees: the SQLite job store and the upload spool."""
+    if work_queue is None:
+        return
+    if isinstance(job_store, MemoryJobStore):
+        raise ValueError("OCR_WORK_QUEUE needs OCR_JOB_STORE=sqlite so workers and the API share jobs")
+    if not upload_spool.enabled:
+        raise ValueError("OCR_WORK_QUEUE needs the upload spool (OCR_SPOOL_DIR) to pass images to workers")
+
+
+# ─────────────────────────────
+# METRICS (served by the API's /metrics and by workers, see metrics.py)
+# ─────────────────────────────
+metrics.registry.labelled(
+    "ocr_executor_inflight", "Tasks submitted to the thread / process pools and not yet finished.", "pool",
+    lambda: {"io": pipeline_executor.inflight_io, "cpu": pipeline_executor.inflight_cpu},
+)
+metrics.registry.gauge("ocr_vision_inflight_calls", "Vision RPCs in progress.", lambda: vision_clients.inflight)
+metrics.registry.gauge("ocr_vision_batcher_pending_images", "Images waiting for the next Vision batch.", lambda: vision_batcher.stats()["pending"])
+metrics.registry.gauge("ocr_vision_concurrency_limit", "Adaptive limit on concurrent Vision calls.", lambda: vision_controller.limit)
+metrics.registry.gauge(
+    "ocr_vision_budget_images", "Images left in the per-minute Vision budget.",
+    lambda: vision_controller.stats()["budget_left"],
+)
+metrics.registry.labelled(
+    "ocr_vision_control_total", "Vision calls, retries, throttled images and limit decreases.", "kind",
+    lambda: {k: v for k, v in vision_controller.stats().items() if k in ("calls", "retries", "throttled", "failures", "decreases")},
+    kind="counter",
+)
+metrics.registry.labelled(
+    "ocr_engine_images_total", "Images read locally vs escalated to Vision (local-first engine).", "route",
+    lambda: {k: v for k, v in ocr_engine.stats().items() if k in ("local", "escalated")},
+    kind="counter",
+)
+metrics.registry.labelled(
+    "ocr_cache_lookups_total", "OCR cache lookups by outcome.", "result",
+    lambda: {k: v for k, v in ocr_cache.stats().items() if k in ("memory_hits", "disk_hits", "misses")},
+    kind="counter",
+)
+metrics.registry.gauge("ocr_cache_hit_ratio", "OCR cache hits / lookups since start.", lambda: ocr_cache.stats()["hit_rate"])
+metrics.registry.gauge("ocr_supabase_pending_rows", "Rows buffered for the next Supabase bulk insert.", lambda: supabase_writer.stats()["pending"])
+metrics.registry.labelled(
+    "ocr_supabase_writer_total", "Supabase writer totals.", "kind",
+    lambda: {k: v for k, v in supabase_writer.stats().items() if k in ("rows", "requests", "retries", "failed_rows", "upserts")},
+    kind="counter",
+)
+
+
+# ─────────────────────────────
+# WARMUP (see warmup.py; the API's /ready reports it)
+# ─────────────────────────────
+def make_warmup(ocr: bool = True) -> Warmup:
+    """Start-up warmup; without `ocr` (an API whose groups go to workers) only Supabase is warmed."""
+    warmup = Warmup(timeout=float(os.getenv("WARMUP_TIMEOUT", "30")))
+    if os.getenv("WARMUP", "1").strip().lower() in ("0", "false", "no", "off"):
+        return warmup
+    if ocr and ocr_engine.name != "tesseract":
+        warmup.step("vision", lambda: pipeline_executor.run_io(vision_clients.warmup))
+    warmup.step("supabase", supabase_writer.warmup)
+    if ocr:
+        warmup.step("cpu_pool", lambda: pipeline_executor.warmup("imaging"))
+    return warmup
+
+
+# ─────────────────────────────
+# SUPABASE INSERT (REST API)
+# ─────────────────────────────
+async def insert_product_to_supabase(
+    batch_id: str,
+    product_no: int,
+    parsed: dict,
+    raw_text: str,
+    casting_lines: Optional[List[str]] = None,
+    images_json: Optional[List[Dict[str, Any]]] = None,
+) -> dict:
+    """
+    Queue one product row for the shared Supabase writer (bulk insert over a
+    pooled connection, with retries). Returns dict with ok: True/False and details.
+    """
+    if not supabase_writer.configured:
+        logger.error("Supabase not configured (missing SUPABASE_URL or SUPABASE_KEY)")
+        return {"ok": False, "reason": "Supabase not configured"}
+
+    casting_lines = casting_lines or []
+    images_json = images_json or []
+    casting_summary = ", ".join(casting_lines)
+
+    payload = {
+        "batch_id": batch_id,
+        "product_no": product_no,
+        "serial_number": parsed.get("serial_number"),
+        "model": parsed.get("model"),
+        "dn": parsed.get("dn"),
+        "pn": parsed.get("pn"),
+        "pt": parsed.get("pt"),
+        "body": parsed.get("body"),
+        "disc": parsed.get("disc"),
+        "seat": parsed.get("seat"),
+        "temp": parsed.get("temp"),
+        "raw_text": raw_text,
+        "casting_lines": casting_lines,
+        "images_json": images_json,
+        "casting_summary": casting_summary,
+    }
+
+    logger.info("Queue Supabase insert (product_no=%s, batch_id=%s)", product_no, batch_id)
+    with metrics.span("supabase_insert"):
+        return await supabase_writer.insert(payload)
+
+
+# ─────────────────────────────
+# OCR + PARSE PER GROUP
+# ─────────────────────────────
+async def prepare_upload(data: bytes, names: Tuple[str, ...] = ("document", "high-contrast")) -> Dict[str, Any]:
+    """Build the requested OCR variants of one uploaded image on the CPU pool."""
+    with metrics.span("preprocess"):
+        variants = await pipeline_executor.run_cpu(render_variants, data, names)
+    info = variants["info"]
+    # measured inside the worker process, recorded here
+    for step, seconds in info["timings"].items():
+        metrics.observe(f"preprocess_{step}", seconds)
+    sizes = ", ".join(f"{name} {w}x{h} {size} bytes" for name, (w, h, size) in info["variants"].items())
+    sent = sum(size for _, _, size in info["variants"].values())
+    logger.info(
+        "Prepared %sx%s upload (%d bytes, text region %s): %s; %d bytes saved vs sending the upload per variant",
+        *info["original_size"], info["upload_bytes"], info["roi"] or "not found", sizes,
+        len(info["variants"]) * info["upload_bytes"] - sent,
+    )
+    return variants
+
+
+layout_fallbacks = metrics.registry.register(metrics.Counter(
+    "ocr_layout_fallbacks_total", "OCR passes whose layout parse was dropped for the line parse of their text.",
+))
+
+
+def _parse_pass(text: str, words: Optional[WordBoxes]) -> Dict[str, Any]:
+    """
+    Parse one OCR pass: by layout when the engine gave word boxes, else line
+    by line. A layout result that misses fields or numbers the line parse of
+    the engine's text finds (see layout_plausible) gives way to that parse.
+    """
+    with metrics.span("parse"):
+        by_lines = parse_text(text)
+        if words is None:
+            return by_lines
+        by_layout = parse_words(words)
+        if layout_plausible(by_layout["fields"], by_lines["fields"]):
+            return by_layout
+        layout_fallbacks.inc()
+        return by_lines
+
+
+near_dup_images = metrics.registry.register(metrics.Counter(
+    "ocr_near_dup_images_total", "Uploads matched to a near-duplicate, by where the match was.", ("source",),
+))
+
+
+near_dup_checks = metrics.registry.register(metrics.Counter(
+    "ocr_near_dup_reuse_checks_total",
+    "Near-duplicates close enough to reuse, by whether their quick read agreed.", ("result",),
+))
+_quick_read_missing_logged = False
+
+
+async def _quick_read(data: bytes) -> Optional[str]:
+    """Local (Tesseract) read of an upload for the reuse check; None without a local reader."""
+    global _quick_read_missing_logged
+    if not local_ocr.available():
+        if not _quick_read_missing_logged:
+            logger.warning("OCR_NEAR_DUP=reuse needs Tesseract to check near-duplicates; every image is OCR'd")
+            _quick_read_missing_logged = True
+        return None
+    try:
+        return await pipeline_executor.run_cpu(local_ocr.quick_read, data)
+    except Exception as e:
+        logger.warning("Quick read for the near-duplicate check failed: %s", e)
+        return None
+
+
+async def _confirm_reuse(data: bytes, reference: Optional[str], reads: Dict[int, Optional[str]], i: int) -> bool:
+    """Whether image i, a close near-duplicate, may reuse the OCR that produced `reference`."""
+    if reference is None:
+        near_dup_checks.inc(result="unavailable")
+        return False
+    if i not in reads:
+        reads[i] = await _quick_read(data)
+    if reads[i] is None:
+        near_dup_checks.inc(result="unavailable")
+        return False
+    agreed = texts_agree(reads[i], reference)
+    near_dup_checks.inc(result="agreed" if agreed else "disagreed")
+    return agreed
+
+
+async def _near_duplicates(
+    images: List[Tuple[str, bytes]], digests: List[str]
+) -> Tuple[List[Optional[int]], List[Optional[Dict[str, Any]]], List[Tuple[str, ...]]]:
+    """
+    Per image of a group:
+      same_as      - index of an earlier image in the group whose result it
+                     reuses, else None
+      duplicate_of - what it matched, for images_json ({"file"} or {"digest"},
+                     the distance in bits and whether the OCR was reused), else None
+      sources      - digests whose cached OCR passes it may use, own first
+    Images that match nothing are added to the index.
+
+    Reuse (OCR_NEAR_DUP=reuse) needs a match within REUSE_DISTANCE and a
+    quick read of the image that agrees with the text it would reuse: the
+    other image's quick read within the group, the cached first pass of an
+    indexed image.
+    """
+    n = len(images)
+    same_as: List[Optional[int]] = [None] * n
+    duplicate_of: List[Optional[Dict[str, Any]]] = [None] * n
+    sources: List[Tuple[str, ...]] = [(d,) for d in digests]
+    if NEAR_DUP_MODE == "off":
+        return same_as, duplicate_of, sources
+
+    with metrics.span("phash"):
+        hashes = await asyncio.gather(*(pipeline_executor.run_cpu(image_phash, data) for _, data in images))
+    reuse = NEAR_DUP_MODE == "reuse"
+    first_pass = pass_strategy.stages[0].name + ocr_engine.cache_suffix
+    reads: Dict[int, Optional[str]] = {}
+    for i in range(n):
+        for j in range(i):
+            d = hamming(hashes[i], hashes[j])
+            # only match images that are not group duplicates themselves
+            if "file" not in (duplicate_of[j] or {}) and d <= near_dup_index.max_distance:
+                duplicate_of[i] = {"file": images[j][0], "distance": d, "reused": False}
+                near_dup_images.inc(source="group")
+                if reuse and d <= REUSE_DISTANCE:
+                    if j not in reads:
+                        reads[j] = await _quick_read(images[j][1])
+                    if await _confirm_reuse(images[i][1], reads[j], reads, i):
+                        same_as[i] = j
+                        duplicate_of[i]["reused"] = True
+                break
+        else:
+            hit = near_dup_index.match(hashes[i])
+            if hit is not None and hit[0] != digests[i]:
+                duplicate_of[i] = {"digest": hit[0], "distance": hit[1], "reused": False}
+                near_dup_images.inc(source="index")
+                if reuse and hit[1] <= REUSE_DISTANCE:
+                    reference = ocr_cache.get(cache_key(hit[0], first_pass))
+                    if await _confirm_reuse(images[i][1], reference, reads, i):
+                        sources[i] = (digests[i], hit[0])
+                        duplicate_of[i]["reused"] = True
+            elif hit is None:
+                near_dup_index.add(hashes[i], digests[i])
+    return same_as, duplicate_of, sources
+
+
+async def ocr_group_images(images: List[Tuple[str, bytes]]) -> List[Dict[str, Any]]:
+    """
+    OCR every image of a group with the adaptive pass strategy: each stage is
+    one batch_annotate_images round-trip for the images that still need it
+    (e.g. the high-contrast pass only when the first pass left key fields
+    missing). Passes already in the OCR cache are not OCR'd again.
+
+    Each pass is parsed on its own (see _parse_pass) and the fields are
+    merged pass by pass, earlier passes first.
+
+    Near-duplicates (see near_dup.py) are only recorded by default. With
+    OCR_NEAR_DUP=reuse, confirmed near-duplicates of an earlier image in the
+    group are not OCR'd at all (they copy that image's result), and those of
+    an image from an earlier batch read its cached passes.
+    """
+    digests = await asyncio.gather(*(pipeline_executor.run_io(image_digest, data) for _, data in images))
+    same_as, duplicate_of, sources = await _near_duplicates(images, digests)
+    passes: List[List[Tuple[str, str]]] = [[] for _ in images]
+    parsed_passes: List[List[Dict[str, Any]]] = [[] for _ in images]
+    engines: List[List[str]] = [[] for _ in images]
+    errors: List[List[str]] = [[] for _ in images]
+    # whether the image was cropped to a text region (None: not rendered yet, all passes cached)
+    cropped: List[Optional[bool]] = [None] * len(images)
+    scores = [0.0] * len(images)
+
+    for stage in pass_strategy.stages:
+        todo = [
+            i for i in range(len(images))
+            if same_as[i] is None
+            and stage.wants("\n".join(t for _, t in passes[i]), scores[i], pass_strategy.threshold)
+            # the full frame only adds something when the other passes saw a crop
+            and not (stage.variant == "full-frame" and cropped[i] is False)
+        ]
+        if not todo:
+            continue
+
+        pass_name = stage.name + ocr_engine.cache_suffix
+        stage_texts: Dict[int, str] = {}
+        stage_words: Dict[int, Optional[WordBoxes]] = {}
+        stage_engines: Dict[int, str] = {}
+        missing: List[int] = []
+        for i in todo:
+            # this image's own cached pass first, then that of the image it near-duplicates
+            for digest in sources[i]:
+                cached = ocr_cache.get(cache_key(digest, pass_name))
+                if cached is not None:
+                    stage_texts[i] = cached
+                    cached_words = ocr_cache.get(cache_key(digest, pass_name + ":words"))
+                    stage_words[i] = WordBoxes.from_json(cached_words) if cached_words else None
+                    stage_engines[i] = "cache" if digest == digests[i] else "near-dup"
+                    break
+            else:
+                missing.append(i)
+
+        if missing:
+            rendered = await asyncio.gather(*(prepare_upload(images[i][1], (stage.variant,)) for i in missing))
+            requests = [(r[stage.variant], stage.mode) for r in rendered]
+            if stage.variant != "full-frame":
+                for i, r in zip(missing, rendered):
+                    cropped[i] = r["info"]["roi"] is not None
+            results = await ocr_engine.recognize_many(requests)
+            for i, res in zip(missing, results):
+                stage_texts[i] = res.text
+                stage_words[i] = res.words
+                stage_engines[i] = res.engine
+                if res.error is not None:
+                    # not cached: a later upload of the same image gets another try
+                    errors[i].append(f"{stage.name}: {res.error}")
+                    continue
+                ocr_cache.put(cache_key(digests[i], pass_name), res.text)
+                if res.words is not None:
+                    ocr_cache.put(cache_key(digests[i], pass_name + ":words"), res.words.to_json())
+
+        for i in todo:
+            passes[i].append((stage.name, stage_texts[i]))
+            parsed_passes[i].append(_parse_pass(stage_texts[i], stage_words[i]))
+            engines[i].append(stage_engines[i])
+            scores[i] = completeness(merge_fields([p["fields"] for p in parsed_passes[i]]))
+
+    out = []
+    for i, (filename, _) in enumerate(images):
+        if same_as[i] is not None:
+            # a near-duplicate earlier in the group: same result, nothing OCR'd
+            r = out[same_as[i]]
+            out.append(dict(r, file=filename, engines=["near-dup"] * len(r["passes"]), duplicate_of=duplicate_of[i]))
+            continue
+        out.append(
+            {
+                "file": filename,
+                "raw_text": "\n".join(t or "" for _, t in passes[i]),
+                "fields": merge_fields([p["fields"] for p in parsed_passes[i]]),
+                "casting_lines": [ln for p in parsed_passes[i] for ln in p["casting_lines"]],
+                "plate_lines": [ln for p in parsed_passes[i] for ln in p["plate_lines"]],
+                "passes": [name for name, _ in passes[i]],
+                "engines": engines[i],
+                "errors": errors[i],
+                "duplicate_of": duplicate_of[i],
+            }
+        )
+    return out
+
+
+async def ocr_group(images: List[Tuple[str, bytes]]) -> Dict[str, Any]:
+    """OCR + parse each image of one group and aggregate them into the group's row data."""
+    group_texts: List[str] = []
+    group_casting: List[str] = []
+    group_plate_lines: List[str] = []
+    group_images_json: List[Dict[str, Any]] = []
+
+    image_results = await ocr_group_images(images)
+    for (filename, _), r in zip(images, image_results):
+        group_texts.append(r["raw_text"])
+        group_casting.extend(r["casting_lines"])
+        group_plate_lines.extend(r["plate_lines"])
+        group_images_json.append(
+            {
+                "filename": filename,
+                "ocr_passes": r["passes"],
+                "ocr_engines": r["engines"],
+                "ocr_errors": r["errors"],
+                "near_duplicate_of": r["duplicate_of"],
+            }
+        )
+
+    # fields per image (layout-aware where word boxes exist), then the
+    # group's merged plate lines for whatever is still missing
+    with metrics.span("parse"):
+        parsed = merge_fields([r["fields"] for r in image_results] + [extract_fields(group_plate_lines)])
+        parsed = try_fill_from_casting(parsed, group_casting)
+
+    return {
+        "files": [filename for filename, _ in images],
+        "parsed": parsed,
+        # Join all texts and unique casting lines
+        "raw_text": "\n\n".join(group_texts),
+        "casting_lines": list(dict.fromkeys(group_casting)),  # preserve order
+        "images": group_images_json,
+    }
+
+
+async def process_group(batch_id: str, product_no: int, images: Optional[List[Tuple[str, bytes]]] = None) -> None:
+    """
+    OCR + parse each image of one group, aggregate, insert ONE row into Supabase.
+    Progress and the final result are written to the job store.
+
+    The OCR output is checkpointed before the insert, so a resumed group
+    whose OCR already finished is only inserted again; without `images` a
+    group that still needs OCR reads them back from the upload spool. Given
+    `images` (inline mode) are only spooled if the group fails before its
+    checkpoint, the one case a resume needs them for.
+
+    Job store calls go through the IO pool: the SQLite store can wait on
+    its file lock while other workers write.
+    """
+    from_spool = images is None
+    checkpointed = False
+    await pipeline_executor.run_io(job_store.set_group_status, batch_id, product_no, "running")
+    try:
+        with metrics.span("group"):
+            checkpoint = await pipeline_executor.run_io(job_store.get_group_checkpoint, batch_id, product_no)
+            checkpointed = checkpoint is not None
+            if checkpoint is None:
+                if images is None:
+                    images = await pipeline_executor.run_io(upload_spool.load_group, batch_id, product_no)
+                if images is None:
+                    raise RuntimeError("the group's images are no longer stored; upload them again")
+                checkpoint = await ocr_group(images)
+                await pipeline_executor.run_io(job_store.set_group_checkpoint, batch_id, product_no, checkpoint)
+                checkpointed = True
+            else:
+                logger.info("Group %s of batch %s: OCR output from checkpoint", product_no, batch_id)
+
+            supabase_res = await insert_product_to_supabase(
+                batch_id=batch_id,
+                product_no=product_no,
+                parsed=checkpoint["parsed"],
+                raw_text=checkpoint["raw_text"],
+                casting_lines=checkpoint["casting_lines"],
+                images_json=checkpoint["images"],
+            )
+
+        result = {
+            "product_no": product_no,
+            "files": checkpoint["files"],
+            "parsed": checkpoint["parsed"],
+            "casting_lines": checkpoint["casting_lines"],
+            "supabase": supabase_res,
+            "images": checkpoint["images"],
+        }
+        await pipeline_executor.run_io(job_store.set_group_status, batch_id, product_no, "done", result=result)
+        if supabase_res.get("ok") and from_spool:
+            # the row is in; nothing left to resume for this group
+            await pipeline_executor.run_io(upload_spool.drop_group, batch_id, product_no)
+    except Exception as e:
+        logger.exception("Group %s of batch %s failed: %s", product_no, batch_id, e)
+        await pipeline_executor.run_io(job_store.set_group_status, batch_id, product_no, "failed", error=str(e))
+        if not from_spool and images is not None and not checkpointed:
+            try:
+                await pipeline_executor.run_io(upload_spool.save_group, batch_id, product_no, images)
+            except OSError as spool_error:
+                logger.warning("Could not spool failed group %s of batch %s: %s", product_no, batch_id, spool_error)
+
+
+def finish_job(batch_id: str) -> bool:
+    """
+    Give a job its final status once none of its groups is queued or running
+    (and its upload is complete). Called after groups finish, so in worker
+    mode the last worker to finish closes the job; returns whether the job
+    is finished. It reads and writes the job store: from async code, run it
+    through pipeline_executor.run_io.
+
+    `count` is the number of rows that made it into Supabase. A job with
+    none is failed; one with some missing is done, with an `error` saying
+    how many are missing (POST /ocr-job/{id}/resume retries them).
+    """
+    job = job_store.get(batch_id, include_results=False)
+    if not job:
+        return False
+    if job["status"] in FINISHED:
+        return True
+    progress = job["progress"]
+    if progress["queued"] or progress["running"]:
+        return False
+    if job["status"] == "receiving" and not job.get("intake_error"):
+        return False  # more groups are still being uploaded
+
+    done = [g["product_no"] for g in job["groups"] if g["status"] == "done"]
+    results = job_store.get_results(batch_id, done) if done else {}
+    inserted = sum(1 for r in results.values() if (r.get("supabase") or {}).get("ok"))
+    missing = len(job["groups"]) - inserted
+
+    update: Dict[str, Any] = {"count": inserted}  # number of products inserted
+    if job.get("intake_error"):
+        update.update(status="failed", error=job["intake_error"])
+    elif job["groups"] and not inserted:
+        error = f"no product was inserted ({progress['failed']} groups failed, {len(done)} not written to Supabase)"
+        update.update(status="failed", error=error)
+    elif missing:
+        # still "done": clients take the rows that made it; resume retries the rest
+        update.update(status="done", error=f"{missing} of {len(job['groups'])} products were not inserted")
+    else:
+        update.update(status="done", error=None)
+    job_store.update(batch_id, **update)
+    logger.info("Batch %s finished: %s, %d inserted", batch_id, progress, inserted)
+    return True
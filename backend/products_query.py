@@ -0,0 +1,138 @@
+# backend/products_query.py
+"""
+Helpers for the /products endpoint: column projection, filters and keyset
+(cursor) pagination on (created_at, id), expressed as PostgREST query params.
+"""
+import base64
+import csv
+import io
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+ALL_COLUMNS = (
+    "id",
+    "batch_id",
+    "product_no",
+    "serial_number",
+    "model",
+    "dn",
+    "pn",
+    "pt",
+    "body",
+    "disc",
+    "seat",
+    "temp",
+    "casting_summary",
+    "casting_lines",
+    "images_json",
+    "raw_text",
+    "created_at",
+)
+# raw_text is large and rarely needed in listings
+DEFAULT_COLUMNS = tuple(c for c in ALL_COLUMNS if c != "raw_text")
+# always selected: the keyset cursor is built from them
+KEY_COLUMNS = ("created_at", "id")
+
+MAX_PAGE_SIZE = 1000
+
+
+def parse_columns(columns: Optional[str]) -> List[str]:
+    """Validate a comma-separated column list (default: everything but raw_text)."""
+    if not columns:
+        return list(DEFAULT_COLUMNS)
+    wanted = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in wanted if c not in ALL_COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown columns: {', '.join(unknown)}")
+    return wanted
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row.get("created_at"), row.get("id")]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return created_at, row_id
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _quote(value: Any) -> str:
+    # PostgREST logic-tree values with reserved characters must be double-quoted
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _like(value: str) -> str:
+    return "*" + value.replace("*", "").replace("%", "") + "*"
+
+
+def build_params(
+    columns: List[str],
+    limit: int,
+    cursor: Optional[str] = None,
+    batch_id: Optional[str] = None,
+    serial_number: Optional[str] = None,
+    model: Optional[str] = None,
+) -> Dict[str, str]:
+    """PostgREST params for one page, newest first. Fetches limit+1 rows to detect a next page."""
+    select = list(columns) + [c for c in KEY_COLUMNS if c not in columns]
+    params = {
+        "select": ",".join(select),
+        "order": "created_at.desc,id.desc",
+        "limit": str(limit + 1),
+    }
+    if batch_id:
+        params["batch_id"] = f"eq.{batch_id}"
+    if serial_number:
+        params["serial_number"] = f"ilike.{_like(serial_number)}"
+    if model:
+        params["model"] = f"ilike.{_like(model)}"
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        params["or"] = (
+            f"(created_at.lt.{_quote(created_at)},"
+            f"and(created_at.eq.{_quote(created_at)},id.lt.{_quote(row_id)}))"
+        )
+    return params
+
+
+def split_page(rows: List[Dict[str, Any]], limit: int, columns: List[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Trim the look-ahead row, build the next cursor and drop key columns nobody asked for."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1]) if has_more and rows else None
+    extra = [c for c in KEY_COLUMNS if c not in columns]
+    if extra:
+        rows = [{k: v for k, v in r.items() if k not in extra} for r in rows]
+    return rows, next_cursor
+
+
+def ndjson_lines(rows: Iterable[Dict[str, Any]]) -> Iterable[str]:
+    for r in rows:
+        yield json.dumps(r, default=str) + "\n"
+
+
+def csv_header(columns: List[str]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(columns)
+    return buf.getvalue()
+
+
+def csv_lines(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterable[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        values = []
+        for c in columns:
+            v = r.get(c)
+            if isinstance(v, (list, dict)):
+                v = json.dumps(v)
+            values.append("" if v is None else v)
+        writer.writerow(values)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
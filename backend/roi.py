@@ -0,0 +1,108 @@
+# backend/roi.py
+"""
+Find the text area (nameplate, casting marks) of a photo, so OCR can skip
+the rest of the frame.
+
+Works on a small greyscale copy: strong edges are counted per grid cell,
+cells well above the frame's average are "hot", neighbouring hot cells are
+grouped, and the box around the strongest groups (plus a margin) is the
+region. Text is dense in short strokes, so it stands out; smooth metal,
+sky and floor don't. When nothing stands out, or the region would be most
+of the frame anyway, there is no region and the full frame is used.
+
+Pillow only (BOX resizes do the per-cell averaging), so it is cheap in
+process-pool workers and works without numpy.
+"""
+import os
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageFilter
+
+Box = Tuple[int, int, int, int]
+
+ROI_ENABLED = os.getenv("OCR_ROI", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# long side of the copy the detection runs on, and grid cells along it
+DETECT_SIDE = 384
+GRID_CELLS = 32
+# an edge pixel is "strong" above this (FIND_EDGES output, 0-255)
+EDGE_THRESHOLD = 48
+# groups weaker than this share of the strongest one are left out
+KEEP_RATIO = 0.35
+
+
+def _components(hot: List[List[bool]]) -> List[List[Tuple[int, int]]]:
+    """8-connected groups of hot cells, with one cell of slack so nearby text lines join."""
+    gh, gw = len(hot), len(hot[0])
+    seen = [[False] * gw for _ in range(gh)]
+    groups = []
+    for y in range(gh):
+        for x in range(gw):
+            if not hot[y][x] or seen[y][x]:
+                continue
+            seen[y][x] = True
+            stack, cells = [(y, x)], []
+            while stack:
+                cy, cx = stack.pop()
+                cells.append((cy, cx))
+                for ny in range(max(0, cy - 2), min(gh, cy + 3)):
+                    for nx in range(max(0, cx - 2), min(gw, cx + 3)):
+                        if hot[ny][nx] and not seen[ny][nx]:
+                            seen[ny][nx] = True
+                            stack.append((ny, nx))
+            groups.append(cells)
+    return groups
+
+
+def find_text_region(
+    img: Image.Image,
+    min_area: float = 0.02,
+    max_area: float = 0.75,
+    margin: float = 0.04,
+) -> Optional[Box]:
+    """
+    Box (left, top, right, bottom) in `img` pixels around the text, or None
+    when the full frame should be used. `min_area` / `max_area` bound the
+    accepted box as a share of the frame; `margin` pads it (share of the
+    frame's long side).
+    """
+    w, h = img.size
+    scale = min(1.0, DETECT_SIDE / max(w, h))
+    sw, sh = max(8, round(w * scale)), max(8, round(h * scale))
+    small = img.resize((sw, sh), Image.BILINEAR, reducing_gap=2.0).convert("L")
+    edges = small.filter(ImageFilter.FIND_EDGES).point(lambda v: 255 if v >= EDGE_THRESHOLD else 0)
+    # the filter leaves the outermost pixels unfiltered; they are not edges
+    edges = edges.crop((1, 1, sw - 1, sh - 1))
+
+    cell = max(sw, sh) / GRID_CELLS
+    gw, gh = max(1, round((sw - 2) / cell)), max(1, round((sh - 2) / cell))
+    density = list(edges.resize((gw, gh), Image.BOX).tobytes())  # mean per cell, 0-255
+    mean = sum(density) / len(density)
+    if mean <= 0:
+        return None
+    std = (sum((d - mean) ** 2 for d in density) / len(density)) ** 0.5
+    # texture and noise give a low, even density; text gives a few much denser cells
+    threshold = max(mean + 1.5 * std, 2.5 * mean, 8.0)
+
+    hot = [[density[y * gw + x] >= threshold for x in range(gw)] for y in range(gh)]
+    groups = _components(hot)
+    if not groups:
+        return None
+    scored = sorted(((sum(density[y * gw + x] for y, x in g), g) for g in groups), key=lambda t: -t[0])
+    best = scored[0][0]
+    cells = [c for score, g in scored if score >= best * KEEP_RATIO for c in g]
+
+    ys = [y for y, _ in cells]
+    xs = [x for _, x in cells]
+    # grid -> image pixels (+1: the cropped filter border)
+    fx, fy = w / sw, h / sh
+    pad = margin * max(w, h)
+    left = max(0, int((min(xs) * cell + 1) * fx - pad))
+    top = max(0, int((min(ys) * cell + 1) * fy - pad))
+    right = min(w, int(((max(xs) + 1) * cell + 1) * fx + pad))
+    bottom = min(h, int(((max(ys) + 1) * cell + 1) * fy + pad))
+
+    area = (right - left) * (bottom - top) / (w * h)
+    if area < min_area or area > max_area:
+        return None
+    return left, top, right, bottom
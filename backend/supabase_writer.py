@@ -0,0 +1,229 @@
+# backend/supabase_writer.py
+import asyncio
+import logging
+import random
+import socket
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+import metrics
+
+logger = logging.getLogger("ndt-image")
+
+# statuses worth retrying: rate limiting and upstream/gateway trouble
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class SupabaseWriter:
+    """
+    Write-behind buffer for product rows.
+
+    Rows passed to insert() are collected for up to `max_wait_ms` (or until
+    `max_batch` rows are waiting) and sent to PostgREST as one JSON-array
+    insert over a shared keep-alive connection pool. Transient failures are
+    retried with exponential backoff and jitter. If a bulk insert is rejected
+    outright, its rows are retried one by one so a single bad row doesn't
+    fail the others. Every caller gets its own row's result.
+
+    With `on_conflict` (comma-separated columns) rows are upserted
+    (resolution=merge-duplicates), so writing a row again - e.g. when a
+    job is resumed after its insert result was lost - updates it instead
+    of adding a copy. That needs a unique index on those columns; if the
+    table has none, PostgREST answers 42P10 and the writer falls back to
+    plain inserts.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str],
+        key: Optional[str],
+        table: str,
+        max_batch: int = 20,
+        max_wait_ms: float = 250,
+        max_connections: int = 10,
+        max_retries: int = 4,
+        timeout: float = 20.0,
+        on_conflict: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = url
+        self.key = key
+        self.table = table
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.on_conflict = on_conflict or None
+        # custom httpx transport (e.g. httpx.MockTransport in benchmarks); set before first use
+        self.transport = transport
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self._stats = {"rows": 0, "requests": 0, "retries": 0, "failed_rows": 0, "upserts": 0}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.url and self.key)
+
+    @property
+    def endpoint(self) -> str:
+        return f"{self.url.rstrip('/')}/rest/v1/{self.table}"
+
+    def client(self) -> httpx.AsyncClient:
+        """Shared, long-lived HTTP client (created on first use)."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0,
+                ),
+                headers={
+                    "apikey": self.key or "",
+                    "Authorization": f"Bearer {self.key}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._client
+
+    async def warmup(self) -> Dict[str, Any]:
+        """
+        Open a pooled connection (DNS, TCP, TLS) with a HEAD request that reads
+        no rows, so the first real insert doesn't pay for it. Any HTTP status
+        counts: the connection is what matters.
+        """
+        if not self.configured:
+            return {"configured": False}
+        r = await self.client().head(self.endpoint, params={"limit": "0"})
+        return {"status": r.status_code}
+
+    async def insert(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue one row; resolves with {"ok": True, "data": [row]} or an error dict."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((row, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._write(items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, items: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        rows = [row for row, _ in items]
+        try:
+            result = await self._post(rows)
+            if not result["ok"] and len(rows) > 1 and result.get("status"):
+                # rejected as a whole (e.g. one row violates a constraint): isolate the bad rows
+                logger.warning("Bulk insert of %d rows rejected (status=%s); retrying rows one by one", len(rows), result["status"])
+                results = [await self._post([row]) for row in rows]
+            else:
+                results = self._split(result, len(rows))
+        except Exception as e:
+            logger.exception("Unexpected error while contacting Supabase: %s", e)
+            results = [{"ok": False, "reason": "unexpected", "error": str(e)}] * len(rows)
+
+        for (_, fut), res in zip(items, results):
+            if not res["ok"]:
+                self._stats["failed_rows"] += 1
+            if not fut.done():
+                fut.set_result(res)
+
+    @staticmethod
+    def _split(result: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+        """Turn one bulk result into per-row results (PostgREST keeps row order)."""
+        if not result["ok"]:
+            return [result] * n
+        data = result.get("data")
+        if isinstance(data, list) and len(data) == n:
+            return [{"ok": True, "data": [item]} for item in data]
+        return [{"ok": True, "data": data}] * n
+
+    async def _post(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """POST rows as one JSON array, retrying transient failures."""
+        attempt = 0
+        while True:
+            self._stats["requests"] += 1
+            on_conflict = self.on_conflict
+            params = {"on_conflict": on_conflict} if on_conflict else None
+            prefer = "return=representation,resolution=merge-duplicates" if on_conflict else "return=representation"
+            try:
+                with metrics.span("supabase_request"):
+                    resp = await self.client().post(
+                        self.endpoint,
+                        json=rows,
+                        params=params,
+                        headers={"Prefer": prefer},
+                    )
+                status = resp.status_code
+                logger.info("Supabase bulk %s of %d rows: status=%s", "upsert" if on_conflict else "insert", len(rows), status)
+                if on_conflict and status == 400 and "42P10" in resp.text:
+                    # no unique index matching on_conflict: insert as before rather than fail every row
+                    logger.error(
+                        "Table %s has no unique index on (%s); upserts disabled, resumed jobs may duplicate rows",
+                        self.table, on_conflict,
+                    )
+                    self.on_conflict = None
+                    continue
+                if 200 <= status < 300:
+                    self._stats["rows"] += len(rows)
+                    if on_conflict:
+                        self._stats["upserts"] += len(rows)
+                    try:
+                        data = resp.json()
+                    except Exception:
+                        data = resp.text
+                    return {"ok": True, "data": data}
+                if status not in TRANSIENT_STATUSES or attempt >= self.max_retries:
+                    logger.warning("Supabase insert failed status=%s body=%s", status, resp.text)
+                    return {"ok": False, "status": status, "body": resp.text}
+            except (httpx.TransportError, socket.gaierror) as e:
+                if attempt >= self.max_retries:
+                    logger.error("Supabase unreachable after %d attempts: %s", attempt + 1, e)
+                    return {"ok": False, "reason": _reason(e), "error": str(e)}
+
+            attempt += 1
+            self._stats["retries"] += 1
+            delay = min(10.0, 0.5 * 2 ** (attempt - 1)) * (0.5 + random.random())
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        """Flush buffered rows and close the connection pool."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self._stats)
+        out["pending"] = len(self._pending)
+        out["on_conflict"] = self.on_conflict
+        return out
+
+
+def _reason(e: BaseException) -> str:
+    if isinstance(e, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(e, socket.gaierror):
+        return "dns_error"
+    if isinstance(e, httpx.ConnectError):
+        return "connect_error"
+    return "unexpected"
@@ -0,0 +1,11 @@
+# backend/tests/conftest.py
+import os
+import sys
+
+# the backend modules import each other flatly (as when run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# no process pool, no Supabase retries, nothing read from a local .env
+os.environ.setdefault("OCR_CPU_WORKERS", "0")
+os.environ.setdefault("SUPABASE_MAX_RETRIES", "0")
+os.environ.setdefault("OCR_SPOOL_DIR", "off")
@@ -0,0 +1,36 @@
+# backend/tests/test_finish_job.py
+import uuid
+
+import pytest
+
+import pipeline
+
+
+def finished_job(*inserts_ok):
+    """A job whose groups all ran; each group's Supabase insert succeeded or not."""
+    batch_id = str(uuid.uuid4())
+    pipeline.job_store.create(batch_id, "processing")
+    for ok in inserts_ok:
+        product_no = pipeline.job_store.add_group(batch_id, ["a.jpg"])
+        result = {"product_no": product_no, "supabase": {"ok": ok}}
+        pipeline.job_store.set_group_status(batch_id, product_no, "done", result=result)
+    assert pipeline.finish_job(batch_id)
+    return pipeline.job_store.get(batch_id, include_results=False)
+
+
+def test_count_is_rows_inserted():
+    job = finished_job(True, True, True)
+    assert (job["status"], job["count"], job.get("error")) == ("done", 3, None)
+
+
+def test_job_whose_inserts_all_failed_has_failed():
+    job = finished_job(False, False, False)
+    assert (job["status"], job["count"]) == ("failed", 0)
+    assert "no product was inserted" in job["error"]
+
+
+@pytest.mark.parametrize("inserts_ok", [(True, False, True), (False, True)])
+def test_partly_inserted_job_says_what_is_missing(inserts_ok):
+    job = finished_job(*inserts_ok)
+    assert (job["status"], job["count"]) == ("done", sum(inserts_ok))
+    assert job["error"].startswith(f"{inserts_ok.count(False)} of {len(inserts_ok)} products")
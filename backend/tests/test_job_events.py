@@ -0,0 +1,50 @@
+# backend/tests/test_job_events.py
+import asyncio
+import json
+import time
+
+from job_events import JobEventBus, job_event_stream
+from job_store import MemoryJobStore
+
+
+def test_change_made_while_a_delta_is_sent_is_not_delayed():
+    store, bus = MemoryJobStore(), JobEventBus()
+    store.add_listener(bus.notify)
+    store.create("b", "processing")
+    store.add_group("b", ["1.jpg"])
+    store.add_group("b", ["2.jpg"])
+
+    async def main():
+        stream = job_event_stream(store, bus, "b", poll_interval=5.0)
+        assert (await stream.__anext__()).startswith("event: snapshot")
+        store.set_group_status("b", 1, "running")
+        first = await stream.__anext__()
+        # the stream is suspended on that delta when the next change lands
+        store.set_group_status("b", 2, "running")
+        t0 = time.monotonic()
+        second = await asyncio.wait_for(stream.__anext__(), timeout=2.0)
+        await stream.aclose()
+        return first, second, time.monotonic() - t0
+
+    first, second, waited = asyncio.run(main())
+    data = [json.loads(e.split("data: ", 1)[1]) for e in (first, second)]
+    assert [(d["product_no"], d["status"]) for d in data] == [(1, "running"), (2, "running")]
+    assert waited < 1.0  # not a poll interval late
+
+
+def test_stream_ends_with_the_job():
+    store, bus = MemoryJobStore(), JobEventBus()
+    store.add_listener(bus.notify)
+    store.create("b", "processing")
+    store.add_group("b", ["1.jpg"])
+
+    async def main():
+        events = []
+        async for event in job_event_stream(store, bus, "b", poll_interval=5.0):
+            events.append(event.split("\n", 1)[0])
+            if len(events) == 1:
+                store.set_group_status("b", 1, "done", result={"product_no": 1})
+                store.update("b", status="done", count=1)
+        return events
+
+    assert asyncio.run(asyncio.wait_for(main(), timeout=3.0)) == ["event: snapshot", "event: group", "event: done"]
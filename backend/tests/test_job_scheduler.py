@@ -0,0 +1,113 @@
+# backend/tests/test_job_scheduler.py
+import asyncio
+import uuid
+
+from job_scheduler import GroupScheduler
+
+
+class Groups:
+    """Fake groups that run until the test lets them finish; records how many ran at once."""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.done = []
+        self.release = asyncio.Event()
+
+    async def run(self, name):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await self.release.wait()
+        finally:
+            self.running -= 1
+        self.done.append(name)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_at_most_max_concurrent_groups_run():
+    async def main():
+        scheduler, groups = GroupScheduler(2), Groups()
+        tasks = [scheduler.submit(groups.run(i)) for i in range(5)]
+        await settle()
+        assert scheduler.stats() == {"max_concurrent_groups": 2, "running": 2, "waiting": 3}
+        groups.release.set()
+        await asyncio.gather(*tasks)
+        assert groups.peak == 2 and sorted(groups.done) == [0, 1, 2, 3, 4]
+        assert (scheduler.running, scheduler.waiting) == (0, 0)
+
+    asyncio.run(main())
+
+
+def test_wait_for_capacity_holds_back_a_full_round_of_queued_groups():
+    async def main():
+        scheduler, groups = GroupScheduler(2), Groups()
+        tasks = [scheduler.submit(groups.run(i)) for i in range(3)]
+        await settle()
+        # 2 running, 1 waiting: there is room for one more in the queue
+        await asyncio.wait_for(scheduler.wait_for_capacity(), 1)
+        tasks.append(scheduler.submit(groups.run(3)))
+        await settle()
+
+        waiter = asyncio.ensure_future(scheduler.wait_for_capacity())
+        await asyncio.sleep(0.05)
+        assert not waiter.done() and scheduler.waiting == 2
+        groups.release.set()  # running groups finish, queued ones start
+        await asyncio.wait_for(waiter, 1)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+
+def test_cancelled_queued_group_leaves_the_queue():
+    async def main():
+        scheduler, groups = GroupScheduler(1), Groups()
+        first = scheduler.submit(groups.run("first"))
+        queued = scheduler.submit(groups.run("queued"))
+        await settle()
+        assert scheduler.waiting == 1
+        queued.cancel()
+        await settle()
+        assert (scheduler.running, scheduler.waiting) == (1, 0)
+        groups.release.set()
+        await first
+        assert groups.done == ["first"]
+
+    asyncio.run(main())
+
+
+def test_start_group_registers_groups_in_order_and_runs_them_on_the_scheduler(monkeypatch):
+    import main
+
+    ran = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def process_group(batch_id, product_no, images=None):
+            ran.append((product_no, [name for name, _ in images]))
+            await release.wait()
+
+        scheduler = GroupScheduler(2)
+        monkeypatch.setattr(main, "scheduler", scheduler)
+        monkeypatch.setattr(main, "process_group", process_group)
+        monkeypatch.setattr(main, "work_queue", None)
+
+        batch_id = str(uuid.uuid4())
+        await main._new_job(batch_id, "processing")
+        images = [(f"{i}.jpg", b"x") for i in range(7)]
+        tasks = [await main._start_group(batch_id, group) for group in main.chunked(images, 3)]
+        await settle()
+        assert (scheduler.running, scheduler.waiting) == (2, 1)
+        release.set()
+        await asyncio.gather(*tasks)
+        return main.job_store.get(batch_id)["groups"]
+
+    job_groups = asyncio.run(run())
+    assert [g["product_no"] for g in job_groups] == [1, 2, 3]
+    assert [g["files"] for g in job_groups] == [["0.jpg", "1.jpg", "2.jpg"], ["3.jpg", "4.jpg", "5.jpg"], ["6.jpg"]]
+    assert sorted(ran) == [(1, ["0.jpg", "1.jpg", "2.jpg"]), (2, ["3.jpg", "4.jpg", "5.jpg"]), (3, ["6.jpg"])]
@@ -0,0 +1,53 @@
+# backend/tests/test_layout.py
+import math
+
+import pytest
+
+import pipeline
+from nameplate_parser import layout_plausible, parse_text, parse_words
+from ocr_words import WordBoxes
+
+
+def plate(rows, degrees=0.0, char_w=18, height=30, gap=16, pitch=40):
+    """Word boxes of `rows` printed on a plate turned by `degrees` (axis-aligned boxes, as engines give them)."""
+    t = math.tan(math.radians(degrees))
+    words = WordBoxes()
+    for r, row in enumerate(rows):
+        x = 20
+        for text in row.split():
+            w = char_w * len(text)
+            y = 40 + r * pitch + x * t
+            words.add(text, (x, int(y), x + w, int(y + height + w * abs(t))), 0.95)
+            x += w + gap
+    return words
+
+
+ROWS = ["DN 50 TYPE GATE VALVE CLASS 150", "PN 16 BODY WCB DISC CF8M", "SERIAL NO SN 2231-0457", "DATE 2023-04"]
+
+
+@pytest.mark.parametrize("degrees", [0, 2, 4, -4, 6])
+def test_lines_survive_a_tilted_plate(degrees):
+    assert plate(ROWS, degrees).text().splitlines() == ROWS
+
+
+def test_serial_label_words_are_not_the_value():
+    assert parse_words(plate(["SERIAL NO SN 2231-0457"]))["fields"]["serial_number"] == "SERIAL NO SN 2231-0457"
+    assert parse_words(plate(["SERIAL NO. 2231-0457"]))["fields"]["serial_number"] == "SERIAL NO. 2231-0457"
+    assert parse_words(plate(["SERIAL NO SN2231-0457"]))["fields"]["serial_number"] == "SN2231-0457"
+
+
+def test_layout_values_under_their_labels_are_plausible():
+    words = plate(["DN PN", "50 16"], gap=120)
+    layout = parse_words(words)["fields"]
+    assert (layout["dn"], layout["pn"]) == ("DN 50", "PN 16")
+    assert layout_plausible(layout, parse_text(words.text())["fields"])
+
+
+def test_implausible_layout_falls_back_to_the_text():
+    text = "\n".join(ROWS)
+    # boxes that put every word on its own line: the layout pairs no label with its value
+    words = WordBoxes()
+    for i, word in enumerate(text.split()):
+        words.add(word, (20, 40 + 40 * i, 120, 70 + 40 * i), 0.95)
+    assert not layout_plausible(parse_words(words)["fields"], parse_text(text)["fields"])
+    assert pipeline._parse_pass(text, words) == parse_text(text)
@@ -0,0 +1,21 @@
+# backend/tests/test_metrics.py
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics
+
+
+def test_serve_http_exposes_the_registry():
+    server = metrics.serve_http(0, host="127.0.0.1")
+    try:
+        url = "http://127.0.0.1:%d" % server.server_address[1]
+        with urllib.request.urlopen(url + "/metrics") as resp:
+            assert resp.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert "# TYPE ocr_stage_duration_seconds histogram" in resp.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,109 @@
+# backend/tests/test_near_dup.py
+import asyncio
+import io
+import random
+from typing import List
+
+import pytest
+from PIL import Image
+
+import pipeline
+from bench_pipeline import make_nameplate
+from fake_vision import CANNED_TEXTS
+from near_dup import REUSE_DISTANCE, NearDuplicateIndex, texts_agree
+from ocr_engines import OCREngine, OCRResult
+
+
+class PlateEngine(OCREngine):
+    """Reads whatever plate the test says is in front of it."""
+
+    name = "plate"
+
+    def __init__(self):
+        self.text = ""
+        self.images = 0
+
+    async def recognize_many(self, items):
+        self.images += len(items)
+        return [OCRResult(self.text, 0.99, self.name) for _ in items]
+
+    def recognize(self, content, mode="document"):
+        return OCRResult(self.text, 0.99, self.name)
+
+
+def plate(serial: str) -> str:
+    return CANNED_TEXTS[0].replace("SN 2231", f"SN {serial}", 1)
+
+
+def reencode(data: bytes, quality: int) -> bytes:
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def reuse(monkeypatch):
+    """Reuse mode with a fresh index, a fake engine and a perfect quick read of the current plate."""
+    engine = PlateEngine()
+    monkeypatch.setattr(pipeline, "ocr_engine", engine)
+    monkeypatch.setattr(pipeline, "NEAR_DUP_MODE", "reuse")
+    monkeypatch.setattr(pipeline, "near_dup_index", NearDuplicateIndex(max_distance=16))
+
+    async def quick_read(data):
+        return engine.text
+
+    monkeypatch.setattr(pipeline, "_quick_read", quick_read)
+    return engine
+
+
+def run(engine: PlateEngine, text: str, data: bytes) -> dict:
+    engine.text = text
+    return asyncio.run(pipeline.ocr_group_images([("plate.jpg", data)]))[0]
+
+
+def test_texts_agree():
+    assert texts_agree(plate("5305"), plate("5305"))
+    assert not texts_agree(plate("5305"), plate("3517"))
+    assert not texts_agree("", plate("5305"))
+
+
+def test_different_serials_are_not_reused(reuse):
+    rng = random.Random(4)
+    serials: List[str] = []
+    results: List[dict] = []
+    for _ in range(6):
+        serials.append(f"{rng.randint(0, 9999):04d}")
+        results.append(run(reuse, plate(serials[-1]), make_nameplate(plate(serials[-1]), 1, rng)))
+
+    for serial, r in zip(serials, results):
+        assert "near-dup" not in r["engines"]
+        assert serial in r["fields"]["serial_number"]
+    # some are close enough to reuse by distance alone; only the read kept them apart
+    assert any(r["duplicate_of"] and r["duplicate_of"]["distance"] <= REUSE_DISTANCE for r in results)
+
+
+def test_reshoot_of_the_same_plate_is_reused(reuse):
+    rng = random.Random(3)
+    text = plate("4410")
+    shot = make_nameplate(text, 1, rng)
+    run(reuse, text, shot)
+    before = reuse.images
+
+    r = run(reuse, text, reencode(shot, 70))
+    assert r["engines"] == ["near-dup"]
+    assert r["duplicate_of"]["reused"]
+    assert reuse.images == before
+
+
+def test_nothing_is_reused_without_a_quick_read(reuse, monkeypatch):
+    async def no_reader(data):
+        return None
+
+    monkeypatch.setattr(pipeline, "_quick_read", no_reader)
+    rng = random.Random(3)
+    text = plate("4410")
+    shot = make_nameplate(text, 1, rng)
+    run(reuse, text, shot)
+    r = run(reuse, text, reencode(shot, 70))
+    assert r["engines"] == ["plate"]
+    assert r["duplicate_of"] and not r["duplicate_of"]["reused"]
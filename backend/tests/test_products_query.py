@@ -0,0 +1,98 @@
+# backend/tests/test_products_query.py
+import asyncio
+import random
+import re
+
+import httpx
+import pytest
+
+from products_query import build_params, decode_cursor, encode_cursor, parse_columns, split_page
+
+# 40 rows over 6 timestamps: most pages end inside a run of equal created_at
+ROWS = [
+    {"id": i, "created_at": f"2024-05-0{1 + i % 6}T10:00:00+00:00", "serial_number": f"SN {i:04d}"}
+    for i in range(1, 41)
+]
+
+
+def postgrest(rows, params):
+    """The part of PostgREST /products uses: the keyset `or` filter, newest first, limit."""
+    out = list(rows)
+    if "or" in params:
+        m = re.fullmatch(r'\(created_at\.lt\."(.+)",and\(created_at\.eq\."(.+)",id\.lt\."(.+)"\)\)', params["or"])
+        lt, eq, row_id = m.groups()
+        out = [r for r in out if r["created_at"] < lt or (r["created_at"] == eq and r["id"] < int(row_id))]
+    out.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+    cols = params["select"].split(",")
+    return [{c: r[c] for c in cols} for r in out[: int(params["limit"])]]
+
+
+@pytest.mark.parametrize("row", [
+    {"created_at": "2024-05-01T10:00:00.123456+00:00", "id": 17},
+    {"created_at": "2024-05-01 10:00:00+02:00", "id": "9f1c-uuid"},
+    {"created_at": None, "id": 3},
+])
+def test_cursor_round_trip(row):
+    cursor = encode_cursor(row)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor  # safe in a query string
+    assert decode_cursor(cursor) == (row["created_at"], row["id"])
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", encode_cursor({"id": 1})[:-3] + "xyz"])
+def test_bad_cursor_is_a_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_page_boundaries():
+    cols = parse_columns("serial_number")
+    newest = postgrest(ROWS, build_params(cols, 10))
+    assert len(newest) == 11  # one look-ahead row
+
+    page, cursor = split_page(newest, 10, cols)
+    assert len(page) == 10 and set(page[0]) == {"serial_number"}  # key columns only used for the cursor
+    assert decode_cursor(cursor) == (newest[9]["created_at"], newest[9]["id"])
+
+    # exactly `limit` rows left: the last page, no cursor
+    assert split_page(newest[:10], 10, cols)[1] is None
+    assert split_page([], 10, cols) == ([], None)
+
+
+@pytest.mark.parametrize("limit", [1, 3, 7, 10, 40, 100])
+def test_walking_the_pages_sees_every_row_once(limit):
+    cols = parse_columns("id,created_at")
+    seen, cursor = [], None
+    while True:
+        page, cursor = split_page(postgrest(ROWS, build_params(cols, limit, cursor)), limit, cols)
+        seen.extend(r["id"] for r in page)
+        if cursor is None:
+            break
+    expected = [r["id"] for r in sorted(ROWS, key=lambda r: (r["created_at"], r["id"]), reverse=True)]
+    assert seen == expected
+
+
+def test_products_endpoint_keeps_a_plain_array_and_links_the_next_page(monkeypatch):
+    import main
+
+    rows = random.Random(3).sample(ROWS, len(ROWS))
+    writer = main.supabase_writer
+    monkeypatch.setattr(writer, "url", "http://supabase.test")
+    monkeypatch.setattr(writer, "key", "k")
+    monkeypatch.setattr(writer, "transport", httpx.MockTransport(lambda req: httpx.Response(200, json=postgrest(rows, dict(req.url.params)))))
+    monkeypatch.setattr(writer, "_client", None)
+
+    async def walk():
+        seen = []
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://t") as c:
+            url = "/products?limit=15&columns=id"
+            while url:
+                resp = await c.get(url)
+                assert resp.status_code == 200 and isinstance(resp.json(), list)
+                seen.extend(r["id"] for r in resp.json())
+                link = resp.links.get("next")
+                assert (link is None) == ("X-Next-Cursor" not in resp.headers)
+                url = link["url"] if link else None
+        await writer.aclose()
+        return seen
+
+    assert sorted(asyncio.run(walk())) == list(range(1, 41))
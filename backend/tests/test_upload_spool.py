@@ -0,0 +1,60 @@
+# backend/tests/test_upload_spool.py
+import asyncio
+import uuid
+
+import pytest
+
+import pipeline
+from upload_spool import UploadSpool
+
+IMAGES = [("a.jpg", b"first"), ("b.jpg", b"second")]
+CHECKPOINT = {"files": ["a.jpg", "b.jpg"], "parsed": {}, "raw_text": "", "casting_lines": [], "images": []}
+
+
+@pytest.fixture
+def spool(monkeypatch, tmp_path):
+    spool = UploadSpool(str(tmp_path))
+    monkeypatch.setattr(pipeline, "upload_spool", spool)
+
+    async def insert(**kwargs):
+        return {"ok": True}
+
+    monkeypatch.setattr(pipeline, "insert_product_to_supabase", insert)
+    return spool
+
+
+def new_group():
+    batch_id = str(uuid.uuid4())
+    pipeline.job_store.create(batch_id, "processing")
+    return batch_id, pipeline.job_store.add_group(batch_id, [name for name, _ in IMAGES])
+
+
+def ocr_group_that(fails: bool):
+    async def ocr_group(images):
+        if fails:
+            raise RuntimeError("vision is down")
+        assert images == IMAGES
+        return CHECKPOINT
+    return ocr_group
+
+
+def test_inline_groups_are_not_written_to_disk(spool, monkeypatch):
+    monkeypatch.setattr(pipeline, "ocr_group", ocr_group_that(fails=False))
+    batch_id, product_no = new_group()
+    asyncio.run(pipeline.process_group(batch_id, product_no, IMAGES))
+    assert spool.stats()["groups_saved"] == 0
+    assert spool.load_group(batch_id, product_no) is None
+
+
+def test_failed_group_is_spooled_and_resumed_from_disk(spool, monkeypatch):
+    monkeypatch.setattr(pipeline, "ocr_group", ocr_group_that(fails=True))
+    batch_id, product_no = new_group()
+    asyncio.run(pipeline.process_group(batch_id, product_no, IMAGES))
+    assert pipeline.job_store.get(batch_id)["groups"][0]["status"] == "failed"
+    assert spool.load_group(batch_id, product_no) == IMAGES
+
+    # resume: no images passed, they come back from the spool, which is cleared once inserted
+    monkeypatch.setattr(pipeline, "ocr_group", ocr_group_that(fails=False))
+    asyncio.run(pipeline.process_group(batch_id, product_no))
+    assert pipeline.job_store.get(batch_id)["groups"][0]["status"] == "done"
+    assert spool.load_group(batch_id, product_no) is None
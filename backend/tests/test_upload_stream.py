@@ -0,0 +1,117 @@
+# backend/tests/test_upload_stream.py
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from upload_stream import iter_upload_files
+
+BOUNDARY = "----ndt-test-boundary"
+
+
+def multipart(parts):
+    """parts: (field, filename or None, bytes)."""
+    body = b""
+    for field, filename, data in parts:
+        disposition = f'form-data; name="{field}"' + (f'; filename="{filename}"' if filename is not None else "")
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def received(body, chunk_size=7, content_type=f"multipart/form-data; boundary={BOUNDARY}", **kwargs):
+    """Run iter_upload_files over `body` arriving in `chunk_size` pieces; the files in the order they were yielded."""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def receive():
+        chunk = chunks.pop(0) if chunks else b""
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    request = Request({"type": "http", "method": "POST", "headers": [(b"content-type", content_type.encode())]}, receive)
+
+    async def collect():
+        return [f async for f in iter_upload_files(request, "files", **kwargs)]
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_files_come_out_in_order_whatever_the_chunking(chunk_size):
+    body = multipart([
+        ("files", "a.jpg", b"\xff\xd8first\r\n--not-the-boundary"),
+        ("note", None, b"ignored form field"),
+        ("files", "b.jpg", b""),
+        ("other", "c.jpg", b"file in another field"),
+        ("files", "d.jpg", b"x" * 300),
+    ])
+    assert received(body, chunk_size) == [
+        ("a.jpg", b"\xff\xd8first\r\n--not-the-boundary"),
+        ("b.jpg", b""),
+        ("d.jpg", b"x" * 300),
+    ]
+
+
+def test_file_over_the_limit_is_a_413():
+    at_limit = [("files", "a.jpg", b"x" * 100)]
+    assert received(multipart(at_limit), max_file_bytes=100) == [("a.jpg", b"x" * 100)]
+    with pytest.raises(HTTPException) as e:
+        received(multipart(at_limit + [("files", "big.jpg", b"x" * 101)]), max_file_bytes=100)
+    assert e.value.status_code == 413 and "big.jpg" in e.value.detail
+
+
+def test_non_multipart_body_is_a_415():
+    with pytest.raises(HTTPException) as e:
+        received(b"{}", content_type="application/json")
+    assert e.value.status_code == 415
+
+
+def stream_upload(monkeypatch, names, max_file_bytes=None):
+    """POST (name, size) files to /ocr-bulk/stream with the groups stubbed out; the response and the job."""
+    import main
+
+    batch_ids = set()
+
+    async def process_group(batch_id, product_no, images=None):
+        batch_ids.add(batch_id)
+
+    monkeypatch.setattr(main, "process_group", process_group)
+    monkeypatch.setattr(main, "work_queue", None)
+    if max_file_bytes:
+        monkeypatch.setattr(main, "MAX_FILE_BYTES", max_file_bytes)
+
+    async def run():
+        files = [("files", (name, b"x" * size, "image/jpeg")) for name, size in names]
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://t") as c:
+            resp = await c.post("/ocr-bulk/stream", files=files)
+        await asyncio.gather(*main._BATCH_TASKS)
+        return resp
+
+    resp = asyncio.run(run())
+    assert len(batch_ids) <= 1
+    return resp, main.job_store.get(batch_ids.pop()) if batch_ids else None
+
+
+@pytest.mark.parametrize("count, groups", [
+    (1, [1]),
+    (3, [3]),
+    (4, [3, 1]),
+    (7, [3, 3, 1]),
+    (9, [3, 3, 3]),
+])
+def test_stream_groups_every_3_files(monkeypatch, count, groups):
+    names = [(f"{i}.jpg", 10) for i in range(count)]
+    resp, job = stream_upload(monkeypatch, names)
+    assert resp.status_code == 200 and resp.json()["groups"] == len(groups)
+    assert job["batch_id"] == resp.json()["batch_id"]
+    assert [g["product_no"] for g in job["groups"]] == list(range(1, len(groups) + 1))
+    assert [len(g["files"]) for g in job["groups"]] == groups
+    assert [f for g in job["groups"] for f in g["files"]] == [name for name, _ in names]
+
+
+def test_stream_rejects_an_oversized_file_and_keeps_the_groups_before_it(monkeypatch):
+    names = [(f"{i}.jpg", 10) for i in range(3)] + [("big.jpg", 11)]
+    resp, job = stream_upload(monkeypatch, names, max_file_bytes=10)
+    assert resp.status_code == 413 and "big.jpg" in resp.json()["detail"]
+    assert "big.jpg" in job["intake_error"]
+    assert [g["files"] for g in job["groups"]] == [["0.jpg", "1.jpg", "2.jpg"]]
@@ -0,0 +1,58 @@
+# backend/tests/test_vision_budget.py
+import asyncio
+import sqlite3
+import threading
+
+from vision_control import SQLiteBudget, VisionController
+
+
+def test_processes_share_one_budget(tmp_path):
+    path = str(tmp_path / "queue.db")
+    # two workers' controllers on the same file
+    a, b = SQLiteBudget(path, images_per_minute=60), SQLiteBudget(path, images_per_minute=60)
+    assert a.take(40) == 0
+    wait = b.take(40)
+    assert 15 < wait <= 20  # 20 images short at 1 image / s
+    assert 19 < a.left() < 21
+
+
+def test_controller_waits_for_the_shared_budget(tmp_path):
+    budget = SQLiteBudget(str(tmp_path / "queue.db"), images_per_minute=600)
+    controller = VisionController(images_per_minute=600, budget=budget)
+    budget.take(600)
+
+    async def call():
+        return "ok"
+
+    assert asyncio.run(controller.run(5, call)) == "ok"  # ~0.5 s for 5 images at 10 / s
+    assert controller.stats()["budget_waits"] == 1
+    assert controller.stats()["budget_shared"]
+
+
+def test_a_locked_budget_file_does_not_stall_the_loop(tmp_path):
+    path = str(tmp_path / "queue.db")
+    controller = VisionController(images_per_minute=600, budget=SQLiteBudget(path, images_per_minute=600))
+    # another worker in the middle of a write
+    other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, other.execute, ("COMMIT",)).start()
+
+    async def call():
+        return "ok"
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        t = asyncio.ensure_future(ticker())
+        assert await controller.run(1, call) == "ok"
+        t.cancel()
+        return ticks
+
+    assert asyncio.run(main()) >= 10
+    assert controller.stats()["budget_left"] is not None
@@ -0,0 +1,84 @@
+# backend/tests/test_worker.py
+import asyncio
+import types
+
+from executors import pipeline_executor
+from work_queue import WorkQueue
+from worker import Worker
+
+
+class ListQueue(WorkQueue):
+    def __init__(self, *tasks, lease_kept=True):
+        self.tasks = [{"id": i, "batch_id": "b", "product_no": p, "attempts": 1} for i, p in enumerate(tasks)]
+        self.lease_kept = lease_kept
+        self.completed = []
+        self.released = []
+
+    def put(self, batch_id, product_no):
+        raise AssertionError("workers don't put")
+
+    def claim(self, worker_id, lease):
+        return self.tasks.pop(0) if self.tasks else None
+
+    def extend(self, task_id, worker_id, lease):
+        return self.lease_kept
+
+    def complete(self, task_id):
+        self.completed.append(task_id)
+
+    def release(self, task_id):
+        self.released.append(task_id)
+
+    def stats(self):
+        return {}
+
+
+def fake_pipeline(seconds):
+    calls = {"started": [], "finished": [], "cancelled": [], "jobs_finished": 0}
+
+    async def process_group(batch_id, product_no):
+        calls["started"].append(product_no)
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            calls["cancelled"].append(product_no)
+            raise
+        calls["finished"].append(product_no)
+
+    def finish_job(batch_id):
+        calls["jobs_finished"] += 1
+
+    return types.SimpleNamespace(process_group=process_group, finish_job=finish_job, pipeline_executor=pipeline_executor), calls
+
+
+def run_until_idle(worker, queue, timeout=2.0):
+    async def main():
+        runner = asyncio.ensure_future(worker.run())
+        deadline = asyncio.get_running_loop().time() + timeout
+        while (queue.tasks or worker._running) and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+        worker.stop()
+        await runner
+
+    asyncio.run(main())
+
+
+def test_groups_run_and_complete():
+    queue = ListQueue(1, 2, 3)
+    worker = Worker(queue, concurrency=2, lease=30, poll_interval=0.01)
+    worker.pipeline, calls = fake_pipeline(0.05)
+    run_until_idle(worker, queue)
+    assert sorted(calls["finished"]) == [1, 2, 3]
+    assert sorted(queue.completed) == [0, 1, 2]
+    assert calls["jobs_finished"] == 3
+
+
+def test_lost_lease_stops_the_group_and_leaves_it_to_the_new_owner():
+    queue = ListQueue(1, lease_kept=False)
+    worker = Worker(queue, concurrency=1, lease=0.06, poll_interval=0.01)
+    worker.pipeline, calls = fake_pipeline(1.0)
+    run_until_idle(worker, queue)
+    assert calls["cancelled"] == [1] and not calls["finished"]
+    # the other worker completes the task and closes the job
+    assert (queue.completed, queue.released, calls["jobs_finished"]) == ([], [], 0)
+    assert worker.stats()["lost_leases"] == 1
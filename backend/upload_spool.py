@@ -0,0 +1,143 @@
+# backend/upload_spool.py
+"""
+Uploaded images on disk, so /ocr-job/{id}/resume can redo a group without
+a new upload and OCR workers (worker.py) can read the groups the API took.
+
+    <root>/<batch_id>/<product_no>/manifest.json   ["file name", ...]
+    <root>/<batch_id>/<product_no>/0, 1, 2         image bytes
+
+In worker mode every group is written here on upload and removed once its
+row is inserted. Inline, groups stay in memory and only those that fail
+before their OCR finished are written (see pipeline.process_group).
+Batches left behind (failed groups nobody resumed) are swept after `ttl`
+seconds, the job store's TTL. Blocking file I/O: call through
+pipeline_executor.run_io.
+
+OCR_SPOOL_DIR sets the root (default: <tmp>/ndt-ocr-spool); "off" disables
+spooling, and resume can then only re-insert groups whose OCR finished.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("ndt-image")
+
+
+class UploadSpool:
+    def __init__(self, root: Optional[str], ttl: float = 24 * 3600, sweep_interval: float = 600.0):
+        self.root = root
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._stats = {"groups_saved": 0, "groups_loaded": 0, "groups_dropped": 0, "batches_swept": 0}
+        if root:
+            os.makedirs(root, exist_ok=True)
+            logger.info("Upload spool at %s", root)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def _dir(self, batch_id: str, product_no: Optional[int] = None) -> str:
+        # batch ids are uuid4 strings we generated; never let one escape the root
+        safe = "".join(c for c in batch_id if c.isalnum() or c == "-")
+        path = os.path.join(self.root, safe)
+        return path if product_no is None else os.path.join(path, str(int(product_no)))
+
+    def save_group(self, batch_id: str, product_no: int, images: List[Tuple[str, bytes]]) -> None:
+        if not self.enabled:
+            return
+        path = self._dir(batch_id, product_no)
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for i, (_, data) in enumerate(images):
+            with open(os.path.join(tmp, str(i)), "wb") as f:
+                f.write(data)
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump([name for name, _ in images], f)
+        # complete groups only: a crash mid-write leaves just the .tmp directory
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        with self._lock:
+            self._stats["groups_saved"] += 1
+        self._maybe_sweep()
+
+    def load_group(self, batch_id: str, product_no: int) -> Optional[List[Tuple[str, bytes]]]:
+        """The group's (filename, bytes) list, or None if it isn't spooled."""
+        if not self.enabled:
+            return None
+        path = self._dir(batch_id, product_no)
+        try:
+            with open(os.path.join(path, "manifest.json")) as f:
+                names = json.load(f)
+            images = []
+            for i, name in enumerate(names):
+                with open(os.path.join(path, str(i)), "rb") as f:
+                    images.append((name, f.read()))
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._stats["groups_loaded"] += 1
+        return images
+
+    def drop_group(self, batch_id: str, product_no: int) -> None:
+        if not self.enabled:
+            return
+        shutil.rmtree(self._dir(batch_id, product_no), ignore_errors=True)
+        try:
+            os.rmdir(self._dir(batch_id))  # only succeeds once the batch's last group is gone
+        except OSError:
+            pass
+        with self._lock:
+            self._stats["groups_dropped"] += 1
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep()
+
+    def sweep(self) -> int:
+        """Remove batch directories untouched for `ttl` seconds; returns how many."""
+        if not self.enabled:
+            return 0
+        cutoff = time.time() - self.ttl
+        removed = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError as e:
+            logger.warning("Upload spool sweep failed: %s", e)
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        with self._lock:
+            self._stats["batches_swept"] += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        out["root"] = self.root
+        return out
+
+
+def _spool_root() -> Optional[str]:
+    root = os.getenv("OCR_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "ndt-ocr-spool")).strip()
+    return None if root.lower() in ("", "0", "off", "false", "no") else root
+
+
+upload_spool = UploadSpool(_spool_root(), ttl=float(os.getenv("OCR_JOB_TTL", 24 * 3600)))
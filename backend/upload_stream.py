@@ -0,0 +1,86 @@
+# backend/upload_stream.py
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+async def iter_upload_files(
+    request: Request,
+    field: str = "files",
+    max_file_bytes: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Parse a multipart/form-data body incrementally and yield (filename, bytes)
+    for every file part named `field` as soon as that part has been received.
+    Other form fields are ignored. Only the part being received is buffered.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data upload")
+
+    completed: List[Tuple[str, bytes]] = []
+    part: Dict = {}
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, field=b"", value=b"", data=bytearray(), too_large=False)
+
+    def on_header_field(data: bytes, start: int, end: int):
+        part["field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"], part["value"] = b"", b""
+
+    def on_headers_finished():
+        _, disp = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        name = disp.get(b"name", b"").decode("utf-8", "replace")
+        filename = disp.get(b"filename")
+        part["wanted"] = name == field and filename is not None
+        part["filename"] = filename.decode("utf-8", "replace") if filename is not None else None
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if not part.get("wanted") or part["too_large"]:
+            return
+        part["data"] += data[start:end]
+        if max_file_bytes and len(part["data"]) > max_file_bytes:
+            part["too_large"] = True
+            part["data"] = bytearray()
+
+    def on_part_end():
+        if part.get("wanted"):
+            if part["too_large"]:
+                raise HTTPException(status_code=413, detail=f"{part['filename']} exceeds {max_file_bytes} bytes")
+            completed.append((part["filename"], bytes(part["data"])))
+        part.clear()
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+
+    async for chunk in request.stream():
+        if chunk:
+            parser.write(chunk)
+        while completed:
+            yield completed.pop(0)
+    parser.finalize()
+    while completed:
+        yield completed.pop(0)
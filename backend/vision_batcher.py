@@ -0,0 +1,184 @@
+# backend/vision_batcher.py
+import asyncio
+import logging
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+
+import metrics
+from executors import pipeline_executor
+from vision_client import VisionError, vision_clients
+from vision_control import VisionController, vision_controller
+
+logger = logging.getLogger("ndt-image")
+
+# Vision accepts at most 16 images per batch_annotate_images call
+VISION_MAX_BATCH_SIZE = 16
+
+batch_images = metrics.registry.register(metrics.Histogram(
+    "ocr_vision_batch_images", "Images per batch_annotate_images call.",
+    buckets=(1, 2, 4, 8, 12, 16),
+))
+
+# OCR mode -> Vision feature type name (vision_v1 is imported on first send)
+_FEATURES = {
+    "document": "DOCUMENT_TEXT_DETECTION",
+    "text": "TEXT_DETECTION",
+}
+
+
+class VisionBatcher:
+    """
+    Collects OCR requests into batch_annotate_images calls.
+
+    Requests submitted together (annotate_many) always share a batch; requests
+    from other groups that arrive within `max_wait_ms` are added to the same
+    call, up to `max_batch_size` images / `max_batch_bytes` of image data.
+    While every Vision slot is busy the window is extended, so requests
+    queue up into fuller batches instead of many small ones.
+    Each response is routed back to the caller that submitted the image.
+
+    Calls go through `controller` (concurrency, quota budget, retries; see
+    vision_control.py). Images that fail on their own with a transient error
+    are sent again in a smaller batch; other per-image errors are raised
+    to that image's caller as VisionError.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = VISION_MAX_BATCH_SIZE,
+        max_batch_bytes: int = 16 * 1024 * 1024,
+        max_wait_ms: float = 20,
+        controller: VisionController = vision_controller,
+    ):
+        self.max_batch_size = max(1, min(max_batch_size, VISION_MAX_BATCH_SIZE))
+        self.max_batch_bytes = max_batch_bytes
+        self.max_wait = max_wait_ms / 1000.0
+        self.controller = controller
+
+        self._pending: List[Tuple[bytes, str, asyncio.Future]] = []
+        self._pending_bytes = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.batches_sent = 0
+        self.images_sent = 0
+        self.images_retried = 0
+
+    async def annotate(self, content: bytes, mode: str = "document") -> Any:
+        return (await self.annotate_many([(content, mode)]))[0]
+
+    async def annotate_many(self, items: Sequence[Tuple[bytes, str]], return_exceptions: bool = False) -> List[Any]:
+        """
+        OCR several (content, mode) items; returns one AnnotateImageResponse per
+        item (or, with return_exceptions, the VisionError of an item that failed).
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for content, mode in items:
+            if mode not in _FEATURES:
+                raise ValueError(f"unknown OCR mode: {mode}")
+            if self._pending and (
+                len(self._pending) >= self.max_batch_size
+                or self._pending_bytes + len(content) > self.max_batch_bytes
+            ):
+                self._flush()
+            fut = loop.create_future()
+            self._pending.append((content, mode, fut))
+            self._pending_bytes += len(content)
+            futures.append(fut)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._on_timer)
+
+        return list(await asyncio.gather(*futures, return_exceptions=return_exceptions))
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        if self._pending and not self.controller.has_capacity():
+            # every Vision slot is busy: keep collecting, a fuller batch goes out when one frees up
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._on_timer)
+            return
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        items, self._pending, self._pending_bytes = self._pending, [], 0
+        task = asyncio.ensure_future(self._send(items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, items: List[Tuple[bytes, str, asyncio.Future]]) -> None:
+        attempt = 0
+        while items:
+            requests = [(content, mode) for content, mode, _ in items]
+            batch_images.observe(len(requests))
+            try:
+                responses = await self.controller.run(
+                    len(requests), lambda: pipeline_executor.run_io(annotate_batch_sync, requests)
+                )
+            except VisionError as e:
+                logger.error("batch_annotate_images failed for %d images: %s", len(items), e)
+                for _, _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+
+            self.batches_sent += 1
+            self.images_sent += len(items)
+            retry = []
+            for item, resp in zip(items, responses):
+                fut = item[2]
+                if fut.done():
+                    continue
+                if resp.error.message:
+                    error = VisionError.from_status(resp.error)
+                    if error.transient and attempt < self.controller.max_retries:
+                        retry.append(item)
+                    else:
+                        fut.set_exception(error)
+                else:
+                    fut.set_result(resp)
+
+            if retry:
+                attempt += 1
+                self.images_retried += len(retry)
+                throttled = sum(1 for resp in responses if resp.error.message and VisionError.from_status(resp.error).throttled)
+                if throttled:
+                    self.controller.note_throttled(throttled)
+                await asyncio.sleep(self.controller.backoff(attempt))
+            items = retry
+
+    def stats(self) -> dict:
+        return {
+            "batches_sent": self.batches_sent,
+            "images_sent": self.images_sent,
+            "images_retried": self.images_retried,
+            "pending": len(self._pending),
+        }
+
+
+def annotate_batch_sync(requests: Sequence[Tuple[bytes, str]]) -> List[Any]:
+    """One blocking batch_annotate_images RPC; responses are in request order."""
+    from google.cloud import vision_v1
+
+    reqs = [
+        vision_v1.AnnotateImageRequest(
+            image=vision_v1.Image(content=content),
+            features=[vision_v1.Feature(type_=vision_v1.Feature.Type[_FEATURES[mode]])],
+        )
+        for content, mode in requests
+    ]
+    resp = vision_clients.call(lambda client: client.batch_annotate_images(requests=reqs))
+    return list(resp.responses)
+
+
+vision_batcher = VisionBatcher(
+    max_batch_size=int(os.getenv("VISION_BATCH_MAX_SIZE", VISION_MAX_BATCH_SIZE)),
+    max_batch_bytes=int(os.getenv("VISION_BATCH_MAX_BYTES", 16 * 1024 * 1024)),
+    max_wait_ms=float(os.getenv("VISION_BATCH_WINDOW_MS", "20")),
+)
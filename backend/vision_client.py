@@ -0,0 +1,286 @@
+# backend/vision_client.py
+"""
+Process-wide Google Vision client.
+
+The google-cloud-vision package (and the gRPC stack behind it) is imported
+on first use, not at import time, so the web server starts without paying
+for it; the start-up warmup (pipeline.make_warmup) builds the client
+right after startup.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger("ndt-image")
+
+# google.rpc.Code values Vision reports per image (resp.error.code)
+DEADLINE_EXCEEDED = 4
+RESOURCE_EXHAUSTED = 8
+ABORTED = 10
+INTERNAL = 13
+UNAVAILABLE = 14
+TRANSIENT_CODES = {DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED, ABORTED, INTERNAL, UNAVAILABLE}
+# the same conditions as HTTP statuses (google.api_core exceptions carry these in .code)
+_HTTP_CODES = {429: RESOURCE_EXHAUSTED, 409: ABORTED, 500: INTERNAL, 503: UNAVAILABLE, 504: DEADLINE_EXCEEDED}
+
+
+class VisionError(Exception):
+    """
+    A failed Vision call or image. `code` is the google.rpc.Code (None when
+    unknown); `transient` errors are worth retrying, `throttled` ones mean
+    the quota or rate limit was hit.
+    """
+
+    def __init__(self, message: str, code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+
+    @property
+    def transient(self) -> bool:
+        return self.code in TRANSIENT_CODES
+
+    @property
+    def throttled(self) -> bool:
+        return self.code == RESOURCE_EXHAUSTED
+
+    @classmethod
+    def from_status(cls, status) -> "VisionError":
+        """From the google.rpc.Status of a per-image response (resp.error)."""
+        return cls(status.message, status.code or None)
+
+    @classmethod
+    def from_exception(cls, e: BaseException) -> "VisionError":
+        """Classify an exception raised by a Vision RPC."""
+        if isinstance(e, VisionError):
+            return e
+        from google.api_core import exceptions as gexc
+        from google.auth import exceptions as auth_exc
+
+        if isinstance(e, gexc.GoogleAPICallError):
+            code = _HTTP_CODES.get(e.code)
+        elif isinstance(e, (TimeoutError, ConnectionError, auth_exc.TransportError)):
+            code = UNAVAILABLE
+        else:
+            code = None
+        return cls(f"{type(e).__name__}: {e}", code)
+
+
+_rebuild_errors: Optional[Tuple[type, ...]] = None
+
+
+def rebuild_errors() -> Tuple[type, ...]:
+    """Errors that a fresh client (new credentials / new channel) can fix."""
+    global _rebuild_errors
+    if _rebuild_errors is None:
+        from google.api_core import exceptions as gexc
+        from google.auth import exceptions as auth_exc
+
+        _rebuild_errors = (
+            auth_exc.RefreshError,
+            auth_exc.TransportError,
+            gexc.Unauthenticated,
+            gexc.ServiceUnavailable,
+        )
+    return _rebuild_errors
+
+
+def build_vision_client():
+    """
+    Create a Google Vision client.
+
+    Preferred: set GOOGLE_APPLICATION_CREDENTIALS_JSON env var to the JSON contents of
+    the service account key (safe when stored in Render as a secret).
+    Fallback: use default ADC (e.g., GOOGLE_APPLICATION_CREDENTIALS file on local dev).
+    Local stub: VISION_API_ENDPOINT=http://host:port (see fake_vision.py) talks
+    REST to that endpoint with anonymous credentials.
+    """
+    from google.cloud import vision_v1
+
+    endpoint = os.environ.get("VISION_API_ENDPOINT")
+    if endpoint:
+        from google.auth.credentials import AnonymousCredentials
+
+        client = vision_v1.ImageAnnotatorClient(
+            transport="rest",
+            credentials=AnonymousCredentials(),
+            client_options={"api_endpoint": endpoint},
+        )
+        logger.info("Vision client using endpoint %s", endpoint)
+        return client
+
+    creds_json = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+    # Only try to load if it looks like real JSON data (starts with {) and isn't just whitespace
+    if creds_json and creds_json.strip() and creds_json.strip().startswith("{"):
+        try:
+            from google.oauth2 import service_account
+
+            info = json.loads(creds_json)
+            credentials = service_account.Credentials.from_service_account_info(info)
+            client = vision_v1.ImageAnnotatorClient(credentials=credentials)
+            logger.info("Vision client created from GOOGLE_APPLICATION_CREDENTIALS_JSON")
+            return client
+        except Exception as e:
+            logger.exception("Failed to create Vision client from env JSON: %s", e)
+            # Don't raise here; fall back to trying file-based credentials if JSON failed/was garbage
+            logger.warning("Falling back to file-based credentials due to JSON error.")
+
+    # fallback to application default credentials (useful for local dev when GOOGLE_APPLICATION_CREDENTIALS points to a file)
+    try:
+        # HARDCODED FALLBACK: If env var is missing, try the known file in root
+        if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+            hardcoded_path = os.path.abspath("../image-extract-476710-c6a143e5254f.json")
+            if os.path.exists(hardcoded_path):
+                logger.info("Setting GOOGLE_APPLICATION_CREDENTIALS to hardcoded path: %s", hardcoded_path)
+                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = hardcoded_path
+
+        client = vision_v1.ImageAnnotatorClient()
+        logger.info("Vision client created using default credentials")
+        return client
+    except Exception as e:
+        logger.exception("Failed to create Vision client using default credentials: %s", e)
+        raise
+
+
+class VisionClientManager:
+    """
+    One ImageAnnotatorClient per process, created on first use and shared by
+    all threads. The client is rebuilt when a call fails with a credential or
+    channel error (see rebuild_errors); the failed call is retried once.
+    """
+
+    def __init__(self, factory: Callable[[], Any] = build_vision_client):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "builds": 0,
+            "rebuilds": 0,
+            "calls": 0,
+            "errors": 0,
+            "built_at": None,
+            "build_seconds": None,
+            "last_error": None,
+            "channel_state": None,
+            "channel_state_changes": 0,
+        }
+        self.inflight = 0
+
+    def get(self):
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                t0 = time.perf_counter()
+                self._client = self._factory()
+                self._stats["builds"] += 1
+                self._stats["built_at"] = time.time()
+                self._stats["build_seconds"] = round(time.perf_counter() - t0, 4)
+                self._watch_channel(self._client)
+            return self._client
+
+    def warmup(self, timeout: float = 10.0) -> Dict[str, Any]:
+        """
+        Build the client and, for gRPC transports, connect its channel
+        (TLS handshake, HTTP/2 setup) without sending an RPC. Blocking.
+        """
+        client = self.get()
+        try:
+            channel = client.transport.grpc_channel
+        except Exception:
+            # REST transport or a fake: nothing to pre-connect
+            return {"channel": None}
+        import grpc
+
+        grpc.channel_ready_future(channel).result(timeout=timeout)
+        return {"channel": "ready"}
+
+    def set_factory(self, factory: Callable[[], Any]) -> None:
+        """Build clients with `factory` from now on (e.g. a fake for benchmarks)."""
+        with self._lock:
+            self._factory = factory
+        self.invalidate(reason="client factory replaced")
+
+    def _count(self, key: str, error: Optional[BaseException] = None) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+            if error is not None:
+                self._stats["last_error"] = f"{type(error).__name__}: {error}"
+
+    def _watch_channel(self, client) -> None:
+        """Track gRPC connectivity changes (if the transport exposes a channel)."""
+        try:
+            channel = client.transport.grpc_channel
+        except Exception:
+            return
+
+        def on_change(state):
+            self._stats["channel_state"] = getattr(state, "name", str(state))
+            self._count("channel_state_changes")
+
+        try:
+            channel.subscribe(on_change, try_to_connect=False)
+        except Exception:
+            logger.debug("Vision channel does not support connectivity callbacks")
+
+    def invalidate(self, client=None, reason: str = "") -> None:
+        """Drop the current client (only if it is still `client`, when given)."""
+        with self._lock:
+            if self._client is None or (client is not None and self._client is not client):
+                return
+            old, self._client = self._client, None
+            self._stats["channel_state"] = None
+        self._count("rebuilds")
+        logger.warning("Vision client invalidated (%s); it will be rebuilt", reason)
+        try:
+            old.transport.close()
+        except Exception:
+            pass
+
+    def call(self, fn: Callable[[Any], Any]) -> Any:
+        """Run fn(client); rebuild the client and retry once on credential/channel errors."""
+        client = self.get()
+        with self._stats_lock:
+            self.inflight += 1
+        try:
+            self._count("calls")
+            try:
+                with metrics.span("vision_rpc"):
+                    return fn(client)
+            except Exception as e:
+                self._count("errors", e)
+                if not isinstance(e, rebuild_errors()):
+                    raise
+                self.invalidate(client, reason=type(e).__name__)
+            self._count("calls")
+            with metrics.span("vision_rpc"):
+                return fn(self.get())
+        finally:
+            with self._stats_lock:
+                self.inflight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        out = dict(self._stats)
+        out["connected"] = self._client is not None
+        out["inflight"] = self.inflight
+        return out
+
+
+vision_clients = VisionClientManager()
+
+
+def response_text(resp, mode: str = "document") -> str:
+    """Full text of an AnnotateImageResponse for the given OCR mode."""
+    if mode == "document":
+        if resp.full_text_annotation:
+            return resp.full_text_annotation.text or ""
+        return ""
+    if resp.text_annotations:
+        return resp.text_annotations[0].description
+    return ""
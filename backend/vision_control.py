@@ -0,0 +1,308 @@
+# backend/vision_control.py
+"""
+Flow control for Vision calls (used by vision_batcher for every
+batch_annotate_images call).
+
+- concurrency: at most `limit` calls in flight. The limit adapts AIMD-style:
+  +1/limit per call that came back in normal time (about +1 per round of
+  calls), x0.5 when Vision throttles (RESOURCE_EXHAUSTED), x0.8 on deadline /
+  unavailable errors or when a call takes `latency_tolerance` times longer
+  than the recent fastest one. At most one decrease per latency period, so
+  one burst of failures counts once. The limit where Vision last throttled
+  is remembered; close to it the limit grows ten times slower, so it probes
+  the quota instead of running into it every few calls.
+- budget: images per minute (Vision counts each image of a batch as a
+  request against the quota), as a token bucket refilled continuously.
+  Calls wait for budget instead of being rejected.
+- retries: transient failures (see vision_client.VisionError) are retried
+  up to `max_retries` times with exponential backoff and jitter.
+
+With OCR workers (OCR_WORK_QUEUE=sqlite) every worker process has its own
+controller, so the limits are made per deployment: the budget bucket lives
+in the work queue's SQLite file (SQLiteBudget) and all workers on the host
+draw from it, and VISION_CONCURRENCY / VISION_MAX_CONCURRENCY are split
+evenly over OCR_WORKERS, the number of workers started (at least 1 each).
+Takes from the shared bucket run on the IO pool, and stats() reports the
+bucket as this process last saw it, so neither waits on the file lock.
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from executors import PipelineExecutor, pipeline_executor
+from vision_client import VisionError
+
+logger = logging.getLogger("ndt-image")
+
+T = TypeVar("T")
+
+
+class SQLiteBudget:
+    """The images-per-minute token bucket in a SQLite file, shared by the processes using it."""
+
+    def __init__(self, path: str, images_per_minute: float, timeout: float = 30.0):
+        self.path = path
+        self.images_per_minute = images_per_minute
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vision_budget ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1), tokens REAL NOT NULL, refilled REAL NOT NULL)"
+        )
+        self._db.execute("INSERT OR IGNORE INTO vision_budget VALUES (1, ?, ?)", (images_per_minute, time.time()))
+        self._seen = (float(images_per_minute), time.time())  # bucket as of this process's last take
+
+    def _refilled(self, tokens: float, refilled: float, now: float) -> float:
+        # wall clock, not monotonic: the timestamp is compared across processes
+        return min(float(self.images_per_minute), tokens + max(0.0, now - refilled) * self.images_per_minute / 60.0)
+
+    def take(self, images: float) -> float:
+        """
+        Take `images` from the bucket: 0 when taken, else the seconds until
+        there are enough. Blocks on the file lock while other processes
+        take: call it through the IO pool.
+        """
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                tokens = self._refilled(*cur.execute("SELECT tokens, refilled FROM vision_budget").fetchone(), now)
+                wait = 0.0 if tokens >= images else (images - tokens) / (self.images_per_minute / 60.0)
+                if not wait:
+                    tokens -= images
+                cur.execute("UPDATE vision_budget SET tokens = ?, refilled = ?", (tokens, now))
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            self._seen = (tokens, now)
+        return wait
+
+    def left(self) -> float:
+        with self._lock:
+            row = self._db.execute("SELECT tokens, refilled FROM vision_budget").fetchone()
+        return self._refilled(*row, time.time())
+
+    def estimate(self) -> float:
+        """What is left by this process's last take, refilled since; no I/O (stats, /metrics)."""
+        return self._refilled(*self._seen, time.time())
+
+
+class VisionController:
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        images_per_minute: float = 1800,
+        max_retries: int = 4,
+        latency_tolerance: float = 3.0,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        budget: Optional[SQLiteBudget] = None,
+        executor: PipelineExecutor = pipeline_executor,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.images_per_minute = images_per_minute
+        self.max_retries = max_retries
+        self.latency_tolerance = latency_tolerance
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget  # shared bucket; None: this process's own
+        self.executor = executor
+
+        self.inflight = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self._tokens = float(images_per_minute)
+        self._refilled = time.monotonic()
+        self._baseline: Optional[float] = None  # recent fastest call, seconds
+        self._last_decrease = 0.0
+        self._ceiling: Optional[float] = None  # limit at the last throttle
+        self._stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "decreases": 0, "budget_waits": 0}
+
+    # created lazily so it binds to the running event loop
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    # ---- budget ----
+    def _refill(self) -> None:
+        now = time.monotonic()
+        rate = self.images_per_minute / 60.0
+        self._tokens = min(float(self.images_per_minute), self._tokens + (now - self._refilled) * rate)
+        self._refilled = now
+
+    async def _take(self, images: float) -> float:
+        """0 when `images` were taken from the budget, else the seconds to wait."""
+        if self.budget is not None:
+            # a write to the shared file, which can wait on other workers: off the loop
+            return await self.executor.run_io(self.budget.take, images)
+        self._refill()
+        if self._tokens >= images:
+            self._tokens -= images
+            return 0.0
+        return (images - self._tokens) / (self.images_per_minute / 60.0)
+
+    async def _take_budget(self, images: int) -> None:
+        if self.images_per_minute <= 0:
+            return
+        # a batch bigger than the whole budget waits for a full bucket
+        need = min(float(images), float(self.images_per_minute))
+        waited = False
+        while True:
+            wait = await self._take(need)
+            if not wait:
+                return
+            if not waited:
+                self._stats["budget_waits"] += 1
+                waited = True
+            await asyncio.sleep(wait)
+
+    # ---- concurrency ----
+    def has_capacity(self) -> bool:
+        """A call could start now (concurrency only; the budget may still make it wait)."""
+        return self.inflight < int(self.limit)
+
+    async def acquire(self, images: int = 1) -> None:
+        await self._take_budget(images)
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(self.has_capacity)
+            self.inflight += 1
+
+    async def release(self, latency: Optional[float] = None, error: Optional[VisionError] = None) -> None:
+        """Return a slot; `latency` of a successful call or the `error` of a failed one adjust the limit."""
+        if error is not None and error.throttled:
+            self._throttled()
+        elif error is not None and error.transient:
+            self._decrease(0.8, str(error))
+        elif latency is not None:
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                # drift up slowly so the baseline follows a lasting change (e.g. bigger batches)
+                self._baseline += (latency - self._baseline) * 0.05
+            if latency > self._baseline * self.latency_tolerance:
+                self._decrease(0.8, f"slow call {latency:.2f}s vs {self._baseline:.2f}s")
+            else:
+                self._increase()
+        cond = self._condition()
+        async with cond:
+            self.inflight -= 1
+            cond.notify_all()
+
+    def _increase(self) -> None:
+        step = 1.0 / self.limit
+        if self._ceiling is not None:
+            if self.limit > self._ceiling + 1:
+                # well past the old throttling point: the quota went up
+                self._ceiling = None
+            elif self.limit + 1 > self._ceiling:
+                step /= 10
+        self.limit = min(float(self.max_limit), self.limit + step)
+
+    def _throttled(self) -> None:
+        if self._decrease(0.5, "throttled"):
+            self._ceiling = self.limit * 2
+
+    def _decrease(self, factor: float, reason: str) -> bool:
+        now = time.monotonic()
+        if now - self._last_decrease < (self._baseline or 1.0):
+            return False
+        self._last_decrease = now
+        old = self.limit
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self._stats["decreases"] += 1
+        logger.info("Vision concurrency %.1f -> %.1f (%s)", old, self.limit, reason)
+        return True
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (1-based): exponential, +-50% jitter."""
+        return min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * (0.5 + random.random())
+
+    # ---- calls ----
+    async def run(self, images: int, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await fn() within the limits; transient failures are retried. Errors
+        come out as VisionError.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(images)
+            self._stats["calls"] += 1
+            t0 = time.perf_counter()
+            try:
+                result = await fn()
+            except Exception as e:
+                error = VisionError.from_exception(e)
+                await self.release(error=error)
+                if error.throttled:
+                    self._stats["throttled"] += 1
+                if not error.transient or attempt >= self.max_retries:
+                    self._stats["failures"] += 1
+                    if error is e:
+                        raise
+                    raise error from e
+                attempt += 1
+                self._stats["retries"] += 1
+                delay = self.backoff(attempt)
+                logger.warning("Vision call failed (%s); retry %d/%d in %.1f s", error, attempt, self.max_retries, delay)
+                await asyncio.sleep(delay)
+                continue
+            await self.release(latency=time.perf_counter() - t0)
+            return result
+
+    def note_throttled(self, images: int) -> None:
+        """Images of a successful call that Vision throttled individually."""
+        self._stats["throttled"] += images
+        self._throttled()
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        out: Dict[str, Any] = dict(self._stats)
+        out.update(
+            limit=round(self.limit, 2),
+            inflight=self.inflight,
+            baseline_seconds=round(self._baseline, 4) if self._baseline is not None else None,
+            ceiling=round(self._ceiling, 2) if self._ceiling is not None else None,
+            images_per_minute=self.images_per_minute,
+            budget_shared=self.budget is not None,
+        )
+        if self.images_per_minute <= 0:
+            out["budget_left"] = None
+        else:
+            out["budget_left"] = round(self.budget.estimate() if self.budget is not None else self._tokens, 1)
+        return out
+
+
+def controller_from_env() -> VisionController:
+    images_per_minute = float(os.getenv("VISION_IMAGES_PER_MINUTE", "1800"))
+    budget = None
+    workers = 1
+    if os.getenv("OCR_WORK_QUEUE", "inline").lower() == "sqlite":
+        # one controller per worker process: share the quota, split the concurrency
+        workers = max(1, int(os.getenv("OCR_WORKERS", "1")))
+        if images_per_minute > 0:
+            budget = SQLiteBudget(os.getenv("OCR_WORK_QUEUE_DB", "work_queue.db"), images_per_minute)
+    return VisionController(
+        initial=max(1, int(os.getenv("VISION_CONCURRENCY", "4")) // workers),
+        min_limit=int(os.getenv("VISION_MIN_CONCURRENCY", "1")),
+        max_limit=max(1, int(os.getenv("VISION_MAX_CONCURRENCY", "8")) // workers),
+        images_per_minute=images_per_minute,
+        max_retries=int(os.getenv("VISION_MAX_RETRIES", "4")),
+        latency_tolerance=float(os.getenv("VISION_LATENCY_TOLERANCE", "3.0")),
+        budget=budget,
+    )
+
+
+vision_controller = controller_from_env()
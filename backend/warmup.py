@@ -0,0 +1,68 @@
+# backend/warmup.py
+"""
+Start-up warmup, run in the background once the server is accepting
+requests: build the Vision client and connect its channel, open the
+Supabase connection pool, start the image worker processes. /ready answers
+503 until it has finished, so a load balancer only sends uploads to a warm
+instance; a request that arrives earlier still works, it just pays for
+whatever isn't warm yet.
+
+Steps run concurrently, each bounded by `timeout`. A failed step is
+reported (and logged) but doesn't keep the instance unready: everything
+warmed here is also created on first use.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("ndt-image")
+
+
+class Warmup:
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+        self.steps: List[Tuple[str, Callable[[], Awaitable[Any]]]] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def step(self, name: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        self.steps.append((name, fn))
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    def start(self) -> None:
+        """Run the steps in a background task (call from the running event loop)."""
+        self.started_at = time.time()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _one(self, name: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        t0 = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(fn(), timeout=self.timeout)
+            self._results[name] = {"ok": True, "seconds": round(time.perf_counter() - t0, 3), "result": result}
+        except Exception as e:
+            error = "timed out" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+            self._results[name] = {"ok": False, "seconds": round(time.perf_counter() - t0, 3), "error": error}
+            logger.warning("Warmup step %s failed after %.1f s: %s", name, time.perf_counter() - t0, error)
+
+    async def _run(self) -> None:
+        await asyncio.gather(*(self._one(name, fn) for name, fn in self.steps))
+        self.finished_at = time.time()
+        logger.info("Warmup finished in %.2f s: %s", self.finished_at - self.started_at, self._results)
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "seconds": round(self.finished_at - self.started_at, 3) if self.ready else None,
+            "steps": {name: self._results.get(name, {"ok": None}) for name, _ in self.steps},
+        }
@@ -0,0 +1,156 @@
+# backend/work_queue.py
+"""
+Group tasks handed from the API process to OCR workers (worker.py).
+
+The API registers a group in the job store, spools its images
+(upload_spool.py) and puts {batch_id, product_no} here; a worker claims the
+task, runs the group and completes it. A claim is a lease: a worker that
+dies mid-group stops extending it, and once it runs out the task is
+claimed again (up to `max_attempts` claims in all).
+
+Backends (OCR_WORK_QUEUE):
+  inline - no queue; the API process runs groups itself (default)
+  sqlite - a SQLite file (OCR_WORK_QUEUE_DB) shared by the API and the
+           workers on one host
+
+Another backend (e.g. a Redis list + lease keys, for workers on other
+machines) implements WorkQueue. Workers elsewhere also need the job store
+and the spooled images, which today are SQLite / local-disk only.
+"""
+import abc
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger("ndt-image")
+
+
+class WorkQueue(abc.ABC):
+    """A task is {"id", "batch_id", "product_no", "attempts"}."""
+
+    max_attempts = 3
+
+    @abc.abstractmethod
+    def put(self, batch_id: str, product_no: int) -> None:
+        ...
+
+    @abc.abstractmethod
+    def claim(self, worker_id: str, lease: float) -> Optional[Dict[str, Any]]:
+        """The oldest unclaimed (or lease-expired) task, now leased to `worker_id`; None if there is none."""
+
+    @abc.abstractmethod
+    def extend(self, task_id: Any, worker_id: str, lease: float) -> bool:
+        """Renew a lease; False if the task is no longer this worker's (it expired and was claimed again)."""
+
+    @abc.abstractmethod
+    def complete(self, task_id: Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    def release(self, task_id: Any) -> None:
+        """Hand an unfinished task back (e.g. a worker shutting down) so another worker picks it up now."""
+
+    @abc.abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path: str, max_attempts: int = 3, timeout: float = 30.0):
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS work_queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, batch_id TEXT NOT NULL, product_no INTEGER NOT NULL,"
+            " worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS work_queue_lease ON work_queue (lease_until)")
+        logger.info("Work queue at %s", path)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        """One write transaction, taken up front (BEGIN IMMEDIATE) so two workers never claim the same task."""
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+
+    def put(self, batch_id: str, product_no: int) -> None:
+        with self._transaction() as cur:
+            cur.execute(
+                "INSERT INTO work_queue (batch_id, product_no, created_at) VALUES (?, ?, ?)",
+                (batch_id, product_no, time.time()),
+            )
+
+    def claim(self, worker_id: str, lease: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._transaction() as cur:
+            # unclaimed tasks have lease_until NULL; expired leases are up for grabs again
+            row = cur.execute(
+                "SELECT id, batch_id, product_no, attempts FROM work_queue"
+                " WHERE lease_until IS NULL OR lease_until < ? ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            task_id, batch_id, product_no, attempts = row
+            cur.execute(
+                "UPDATE work_queue SET worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + lease, task_id),
+            )
+        return {"id": task_id, "batch_id": batch_id, "product_no": product_no, "attempts": attempts + 1}
+
+    def extend(self, task_id: Any, worker_id: str, lease: float) -> bool:
+        with self._transaction() as cur:
+            return cur.execute(
+                "UPDATE work_queue SET lease_until = ? WHERE id = ? AND worker = ?",
+                (time.time() + lease, task_id, worker_id),
+            ).rowcount == 1
+
+    def complete(self, task_id: Any) -> None:
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM work_queue WHERE id = ?", (task_id,))
+
+    def release(self, task_id: Any) -> None:
+        with self._transaction() as cur:
+            # the interrupted claim doesn't count as an attempt
+            cur.execute(
+                "UPDATE work_queue SET worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0) WHERE id = ?",
+                (task_id,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued, claimed = self._db.execute(
+                "SELECT COUNT(*) - COUNT(lease_until), COUNT(lease_until) FROM work_queue"
+            ).fetchone()
+        return {"backend": "sqlite", "path": self.path, "queued": queued, "claimed": claimed, "max_attempts": self.max_attempts}
+
+
+def work_queue_from_env() -> Optional[WorkQueue]:
+    """The configured queue, or None when groups run inline in the API process."""
+    backend = os.getenv("OCR_WORK_QUEUE", "inline").lower()
+    if backend == "sqlite":
+        return SQLiteWorkQueue(
+            os.getenv("OCR_WORK_QUEUE_DB", "work_queue.db"),
+            max_attempts=int(os.getenv("OCR_WORK_MAX_ATTEMPTS", "3")),
+        )
+    if backend != "inline":
+        raise ValueError(f"unknown OCR_WORK_QUEUE {backend!r}; use 'inline' or 'sqlite'")
+    return None
+
+
+work_queue = work_queue_from_env()
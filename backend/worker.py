@@ -0,0 +1,223 @@
+# backend/worker.py
+"""
+OCR worker: claims group tasks from the work queue (work_queue.py) and
+runs them with the same pipeline the API uses inline (pipeline.py). Start
+the API and any number of workers on the host with the same settings:
+
+    OCR_WORK_QUEUE=sqlite OCR_JOB_STORE=sqlite uvicorn main:app
+    OCR_WORK_QUEUE=sqlite OCR_JOB_STORE=sqlite python -m worker
+
+The API then only takes uploads and answers status requests. Each worker
+runs up to OCR_WORKER_CONCURRENCY groups at a time (default
+OCR_MAX_CONCURRENT_GROUPS) and keeps their leases alive while they run;
+SIGTERM / SIGINT stop claiming, let running groups finish for up to
+OCR_WORKER_DRAIN seconds and hand the rest back to the queue.
+
+A worker has no API; set OCR_WORKER_METRICS_PORT (one port per worker, 0
+for any free one) to serve its /metrics for Prometheus. Set OCR_WORKERS to
+the number of workers started: the Vision concurrency limits are split
+over them, and all of them share one images-per-minute budget (see
+vision_control.py).
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set
+
+import metrics
+
+if TYPE_CHECKING:
+    from work_queue import WorkQueue
+
+# The pipeline modules are imported when the worker starts, not here: the CPU
+# pool spawns processes that re-import this module (as __mp_main__), and
+# they shouldn't open the job store, the queue and the caches each.
+
+logger = logging.getLogger("ndt-image")
+
+
+class Worker:
+    def __init__(
+        self,
+        queue: "WorkQueue",
+        concurrency: int = 2,
+        lease: float = 120.0,
+        poll_interval: float = 0.5,
+        drain_timeout: float = 60.0,
+        worker_id: Optional[str] = None,
+    ):
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.drain_timeout = drain_timeout
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        import pipeline
+
+        self.pipeline = pipeline
+        self._running: Set[asyncio.Task] = set()
+        self._stopping = False
+        self._wake: Optional[asyncio.Event] = None
+        self._stats = {"claimed": 0, "completed": 0, "abandoned": 0, "released": 0, "lost_leases": 0}
+
+    # created lazily so it binds to the running event loop
+    def _wake_event(self) -> asyncio.Event:
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        return self._wake
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wake_event().set()
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        self._wake_event().set()
+
+    async def _io(self, fn, *args, **kwargs):
+        # queue and job store calls are SQLite writes that can wait on other
+        # workers; off the loop, so they never hold up a heartbeat
+        return await self.pipeline.pipeline_executor.run_io(fn, *args, **kwargs)
+
+    async def run(self) -> None:
+        """Claim and run tasks until stop(), then drain."""
+        wake = self._wake_event()
+        logger.info("Worker %s started (%d groups at a time)", self.worker_id, self.concurrency)
+        while not self._stopping:
+            task = None
+            if len(self._running) < self.concurrency:
+                task = await self._io(self.queue.claim, self.worker_id, self.lease)
+            if task is None:
+                # idle, or every slot busy: wait for the next poll, a free slot or stop()
+                wake.clear()
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._stats["claimed"] += 1
+            t = asyncio.ensure_future(self._handle(task))
+            self._running.add(t)
+            t.add_done_callback(self._done)
+        await self._drain()
+
+    async def _drain(self) -> None:
+        if not self._running:
+            return
+        logger.info("Worker %s stopping: waiting for %d groups", self.worker_id, len(self._running))
+        _, pending = await asyncio.wait(set(self._running), timeout=self.drain_timeout)
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _handle(self, task: Dict[str, Any]) -> None:
+        batch_id, product_no = task["batch_id"], task["product_no"]
+        if task["attempts"] > self.queue.max_attempts:
+            # claimed again and again: the workers running it keep dying (e.g. out of memory)
+            logger.error("Group %s of batch %s abandoned after %d attempts", product_no, batch_id, task["attempts"] - 1)
+            await self._io(
+                self.pipeline.job_store.set_group_status,
+                batch_id, product_no, "failed", error=f"worker died {task['attempts'] - 1} times",
+            )
+            await self._io(self.queue.complete, task["id"])
+            self._stats["abandoned"] += 1
+            await self._io(self.pipeline.finish_job, batch_id)
+            return
+
+        group = asyncio.ensure_future(self.pipeline.process_group(batch_id, product_no))
+        heartbeat = asyncio.ensure_future(self._heartbeat(task, group))
+        t0 = time.perf_counter()
+        try:
+            await group
+        except asyncio.CancelledError:
+            if heartbeat.done() and not heartbeat.cancelled() and heartbeat.result():
+                # the lease went to another worker, which runs the group now: leave the task and the job to it
+                return
+            # shutting down mid-group: another worker starts it over right away
+            await self._io(self.queue.release, task["id"])
+            self._stats["released"] += 1
+            raise
+        finally:
+            heartbeat.cancel()
+        await self._io(self.queue.complete, task["id"])
+        self._stats["completed"] += 1
+        logger.info("Worker %s: group %s of batch %s in %.2f s", self.worker_id, product_no, batch_id, time.perf_counter() - t0)
+        await self._io(self.pipeline.finish_job, batch_id)
+
+    async def _heartbeat(self, task: Dict[str, Any], group: asyncio.Future) -> bool:
+        """Keep the lease alive while `group` runs; True (and `group` cancelled) if the lease was lost."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await self._io(self.queue.extend, task["id"], self.worker_id, self.lease):
+                # we stalled past the lease and another worker claimed the task: running on would
+                # pay for the same OCR twice and race its job store writes
+                self._stats["lost_leases"] += 1
+                logger.warning(
+                    "Worker %s lost the lease on group %s of batch %s; stopping it",
+                    self.worker_id, task["product_no"], task["batch_id"],
+                )
+                group.cancel()
+                return True
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self._stats)
+        out.update(worker_id=self.worker_id, running=len(self._running))
+        return out
+
+
+def register_metrics(worker: Worker) -> None:
+    metrics.registry.gauge("ocr_worker_running_groups", "Groups this worker is running.", lambda: len(worker._running))
+    metrics.registry.labelled(
+        "ocr_worker_tasks_total", "Tasks claimed, completed, abandoned and released, and leases lost.", "outcome",
+        lambda: {k: v for k, v in worker.stats().items() if k in ("claimed", "completed", "abandoned", "released", "lost_leases")},
+        kind="counter",
+    )
+
+
+async def serve(worker: Worker) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    warmup = worker.pipeline.make_warmup()
+    warmup.start()
+    try:
+        await worker.run()
+    finally:
+        await warmup.stop()
+        await worker.pipeline.supabase_writer.aclose()
+        worker.pipeline.pipeline_executor.shutdown()
+        logger.info("Worker %s stopped: %s", worker.worker_id, worker.stats())
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from dotenv import load_dotenv
+
+    # before the modules below read their settings from the environment
+    load_dotenv()
+    from pipeline import check_queue_setup
+    from work_queue import work_queue
+
+    if work_queue is None:
+        raise SystemExit("OCR_WORK_QUEUE is 'inline': the API runs groups itself, there is nothing for a worker to do")
+    check_queue_setup()
+    worker = Worker(
+        work_queue,
+        concurrency=int(os.getenv("OCR_WORKER_CONCURRENCY", os.getenv("OCR_MAX_CONCURRENT_GROUPS", "2"))),
+        lease=float(os.getenv("OCR_WORKER_LEASE", "120")),
+        poll_interval=float(os.getenv("OCR_WORKER_POLL", "0.5")),
+        drain_timeout=float(os.getenv("OCR_WORKER_DRAIN", "60")),
+    )
+    register_metrics(worker)
+    port = os.getenv("OCR_WORKER_METRICS_PORT", "").strip()
+    if port:
+        metrics.serve_http(int(port))
+    asyncio.run(serve(worker))
+
+
+if __name__ == "__main__":
+    main()
@@ -144,13 +144,9 @@ export default function ProductsPage() {
     }
   }
 
-  // CSV export
-  function exportCsv(currentRows: Product[]) {
-    if (!currentRows || currentRows.length === 0) {
-      alert("No data to export");
-      return;
-    }
-
+  // CSV export: streamed by the backend page by page, so the browser never
+  // has to hold the whole table
+  function exportCsv(batchId?: string) {
     const headers = [
       "id",
       "batch_id",
@@ -168,29 +164,18 @@ export default function ProductsPage() {
       "created_at",
     ];
 
-    const lines: string[] = [];
-    lines.push(headers.join(",")); // header
-
-    for (const r of currentRows) {
-      const line = headers
-        .map((h) => {
-          const v = (r as any)[h];
-          const safe = v === null || v === undefined ? "" : String(v);
-          const s = safe.replace(/"/g, '""');
-          return `"${s}"`;
-        })
-        .join(",");
-      lines.push(line);
+    const params = new URLSearchParams({
+      format: "csv",
+      columns: headers.join(","),
+    });
+    if (batchId && batchId.trim() !== "") {
+      params.set("batch_id", batchId.trim());
     }
 
-    const csv = lines.join("\n");
-    const blob = new Blob([csv], { type: "text/csv;charset=utf-8;" });
-    const url = URL.createObjectURL(blob);
     const a = document.createElement("a");
-    a.href = url;
+    a.href = `${backendUrl}/products?${params.toString()}`;
     a.download = "products.csv";
     a.click();
-    URL.revokeObjectURL(url);
   }
 
   // for debugging: watch items and rows updates
@@ -271,7 +256,7 @@ export default function ProductsPage() {
             Clear
           </button>
           <button
-            onClick={() => exportCsv(rows)}
+            onClick={() => exportCsv(batch)}
             style={{
               background: "#2563eb",
               color: "#fff",
@@ -53,6 +53,7 @@ export default function UploadPage() {
         }
         const j = await r.json();
         if (j.status === "done") return j;
+        if (j.status === "failed") return j;
         await new Promise((res) => setTimeout(res, intervalMs));
       } catch (err) {
         console.error("poll error", err);
@@ -62,6 +63,46 @@ export default function UploadPage() {
     throw new Error("Job timed out");
   }
 
+  // Follow a job over server-sent events (/ocr-job/{id}/events): a snapshot,
+  // one small event per finished group, then "done". Falls back to polling if
+  // EventSource is unavailable or the stream breaks before the job finishes.
+  function watchJob(job: string, timeoutMs = 600000): Promise<any> {
+    if (typeof EventSource === "undefined") return pollJob(job, timeoutMs, 1200);
+
+    return new Promise((resolve, reject) => {
+      const results = new Map<number, any>();
+      const es = new EventSource(`${backendUrl}/ocr-job/${job}/events`);
+      let settled = false;
+
+      const finish = (fn: () => void) => {
+        if (settled) return;
+        settled = true;
+        clearTimeout(timer);
+        es.close();
+        fn();
+      };
+      const timer = setTimeout(() => finish(() => reject(new Error("Job timed out"))), timeoutMs);
+
+      es.addEventListener("snapshot", (e) => {
+        const j = JSON.parse((e as MessageEvent).data);
+        for (const r of j.results ?? []) results.set(r.product_no, r);
+      });
+      es.addEventListener("group", (e) => {
+        const g = JSON.parse((e as MessageEvent).data);
+        if (g.result) results.set(g.product_no, g.result);
+      });
+      es.addEventListener("done", (e) => {
+        const d = JSON.parse((e as MessageEvent).data);
+        const sorted = Array.from(results.values()).sort((a, b) => a.product_no - b.product_no);
+        finish(() => resolve({ ...d, results: sorted }));
+      });
+      es.onerror = () => {
+        console.warn("job event stream failed, falling back to polling");
+        finish(() => pollJob(job, timeoutMs, 1200).then(resolve, reject));
+      };
+    });
+  }
+
   const handleSubmit = async () => {
     if (!files || files.length === 0) {
       setError("Please select images");
@@ -74,7 +115,7 @@ export default function UploadPage() {
     try {
       const fd = new FormData();
       Array.from(files).forEach((f) => fd.append("files", f));
-      const resp = await fetch(`${backendUrl}/ocr-bulk`, { method: "POST", body: fd });
+      const resp = await fetch(`${backendUrl}/ocr-bulk/stream`, { method: "POST", body: fd });
       const text = await resp.text();
       let json: any;
       try {
@@ -89,7 +130,8 @@ export default function UploadPage() {
 
       let finalResults = json.results;
       if (!finalResults && id) {
-        const jobData = await pollJob(id, 120000, 1200);
+        const jobData = await watchJob(id, 600000);
+        if (jobData.status === "failed") throw new Error(jobData.error || "OCR job failed");
         finalResults = jobData.results;
       }
 